@@ -0,0 +1 @@
+"Actions of the isis package"
@@ -0,0 +1,33 @@
+from typing import Any
+
+import ncs
+from ncs.dp import Action
+
+
+class IsisAggregateDisable(Action):
+    """Leaves the device-level mode: removes the aggregate service and
+    re-deploys every entry of the device in the same commit"""
+
+    @Action.action  # type: ignore
+    def cb_action(
+        self,
+        uinfo: Any,
+        name: str,
+        kp: Any,
+        input: ncs.maagic.Node,
+        output: ncs.maagic.Node,
+        trans: Any,
+    ) -> None:
+        with ncs.maapi.single_write_trans(uinfo.username, "system") as write_trans:
+            isis = ncs.maagic.get_node(write_trans, str(kp))._parent
+            entries = [entry for kind in ("instance", "interface") for entry in getattr(isis, kind)]
+            for entry in entries:
+                # a touched entry renders again, its config replaces the aggregate one
+                write_trans.touch(str(entry._path))
+            isis.aggregate.delete()
+            params = write_trans.get_params()
+            params.label(f"isis-disaggregate-{isis.device}")
+            write_trans.apply_params(True, params)
+
+        output.re_deployed = len(entries)
+        self.log.info(f"isis device {isis.device}: aggregate removed, {len(entries)} entries re-deployed")
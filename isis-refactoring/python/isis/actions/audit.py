@@ -0,0 +1,63 @@
+import contextlib
+from typing import Any, Iterator, Optional, TextIO
+
+import ncs
+from ncs.dp import Action
+
+from ..audit import DeviceAudit, Report, ServiceAudit
+from .scheduler import Progress, Scheduler, fill_result
+from .selection import ServiceFilter, ServiceRef
+
+# services audited per read transaction (the device config is read once per batch)
+AUDIT_BATCH = 1000
+
+
+class IsisFleetAudit(Action):
+    """Compares the rendered intent of the isis services with the device configs"""
+
+    @Action.action  # type: ignore
+    def cb_action(
+        self,
+        uinfo: Any,
+        name: str,
+        kp: Any,
+        input: ncs.maagic.Node,
+        output: ncs.maagic.Node,
+        trans: Any,
+    ) -> None:
+        services = list(ServiceFilter.from_input(input).select(ncs.maagic.get_root(trans)))
+        stream: Optional[TextIO] = open(str(input.report), "w") if input.report else None
+        report = Report(stream)
+
+        @contextlib.contextmanager
+        def open_batch() -> Iterator[DeviceAudit]:
+            with ncs.maapi.single_read_trans(uinfo.username, "system") as read_trans:
+                yield DeviceAudit(read_trans, ncs.maagic.get_root(read_trans))
+
+        def audit(device_audit: DeviceAudit, service: ServiceRef) -> str:
+            node = ncs.maagic.get_node(device_audit.trans, service.keypath)
+            try:
+                drift = device_audit.service(service.kind, service.device, node)
+            except Exception as err:
+                report.write(ServiceAudit(service.keypath, service.device, [], str(err) or type(err).__name__))
+                raise
+            report.write(ServiceAudit(service.keypath, service.device, drift))
+            return str(len(drift))
+
+        progress = Progress(self.log, uinfo)
+        scheduler = Scheduler(int(input.concurrency), AUDIT_BATCH, progress)
+        try:
+            outcomes = scheduler.run(services, open_batch, audit)
+        finally:
+            progress.close()
+            if stream is not None:
+                stream.close()
+
+        fill_result(output, outcomes)
+        drifted = [outcome for outcome in outcomes if outcome.ok and outcome.detail != "0"]
+        output.compliant = sum(outcome.ok for outcome in outcomes) - len(drifted)
+        output.drifted = len(drifted)
+        for outcome in drifted:
+            entry = output.drift.create()
+            entry.service = outcome.service.keypath
+            entry.leaves = int(outcome.detail)
@@ -0,0 +1,25 @@
+from typing import Any
+
+import ncs
+from ncs.dp import Action
+
+from .. import effective
+from .selection import ServiceFilter
+
+
+class IsisEffectiveRefresh(Action):
+    """Recomputes the effective view of the services matching a filter"""
+
+    @Action.action  # type: ignore
+    def cb_action(
+        self,
+        uinfo: Any,
+        name: str,
+        kp: Any,
+        input: ncs.maagic.Node,
+        output: ncs.maagic.Node,
+        trans: Any,
+    ) -> None:
+        services = list(ServiceFilter.from_input(input).select(ncs.maagic.get_root(trans)))
+        output.refreshed = effective.refresh(uinfo.username, services)
+        self.log.info(f"isis effective views: {output.refreshed} of {len(services)} service(s) refreshed")
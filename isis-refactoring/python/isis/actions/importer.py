@@ -0,0 +1,185 @@
+"Brownfield import: existing device ISIS config into isis services"
+
+import fnmatch
+from typing import Any, Iterator, Optional
+
+import ncs
+from ncs.dp import Action
+
+from .. import brownfield
+from ..device_config import read_device_config
+from .scheduler import Progress
+from .selection import ServiceRef, ned_type
+
+STATUS_PATH = "/rfs:rfs/bytel-isis:isis-fleet/import-status"
+
+
+def set_leaves(node: Any, leaves: dict[str, Any]) -> None:
+    for name, value in leaves.items():
+        attr = name.replace("-", "_")
+        if value is True:
+            getattr(node, attr).create()
+        elif isinstance(value, dict):
+            container = getattr(node, attr)
+            if hasattr(container, "create"):
+                container.create()
+            set_leaves(container, value)
+        else:
+            setattr(node, attr, value)
+
+
+def _devices(root: ncs.maagic.Root, pattern: Optional[str], ned: Optional[str], after: Optional[str]) -> Iterator[tuple[str, str]]:
+    '''(device, ned) of the devices to import, in name order'''
+
+    for device in root.devices.device:
+        name = str(device.name)
+        if after is not None and name <= after:
+            continue
+        if pattern and not fnmatch.fnmatchcase(name, pattern):
+            continue
+        device_ned = ned_type(device)
+        if device_ned is None or (ned and device_ned != ned):
+            continue
+        yield name, device_ned
+
+
+class ImportStatus:
+    '''Resumable checkpoint of the import, kept in operational data'''
+
+    def __init__(self, username: str) -> None:
+        self.username = username
+        self.last_device: Optional[str] = None
+        self.devices = self.instances = self.interfaces = self.existing = self.failed = 0
+
+    def load(self) -> None:
+        with ncs.maapi.single_read_trans(self.username, "system", db=ncs.OPERATIONAL) as trans:
+            status = ncs.maagic.get_node(trans, STATUS_PATH)
+            self.last_device = status.last_device
+            self.devices = int(status.devices or 0)
+            self.instances = int(status.instances or 0)
+            self.interfaces = int(status.interfaces or 0)
+            self.existing = int(status.existing or 0)
+            self.failed = int(status.failed or 0)
+
+    def save(self, finished: bool) -> None:
+        with ncs.maapi.single_write_trans(self.username, "system", db=ncs.OPERATIONAL) as trans:
+            status = ncs.maagic.get_node(trans, STATUS_PATH)
+            status.last_device = self.last_device
+            status.devices = self.devices
+            status.instances = self.instances
+            status.interfaces = self.interfaces
+            status.existing = self.existing
+            status.failed = self.failed
+            status.finished = finished
+            trans.apply()
+
+
+class IsisFleetImport(Action):
+    """Creates isis services from the ISIS config found on the devices"""
+
+    def _import_device(self, trans: ncs.maapi.Transaction, device: str, ned: str, status: ImportStatus) -> list[ServiceRef]:
+        # discovered before anything is written: a failing device leaves no half import
+        discovered = brownfield.discover(ned, read_device_config(trans, device))
+        if not discovered:
+            return []
+        devices = ncs.maagic.get_root(trans).rfs.isis
+        new_device = device not in devices
+        isis = devices.create(device)
+        created: list[ServiceRef] = []
+        existing = 0
+        try:
+            # instances first, interfaces refer to them
+            for found in sorted(discovered, key=lambda found: found.kind != "instance"):
+                services = getattr(isis, found.kind)
+                if found.key in services:
+                    existing += 1
+                    continue
+                entry = services.create(found.key)
+                created.append(ServiceRef(found.kind, device, found.key))
+                set_leaves(entry, found.leaves)
+        except Exception:
+            # the chunk is committed without this device: remove what it wrote
+            for service in reversed(created):
+                del getattr(isis, service.kind)[service.key]
+            if new_device:
+                del devices[device]
+            raise
+        status.existing += existing
+        return created
+
+    def _reconcile(self, username: str, created: list[ServiceRef]) -> None:
+        with ncs.maapi.single_write_trans(username, "system") as trans:
+            for service in created:
+                node = ncs.maagic.get_node(trans, service.keypath)
+                inp = node.re_deploy.get_input()
+                inp.reconcile.create()
+                node.re_deploy(inp)
+
+    @Action.action  # type: ignore
+    def cb_action(
+        self,
+        uinfo: Any,
+        name: str,
+        kp: Any,
+        input: ncs.maagic.Node,
+        output: ncs.maagic.Node,
+        trans: Any,
+    ) -> None:
+        status = ImportStatus(uinfo.username)
+        if input.resume:
+            status.load()
+        pattern = None if input.device is None else str(input.device)
+        ned = None if input.ned_type is None else str(input.ned_type)
+        devices = list(_devices(ncs.maagic.get_root(trans), pattern, ned, status.last_device))
+        chunk_size = int(input.chunk_size)
+
+        progress = Progress(self.log, uinfo)
+        progress(f"{len(devices)} devices to import")
+        try:
+            for start in range(0, len(devices), chunk_size):
+                chunk = devices[start:start + chunk_size]
+                created: list[ServiceRef] = []
+                try:
+                    with ncs.maapi.single_write_trans(uinfo.username, "system") as write_trans:
+                        for device, device_ned in chunk:
+                            try:
+                                created += self._import_device(write_trans, device, device_ned, status)
+                            except Exception as err:
+                                self.log.error(f"isis import of {device} failed: {err}")
+                                status.failed += 1
+                                failure = output.failure.create()
+                                failure.device = device
+                                failure.error = str(err) or type(err).__name__
+                        params = write_trans.get_params()
+                        if input.no_networking:
+                            params.no_networking()
+                        write_trans.apply_params(True, params)
+                    if input.reconcile and created:
+                        self._reconcile(uinfo.username, created)
+                except Exception as err:
+                    self.log.error(f"isis import of {chunk[0][0]}..{chunk[-1][0]} failed: {err}")
+                    status.failed += len(chunk)
+                    for device, _ in chunk:
+                        failure = output.failure.create()
+                        failure.device = device
+                        failure.error = f"chunk failed: {err}"
+                    created = []
+
+                status.devices += len(chunk)
+                status.instances += sum(service.kind == "instance" for service in created)
+                status.interfaces += sum(service.kind == "interface" for service in created)
+                status.last_device = chunk[-1][0]
+                status.save(finished=False)
+                progress(
+                    f"{status.devices} devices imported (last {status.last_device}),"
+                    f" {status.instances} instances, {status.interfaces} interfaces"
+                )
+            status.save(finished=True)
+        finally:
+            progress.close()
+
+        output.devices = status.devices
+        output.instances = status.instances
+        output.interfaces = status.interfaces
+        output.existing = status.existing
+        output.failed = status.failed
@@ -0,0 +1,89 @@
+"Rotation of the isis hello password over the interfaces matching a filter"
+
+import time
+from typing import Any, Optional
+
+import ncs
+from ncs.dp import Action
+
+from .. import utils
+from .scheduler import Progress
+from .selection import ServiceFilter, ServiceRef, ned_type
+
+
+def _tag(service: Any) -> Optional[str]:
+    '''isis instance of an interface: only the service sets it, the
+    interface inventory has no isis-instance-id'''
+
+    return str(service.isis_instance_id) if service.isis_instance_id else None
+
+
+class IsisPasswdRotation(Action):
+    """Sets a new hello password on the isis interfaces matching a filter,
+    one commit (and rollback point) per chunk"""
+
+    def _rotate_chunk(self, trans: ncs.maapi.Transaction, chunk: list[ServiceRef], secret: str) -> tuple[int, int]:
+        '''(interfaces changed, IOS-XR hashes encoded) in one write transaction'''
+
+        root = ncs.maagic.get_root(trans)
+        changed = 0
+        iosxr = []
+        for ref in chunk:
+            service = getattr(root.rfs.isis[ref.device], ref.kind)[ref.key]
+            if service.passwd == secret:
+                continue
+            service.passwd = secret
+            changed += 1
+            if ned_type(root.devices.device[ref.device]) == "cisco-iosxr-cli":
+                tag = _tag(service)
+                if tag is not None:
+                    iosxr.append((ref.device, str(service.name), tag))
+        return changed, utils.seed_isis_passwords(root, secret, iosxr)
+
+    @Action.action  # type: ignore
+    def cb_action(
+        self,
+        uinfo: Any,
+        name: str,
+        kp: Any,
+        input: ncs.maagic.Node,
+        output: ncs.maagic.Node,
+        trans: Any,
+    ) -> None:
+        selection = ServiceFilter.from_input(input)
+        selection.service_type = "interface"
+        services = list(selection.select(ncs.maagic.get_root(trans)))
+        secret = str(input.passwd)
+        chunk_size = int(input.chunk_size)
+        chunks = [services[start:start + chunk_size] for start in range(0, len(services), chunk_size)]
+        run = time.strftime("%Y%m%dT%H%M%S")
+
+        output.selected = len(services)
+        output.succeeded = output.failed = 0
+        progress = Progress(self.log, uinfo)
+        progress(f"password rotation {run}: {len(services)} interfaces in {len(chunks)} chunk(s)")
+        try:
+            for number, chunk in enumerate(chunks, 1):
+                label = f"isis-passwd-{run}-{number}"
+                entry = output.chunk.create(number)
+                entry.label = label
+                entry.first = chunk[0].keypath
+                entry.last = chunk[-1].keypath
+                try:
+                    with ncs.maapi.single_write_trans(uinfo.username, "system") as write_trans:
+                        changed, encoded = self._rotate_chunk(write_trans, chunk, secret)
+                        params = write_trans.get_params()
+                        params.label(label)
+                        params.comment(f"isis hello password rotation {run}, chunk {number}/{len(chunks)}")
+                        write_trans.apply_params(True, params)
+                except Exception as err:
+                    # the previous chunks stay committed, each one is a rollback point
+                    entry.error = str(err) or type(err).__name__
+                    output.failed = sum(len(rest) for rest in chunks[number - 1:])
+                    progress(f"chunk {number}/{len(chunks)} failed, rotation stopped: {entry.error}")
+                    break
+                entry.changed = changed
+                output.succeeded += len(chunk)
+                progress(f"chunk {number}/{len(chunks)} committed ({label}): {changed} changed, {encoded} IOS-XR hashes")
+        finally:
+            progress.close()
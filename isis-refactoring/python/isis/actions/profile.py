@@ -0,0 +1,32 @@
+from typing import Any, Optional
+
+import ncs
+from ncs.dp import Action
+
+from ..profiling import capture
+
+
+class IsisProfileCapture(Action):
+    """Arms (count 0: disarms) the cProfile capture of the next isis creates"""
+
+    @Action.action  # type: ignore
+    def cb_action(
+        self,
+        uinfo: Any,
+        name: str,
+        kp: Any,
+        input: ncs.maagic.Node,
+        output: ncs.maagic.Node,
+        trans: Any,
+    ) -> None:
+        def leaf(name: str) -> Optional[str]:
+            value = getattr(input, name, None)
+            return None if value is None else str(value)
+
+        count = int(input.count)
+        capture.arm(count, leaf("device"), leaf("ned_type"), leaf("directory"), int(input.top))
+        if count:
+            output.result = f"profiling the next {count} isis creates into {capture.directory}"
+        else:
+            output.result = "profiling disarmed"
+        self.log.info(f"isis {output.result}")
@@ -0,0 +1,299 @@
+"Bulk provisioning of isis services from a stream of NDJSON specs"
+
+import io
+import json
+import time
+from itertools import groupby
+from typing import Any, Iterable, Iterator, NamedTuple, Optional, TextIO
+
+import ncs
+from ncs.dp import Action
+
+from .. import push
+from ..audit import AuditContext
+from ..validation import InputCheck
+from .importer import set_leaves
+from .scheduler import Progress
+from .selection import ServiceRef
+
+STATUS_PATH = "/rfs:rfs/bytel-isis:isis-fleet/provision-status"
+
+KINDS = ("instance", "interface")
+
+
+class Spec(NamedTuple):
+    '''One line of the stream: {"device", "kind", "key", "leaves"}
+
+    Leaves use the yang names, containers are nested dicts and empty
+    leaves / presence containers without leaves are true (as the import).
+    '''
+
+    line: int
+    device: str
+    kind: str
+    key: str
+    leaves: dict[str, Any]
+
+    @property
+    def ref(self) -> ServiceRef:
+        return ServiceRef(self.kind, self.device, self.key)
+
+
+class Result(NamedTuple):
+    line: int
+    keypath: Optional[str]
+    result: str  # "ok", "invalid" or "failed"
+    error: Optional[str] = None
+
+
+def parse(line: int, text: str) -> Spec:
+    try:
+        spec = json.loads(text)
+    except json.JSONDecodeError as err:
+        # its own "line 1" would be the line of the spec, not of the stream
+        raise ValueError(f"{err.msg} at column {err.colno}") from None
+    if not isinstance(spec, dict):
+        raise ValueError("a spec is a JSON object")
+    device, kind, key = spec.get("device"), spec.get("kind"), spec.get("key")
+    leaves = spec.get("leaves", {})
+    if kind not in KINDS:
+        raise ValueError(f"kind must be one of {', '.join(KINDS)}")
+    if not isinstance(device, str) or not device or not isinstance(key, (str, int)) or key == "":
+        raise ValueError("device and key are mandatory")
+    if not isinstance(leaves, dict):
+        raise ValueError("leaves must be a JSON object")
+    return Spec(line, device, kind, str(key), leaves)
+
+
+def read_specs(stream: TextIO, after: int = 0) -> Iterator[Any]:
+    '''Spec, or Result of an unreadable line, per non blank line after `after`'''
+
+    for line, text in enumerate(stream, 1):
+        if line <= after or not text.strip():
+            continue
+        try:
+            yield parse(line, text)
+        except ValueError as err:
+            yield Result(line, None, "invalid", str(err))
+
+
+def chunked(items: Iterable[Any], size: int) -> Iterator[list[Any]]:
+    '''Lists of `size` items, only one of them in memory at a time'''
+
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def by_device(specs: list[Spec]) -> list[Spec]:
+    '''Specs grouped by device, instances first (interfaces refer to them)'''
+
+    return sorted(specs, key=lambda spec: (spec.device, spec.kind != "instance", spec.line))
+
+
+class ProvisionStatus:
+    '''Resumable checkpoint of the provisioning, kept in operational data'''
+
+    def __init__(self, username: str, source: str) -> None:
+        self.username = username
+        self.source = source
+        self.line = 0
+        self.items = self.succeeded = self.invalid = self.failed = 0
+
+    def load(self) -> None:
+        with ncs.maapi.single_read_trans(self.username, "system", db=ncs.OPERATIONAL) as trans:
+            status = ncs.maagic.get_node(trans, STATUS_PATH)
+            if status.source != self.source:
+                raise ValueError(f"nothing to resume for {self.source} (last run: {status.source})")
+            self.line = int(status.line or 0)
+            self.items = int(status.items or 0)
+            self.succeeded = int(status.succeeded or 0)
+            self.invalid = int(status.invalid or 0)
+            self.failed = int(status.failed or 0)
+
+    def save(self, finished: bool) -> None:
+        with ncs.maapi.single_write_trans(self.username, "system", db=ncs.OPERATIONAL) as trans:
+            status = ncs.maagic.get_node(trans, STATUS_PATH)
+            status.source = self.source
+            status.line = self.line
+            status.items = self.items
+            status.succeeded = self.succeeded
+            status.invalid = self.invalid
+            status.failed = self.failed
+            status.finished = finished
+            trans.apply()
+
+    def count(self, results: list[Result]) -> None:
+        self.items += len(results)
+        self.succeeded += sum(result.result == "ok" for result in results)
+        self.invalid += sum(result.result == "invalid" for result in results)
+        self.failed += sum(result.result == "failed" for result in results)
+
+
+def write_specs(root: ncs.maagic.Root, specs: list[Spec]) -> list[tuple[Spec, Optional[str]]]:
+    '''(spec, error setting its leaves) of each spec, written in the transaction'''
+
+    written = []
+    for spec in specs:
+        try:
+            if spec.device not in root.devices.device:
+                raise ValueError(f"unknown device {spec.device}")
+            services = getattr(root.rfs.isis.create(spec.device), spec.kind)
+            set_leaves(services.create(spec.key), spec.leaves)
+            written.append((spec, None))
+        except Exception as err:
+            written.append((spec, str(err) or type(err).__name__))
+    return written
+
+
+def check_specs(tctx: Any, root: ncs.maagic.Root, specs: list[Spec]) -> dict[int, str]:
+    '''{line: problem} of the specs, written in the transaction of `root`
+
+    The specs are written together, so an interface is checked against
+    the instance of the same chunk. A service written by several lines
+    is checked once and its problems go to each of them.
+    '''
+
+    problems: dict[int, str] = {}
+    lines: dict[ServiceRef, list[int]] = {}
+    for spec, error in write_specs(root, specs):
+        if error is not None:
+            problems[spec.line] = error
+        else:
+            lines.setdefault(spec.ref, []).append(spec.line)
+    services = [(ref, getattr(root.rfs.isis[ref.device], ref.kind)[ref.key]) for ref in lines]
+    for ref, problem in InputCheck().report(tctx, root, services):
+        for line in lines[ref]:
+            problems[line] = "; ".join(filter(None, (problems.get(line), problem)))
+    return problems
+
+
+class IsisFleetProvision(Action):
+    """Creates or updates isis services from NDJSON specs, validated
+    beforehand and committed chunk by chunk"""
+
+    def _check(self, username: str, specs: list[Spec]) -> dict[int, str]:
+        '''{line: problem} of the specs, found in a transaction never applied'''
+
+        with ncs.maapi.single_write_trans(username, "system") as trans:
+            return check_specs(AuditContext(trans.th), ncs.maagic.get_root(trans), specs)
+
+    def _queue_chunk(self, username: str, specs: list[Spec], label: str, options: push.PushOptions) -> list[Result]:
+        '''One commit queue item per device of the chunk, followed under isis-push'''
+
+        results = []
+        for device, group in groupby(specs, key=lambda spec: spec.device):
+            group = list(group)
+
+            def write(trans: ncs.maapi.Transaction, group: list[Spec] = group) -> None:
+                write_specs(ncs.maagic.get_root(trans), group)
+
+            try:
+                push.push_device(username, device, [spec.ref for spec in group], options, label, write=write, label=label)
+            except Exception as err:
+                error = f"device commit failed: {str(err) or type(err).__name__}"
+                results += [Result(spec.line, spec.ref.keypath, "failed", error) for spec in group]
+            else:
+                results += [Result(spec.line, spec.ref.keypath, "ok") for spec in group]
+        return results
+
+    def _provision_chunk(
+        self,
+        username: str,
+        specs: list[Spec],
+        label: str,
+        no_networking: bool,
+        options: push.PushOptions,
+    ) -> list[Result]:
+        problems = self._check(username, specs)
+        valid = [spec for spec in specs if spec.line not in problems]
+        results = [
+            Result(spec.line, spec.ref.keypath, "invalid", problems[spec.line])
+            for spec in specs if spec.line in problems
+        ]
+        if not valid:
+            return results
+        if options.asynchronous and not no_networking:
+            return results + self._queue_chunk(username, valid, label, options)
+        try:
+            with ncs.maapi.single_write_trans(username, "system") as trans:
+                write_specs(ncs.maagic.get_root(trans), valid)
+                params = trans.get_params()
+                params.label(label)
+                if no_networking:
+                    params.no_networking()
+                trans.apply_params(True, params)
+        except Exception as err:
+            error = f"chunk failed: {str(err) or type(err).__name__}"
+            return results + [Result(spec.line, spec.ref.keypath, "failed", error) for spec in valid]
+        return results + [Result(spec.line, spec.ref.keypath, "ok") for spec in valid]
+
+    @Action.action  # type: ignore
+    def cb_action(
+        self,
+        uinfo: Any,
+        name: str,
+        kp: Any,
+        input: ncs.maagic.Node,
+        output: ncs.maagic.Node,
+        trans: Any,
+    ) -> None:
+        if (input.file is None) == (input.specs is None):
+            raise ValueError("one of file or specs is needed")
+        source = "specs" if input.file is None else str(input.file)
+        status = ProvisionStatus(uinfo.username, source)
+        if input.resume:
+            status.load()
+        chunk_size = int(input.chunk_size)
+        options = push.PushOptions.from_input(ncs.maagic.get_root(trans), input)
+        run = time.strftime("%Y%m%dT%H%M%S")
+
+        stream = io.StringIO(str(input.specs)) if input.file is None else open(source, encoding="utf-8")
+        report = None if input.report is None else open(str(input.report), "a", encoding="utf-8")
+        progress = Progress(self.log, uinfo)
+        progress(f"isis provisioning {run} from {source}" + (f", after line {status.line}" if status.line else ""))
+        try:
+            for number, chunk in enumerate(chunked(read_specs(stream, status.line), chunk_size), 1):
+                specs = by_device([item for item in chunk if isinstance(item, Spec)])
+                results = [item for item in chunk if isinstance(item, Result)]
+                if specs:
+                    results += self._provision_chunk(
+                        uinfo.username, specs, f"isis-provision-{run}-{number}", bool(input.no_networking), options
+                    )
+                results.sort()
+
+                for result in results:
+                    if report is not None:
+                        report.write(json.dumps(result._asdict(), separators=(",", ":")) + "\n")
+                    if result.result != "ok":
+                        failure = output.failure.create()
+                        failure.line = result.line
+                        failure.keypath = result.keypath
+                        failure.result = result.result
+                        failure.error = result.error
+                if report is not None:
+                    report.flush()
+
+                status.count(results)
+                status.line = max(item.line for item in chunk)
+                status.save(finished=False)
+                progress(
+                    f"chunk {number}: up to line {status.line}, {status.succeeded} ok,"
+                    f" {status.invalid} invalid, {status.failed} failed"
+                )
+            status.save(finished=True)
+        finally:
+            progress.close()
+            stream.close()
+            if report is not None:
+                report.close()
+
+        output.items = status.items
+        output.succeeded = status.succeeded
+        output.invalid = status.invalid
+        output.failed = status.failed
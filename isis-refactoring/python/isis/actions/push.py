@@ -0,0 +1,25 @@
+from typing import Any
+
+import ncs
+from ncs.dp import Action
+
+from ..push import pushes
+
+
+class IsisPushPurge(Action):
+    """Removes the finished isis push items older than a number of days"""
+
+    @Action.action  # type: ignore
+    def cb_action(
+        self,
+        uinfo: Any,
+        name: str,
+        kp: Any,
+        input: ncs.maagic.Node,
+        output: ncs.maagic.Node,
+        trans: Any,
+    ) -> None:
+        days = input.older_than
+        if days is None:
+            days = ncs.maagic.get_root(trans).rfs.isis_fleet.push.retention
+        output.purged = pushes.purge(int(days))
@@ -0,0 +1,95 @@
+import contextlib
+import time
+from typing import Any, Iterator, Optional
+
+import ncs
+from ncs.dp import Action
+
+from .. import push
+from .scheduler import Progress, Scheduler, fill_result
+from .selection import ServiceFilter, ServiceRef
+
+
+def redeploy(trans: ncs.maapi.Transaction, service: ServiceRef, dry_run: bool) -> str:
+    '''Re-deploy one service, return the dry-run diff if requested'''
+
+    node = ncs.maagic.get_node(trans, service.keypath)
+    inp = node.re_deploy.get_input()
+    if dry_run:
+        inp.dry_run.create()
+    out = node.re_deploy(inp)
+    if dry_run and out.cli is not None:
+        return str(out.cli.local_node.data or "")
+    return ""
+
+
+def touch(trans: ncs.maapi.Transaction, service: ServiceRef) -> str:
+    '''Mark one service for re-deploy by the commit of its batch'''
+
+    trans.touch(service.keypath)
+    return ""
+
+
+@contextlib.contextmanager
+def redeploy_batch(username: str, label: Optional[str] = None) -> Iterator[ncs.maapi.Transaction]:
+    '''Write transaction of one batch: the services touched in it are
+    re-deployed together by a single commit on exit'''
+
+    with ncs.maapi.single_write_trans(username, "system") as trans:
+        yield trans
+        params = trans.get_params()
+        if label is not None:
+            params.label(label)
+        trans.apply_params(True, params)
+
+
+class IsisFleetRedeploy(Action):
+    """Re-deploys (or dry-runs) the isis services matching a filter"""
+
+    @Action.action  # type: ignore
+    def cb_action(
+        self,
+        uinfo: Any,
+        name: str,
+        kp: Any,
+        input: ncs.maagic.Node,
+        output: ncs.maagic.Node,
+        trans: Any,
+    ) -> None:
+        root = ncs.maagic.get_root(trans)
+        services = list(ServiceFilter.from_input(input).select(root))
+        dry_run = bool(input.dry_run)
+        options = push.PushOptions.from_input(root, input)
+
+        if options.asynchronous and not dry_run:
+            tag = f"isis-redeploy-{time.strftime('%Y%m%dT%H%M%S')}"
+            outcomes = push.push_services(
+                uinfo.username, services, options, tag, int(input.concurrency), int(input.batch_size)
+            )
+            self.log.info(f"{tag}: {len(services)} services queued, progress under /rfs/isis-push")
+            fill_result(output, outcomes)
+            return
+
+        progress = Progress(self.log, uinfo)
+        scheduler = Scheduler(int(input.concurrency), int(input.batch_size), progress)
+        try:
+            if dry_run:
+                # one diff per service: each one is dry-run on its own
+                outcomes = scheduler.run(
+                    services,
+                    lambda: ncs.maapi.single_read_trans(uinfo.username, "system"),
+                    lambda batch_trans, service: redeploy(batch_trans, service, True),
+                )
+            else:
+                label = f"isis-redeploy-{time.strftime('%Y%m%dT%H%M%S')}"
+                outcomes = scheduler.run(services, lambda: redeploy_batch(uinfo.username, label), touch)
+        finally:
+            progress.close()
+
+        fill_result(output, outcomes)
+        if dry_run:
+            for outcome in outcomes:
+                if outcome.ok and outcome.detail:
+                    entry = output.dry_run.create()
+                    entry.service = outcome.service.keypath
+                    entry.diff = outcome.detail
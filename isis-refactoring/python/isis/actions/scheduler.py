@@ -0,0 +1,135 @@
+"Bounded-concurrency scheduler for the bulk actions"
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from typing import Any, Callable, ContextManager, Iterable, NamedTuple, Optional
+
+import ncs
+
+from .selection import ServiceRef
+
+
+class Outcome(NamedTuple):
+    service: ServiceRef
+    error: Optional[str]
+    detail: str = ""
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class Progress:
+    '''Progress lines sent to the package log and the CLI session'''
+
+    def __init__(self, log: logging.Logger, uinfo: Any = None) -> None:
+        self.log = log
+        self._usid = getattr(uinfo, "usid", None) if getattr(uinfo, "context", "") == "cli" else None
+        self._maapi: Optional[ncs.maapi.Maapi] = None
+        self._lock = threading.Lock()
+
+    def __call__(self, message: str) -> None:
+        self.log.info(message)
+        if self._usid is None:
+            return
+        with self._lock:
+            try:
+                if self._maapi is None:
+                    self._maapi = ncs.maapi.Maapi()
+                self._maapi.cli_write(self._usid, f"{message}\n")
+            except Exception:
+                self._usid = None
+
+    def close(self) -> None:
+        if self._maapi is not None:
+            self._maapi.close()
+            self._maapi = None
+
+
+class Scheduler:
+    '''Runs a work function over services
+
+    Devices are processed in parallel (at most `concurrency` at a time),
+    the services of one device one after the other, `batch_size` services
+    per batch context (typically a transaction committed on exit, which
+    fails all the services of the batch if it raises). Failures are
+    collected in the outcomes, they never abort the run.
+    '''
+
+    def __init__(
+        self,
+        concurrency: int,
+        batch_size: int,
+        progress: Callable[[str], None],
+    ) -> None:
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.progress = progress
+        self._lock = threading.Lock()
+        self._done = 0
+        self._failed = 0
+        self._total = 0
+
+    def _account(self, outcomes: list[Outcome]) -> None:
+        with self._lock:
+            self._done += len(outcomes)
+            self._failed += sum(not outcome.ok for outcome in outcomes)
+            done, failed, total = self._done, self._failed, self._total
+        self.progress(f"{done}/{total} services processed, {failed} failed")
+
+    def _run_device(
+        self,
+        services: list[ServiceRef],
+        open_batch: Callable[[], ContextManager[Any]],
+        work: Callable[[Any, ServiceRef], str],
+    ) -> list[Outcome]:
+        outcomes: list[Outcome] = []
+        for start in range(0, len(services), self.batch_size):
+            batch = services[start:start + self.batch_size]
+            results: list[Outcome] = []
+            try:
+                with open_batch() as context:
+                    for service in batch:
+                        try:
+                            results.append(Outcome(service, None, work(context, service) or ""))
+                        except Exception as err:
+                            results.append(Outcome(service, str(err) or type(err).__name__))
+            except Exception as err:
+                # the batch is not committed: its services failed with it
+                failed = {outcome.service: outcome for outcome in results if not outcome.ok}
+                results = [failed.get(service) or Outcome(service, f"batch failed: {err}") for service in batch]
+            outcomes += results
+            self._account(results)
+        return outcomes
+
+    def run(
+        self,
+        services: Iterable[ServiceRef],
+        open_batch: Callable[[], ContextManager[Any]],
+        work: Callable[[Any, ServiceRef], str],
+    ) -> list[Outcome]:
+        ordered = sorted(services, key=lambda service: service.device)
+        per_device = [list(group) for _, group in groupby(ordered, key=lambda service: service.device)]
+        self._total = len(ordered)
+        self.progress(f"{self._total} services selected on {len(per_device)} devices")
+
+        outcomes: list[Outcome] = []
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="isis-bulk") as pool:
+            for result in pool.map(lambda group: self._run_device(group, open_batch, work), per_device):
+                outcomes += result
+        return outcomes
+
+
+def fill_result(output: Any, outcomes: list[Outcome]) -> None:
+    '''Fill the `bulk-result` grouping of an action output'''
+
+    output.selected = len(outcomes)
+    output.succeeded = sum(outcome.ok for outcome in outcomes)
+    output.failed = sum(not outcome.ok for outcome in outcomes)
+    for outcome in outcomes:
+        if not outcome.ok:
+            failure = output.failure.create()
+            failure.service = outcome.service.keypath
+            failure.error = outcome.error
@@ -0,0 +1,96 @@
+"Selection of isis services for the bulk actions"
+
+import fnmatch
+from typing import Any, Iterator, NamedTuple, Optional
+
+import ncs
+
+from ..ressources import NEDS
+
+
+def _key(value: str) -> str:
+    return f'"{value}"' if any(c in value for c in ' "{}') else value
+
+
+class ServiceRef(NamedTuple):
+    kind: str
+    device: str
+    key: str
+
+    @property
+    def keypath(self) -> str:
+        if self.kind == "device":
+            # the aggregate service of the device (key is always "aggregate")
+            return f"/rfs:rfs/bytel-isis:isis{{{_key(self.device)}}}/aggregate"
+        return f"/rfs:rfs/bytel-isis:isis{{{_key(self.device)}}}/{self.kind}{{{_key(self.key)}}}"
+
+
+def ned_type(device: Any) -> Optional[str]:
+    '''NED type of a device ("cisco-iosxr-cli", ...) from its cli ned-id'''
+
+    ned_id = str(device.device_type.cli.ned_id or "")
+    ned_id = ned_id.split(":", 1)[-1]
+    for ned in NEDS:
+        if ned_id.startswith(ned):
+            return ned
+    return None
+
+
+class ServiceFilter:
+    '''Filter of the `service-filter` grouping'''
+
+    def __init__(
+        self,
+        service_type: Optional[str] = None,
+        device: Optional[str] = None,
+        ned_type: Optional[str] = None,
+        inventory_template: Optional[str] = None,
+        instance_id: Optional[str] = None,
+    ) -> None:
+        self.service_type = service_type
+        self.device = device
+        self.ned_type = ned_type
+        self.inventory_template = inventory_template
+        self.instance_id = instance_id
+
+    @classmethod
+    def from_input(cls, input: Any) -> "ServiceFilter":
+        def leaf(name: str) -> Optional[str]:
+            value = getattr(input, name, None)
+            return None if value is None else str(value)
+
+        return cls(
+            service_type=leaf("service_type"),
+            device=leaf("device"),
+            ned_type=leaf("ned_type"),
+            inventory_template=leaf("inventory_template"),
+            instance_id=leaf("instance_id"),
+        )
+
+    def _kinds(self) -> tuple[str, ...]:
+        return (self.service_type,) if self.service_type else ("instance", "interface")
+
+    def _match_service(self, service: Any, instance_id: Any) -> bool:
+        if self.inventory_template and service.inventory_template != self.inventory_template:
+            return False
+        if self.instance_id and str(instance_id) != self.instance_id:
+            return False
+        return True
+
+    def select(self, root: ncs.maagic.Root) -> Iterator[ServiceRef]:
+        '''Services matching the filter, device by device'''
+
+        for isis in root.rfs.isis:
+            device = isis.device
+            if self.device and not fnmatch.fnmatchcase(device, self.device):
+                continue
+            if self.ned_type and ned_type(root.devices.device[device]) != self.ned_type:
+                continue
+            for kind in self._kinds():
+                for service in getattr(isis, kind):
+                    if kind == "instance":
+                        key, instance_id = service.instance_id, service.instance_id
+                    else:
+                        key, instance_id = service.name, service.isis_instance_id
+                    if self._match_service(service, instance_id):
+                        yield ServiceRef(kind, device, str(key))
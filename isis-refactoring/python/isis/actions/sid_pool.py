@@ -0,0 +1,75 @@
+from typing import Any, Callable
+
+import ncs
+from ncs.dp import Action
+
+from ..sid_pool import entry_owner, persist, pool_entries, sid_pools
+from ..uniqueness import sid_claim, uniqueness_index
+
+
+def _taken(root: Any, domain: str) -> Callable[[int], bool]:
+    def taken(sid: int) -> bool:
+        return entry_owner(root, domain, sid) is not None or bool(uniqueness_index.holders(sid_claim(domain, sid)))
+    return taken
+
+
+class IsisSidReserve(Action):
+    """Reserves the lowest free SIDs of an SRGB for one owner, in one transaction"""
+
+    @Action.action  # type: ignore
+    def cb_action(
+        self,
+        uinfo: Any,
+        name: str,
+        kp: Any,
+        input: ncs.maagic.Node,
+        output: ncs.maagic.Node,
+        trans: Any,
+    ) -> None:
+        if not sid_pools.complete:
+            sid_pools.rebuild(pool_entries(ncs.maagic.get_root(trans)))
+        domain, owner = str(input.domain), str(input.owner)
+        srgb = (domain, int(input.lower_bound), int(input.upper_bound))
+
+        with ncs.maapi.single_write_trans(uinfo.username, "system") as write_trans:
+            root = ncs.maagic.get_root(write_trans)
+            sids = sid_pools.reserve(owner, srgb, int(input.count), _taken(root, domain))
+            for sid in sids:
+                persist(root, domain, sid, owner)
+            write_trans.apply()
+        # SidPoolSubscriber marks them too, once committed
+        for sid in sids:
+            sid_pools.mark(domain, sid, owner)
+
+        output.sid = sids
+        self.log.info(f"isis SID pool {domain}: {len(sids)} SID(s) reserved for {owner} ({sids[0]}..{sids[-1]})")
+
+
+class IsisSidRelease(Action):
+    """Releases the SIDs reserved for an owner"""
+
+    @Action.action  # type: ignore
+    def cb_action(
+        self,
+        uinfo: Any,
+        name: str,
+        kp: Any,
+        input: ncs.maagic.Node,
+        output: ncs.maagic.Node,
+        trans: Any,
+    ) -> None:
+        owner = str(input.owner)
+        if owner.startswith("/"):
+            raise ValueError(f"{owner}: the SID of an interface service is released with the service")
+        with ncs.maapi.single_write_trans(uinfo.username, "system") as write_trans:
+            root = ncs.maagic.get_root(write_trans)
+            released = [(domain, sid) for domain, sid, held in pool_entries(root) if held == owner]
+            for domain, sid in released:
+                del root.rfs.isis_sid_pool.domain[domain].sid[sid]
+            write_trans.apply()
+
+        # SidPoolSubscriber frees them too, once committed
+        for domain, sid in released:
+            sid_pools.release(domain, sid)
+        output.released = len(released)
+        self.log.info(f"isis SID pools: {len(released)} SID(s) of {owner} released")
@@ -0,0 +1,25 @@
+from typing import Any
+
+import ncs
+from ncs.dp import Action
+
+from .. import stats
+
+
+class IsisStatsReset(Action):
+    """Clears the isis create statistics and their operational data"""
+
+    @Action.action  # type: ignore
+    def cb_action(
+        self,
+        uinfo: Any,
+        name: str,
+        kp: Any,
+        input: ncs.maagic.Node,
+        output: ncs.maagic.Node,
+        trans: Any,
+    ) -> None:
+        stats.registry.reset()
+        stats.publish(stats.registry.snapshot())
+        self.log.info("isis create statistics reset")
+        output.result = "statistics reset"
@@ -0,0 +1,29 @@
+from typing import Any
+
+import ncs
+from ncs.dp import Action
+
+from ..tracing import tracer
+
+
+class IsisTraceSettings(Action):
+    """Changes the level, sampling and device filter of the create traces"""
+
+    @Action.action  # type: ignore
+    def cb_action(
+        self,
+        uinfo: Any,
+        name: str,
+        kp: Any,
+        input: ncs.maagic.Node,
+        output: ncs.maagic.Node,
+        trans: Any,
+    ) -> None:
+        device = None if input.device is None else str(input.device)
+        tracer.configure(str(input.level), int(input.sample_percent), str(input.sample_by), device)
+        output.result = (
+            f"isis trace level {tracer.level}, {tracer.percent}% of the "
+            f"{'services' if tracer.sample_by == 'service' else 'devices'}"
+            + (f" matching {device}" if device else "")
+        )
+        self.log.info(output.result)
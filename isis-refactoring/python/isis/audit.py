@@ -0,0 +1,207 @@
+"Compliance audit: rendered service intent vs the device config in CDB"
+
+import functools
+import json
+import threading
+import xml.etree.ElementTree as ET
+from typing import Any, Iterator, NamedTuple, Optional, TextIO
+
+from . import fingerprint
+from .device_config import children, local_name, read_device_config
+from .inventory_cache import inventory_cache
+from .registry import handlers
+from .rendering import device_configs, load_template, merge
+from .ressources import REFS_POLICY
+
+
+class Drift(NamedTuple):
+    '''One intent leaf that the device does not hold (actual None) or holds differently'''
+
+    path: str
+    expected: str
+    actual: Optional[str]
+
+
+#################################################################
+#   Intent                                                      #
+#################################################################
+
+class IntentTemplate:
+    '''J2NSOTemplate stand-in recording the applies instead of running FASTMAP'''
+
+    def __init__(self, applied: fingerprint.Applied) -> None:
+        self._applied = applied
+        self.variables: dict[str, str] = {}
+
+    def add(self, name: str, value: Any, j2_data: Optional[dict[str, Any]] = None) -> None:
+        self.variables[name] = str(value)
+        if j2_data is not None:
+            j2_data[name] = value
+
+    def add_dict(self, variables: dict[str, Any]) -> None:
+        for name, value in variables.items():
+            self.variables[name] = str(value)
+
+    def apply(self, name: str) -> None:
+        self._applied.append((name, dict(self.variables)))
+
+
+@functools.lru_cache(maxsize=None)
+def _intent_handler(handler: type) -> type:
+    '''Subclass of a service handler applying to an IntentTemplate
+
+    It reads the SIDs already allocated to the loopbacks, never allocates.
+    '''
+
+    def _new_template(self: Any) -> Any:
+        return IntentTemplate(self.applied)
+
+    namespace = {"_new_template": _new_template, "allocate_sids": False}
+    return type(f"{handler.__name__}Intent", (handler,), namespace)
+
+
+class AuditContext(NamedTuple):
+    '''tctx stand-in: inventory resolutions are cached per audit transaction'''
+
+    th: int
+
+
+class Intent:
+    '''Runs the service create logic, returns what it would apply'''
+
+    @inventory_cache.subscribe(REFS_POLICY, "instance")
+    def instance(self, tctx: Any, root: Any, service: Any, proplist: Any, inventory: Any) -> fingerprint.Applied:
+        handler = _intent_handler(handlers.handler("instance", service.inventory_logic.name))(
+            service=service, inventory_data=inventory
+        )
+        handler.apply()
+        return handler.applied
+
+    @inventory_cache.subscribe(REFS_POLICY, "interface")
+    def interface(self, tctx: Any, root: Any, service: Any, proplist: Any, inventory: Any) -> fingerprint.Applied:
+        handler = _intent_handler(handlers.handler("interface", service.inventory_logic.name))(
+            service=service, inventory_data=inventory
+        )
+        handler.apply()
+        return handler.applied
+
+
+def render(applied: fingerprint.Applied, device: str) -> ET.Element:
+    '''The <config> a list of applies puts on a device'''
+
+    config = ET.Element("config")
+    for name, variables in applied:
+        rendered = device_configs(load_template(name).render(variables)).get(device)
+        for node in children(rendered, "config"):
+            merge(config, node)
+    return config
+
+
+#################################################################
+#   Comparison                                                  #
+#################################################################
+
+def _value(element: ET.Element) -> str:
+    return (element.text or "").strip()
+
+
+def _match(wanted: ET.Element, candidates: list[ET.Element]) -> Optional[ET.Element]:
+    # list entries carry their key as first leaf, containers are unique
+    if len(wanted) and len(wanted[0]) == 0:
+        key = _value(wanted[0])
+        for candidate in candidates:
+            if len(candidate) and _value(candidate[0]) == key:
+                return candidate
+    return candidates[0] if len(candidates) == 1 else None
+
+
+def _label(element: ET.Element) -> str:
+    name = local_name(element.tag)
+    if len(element) > 1 and len(element[0]) == 0:
+        return f"{name}{{{_value(element[0])}}}"
+    return name
+
+
+def compare(intent: ET.Element, actual: Optional[ET.Element], prefix: str = "") -> Iterator[Drift]:
+    '''Leaves of the intent tree missing or different in the actual tree'''
+
+    by_name: dict[str, list[ET.Element]] = {}
+    for node in actual if actual is not None else ():
+        by_name.setdefault(local_name(node.tag), []).append(node)
+
+    for wanted in intent:
+        path = f"{prefix}/{_label(wanted)}"
+        found = _match(wanted, by_name.get(local_name(wanted.tag), []))
+        if len(wanted) == 0:
+            if found is None:
+                yield Drift(path, _value(wanted), None)
+            elif _value(found) != _value(wanted):
+                yield Drift(path, _value(wanted), _value(found))
+        else:
+            yield from compare(wanted, found, path)
+
+
+#################################################################
+#   Report                                                      #
+#################################################################
+
+class ServiceAudit(NamedTuple):
+    keypath: str
+    device: str
+    drift: list[Drift]
+    error: Optional[str] = None
+
+    @property
+    def status(self) -> str:
+        if self.error is not None:
+            return "error"
+        return "drift" if self.drift else "compliant"
+
+    def to_json(self) -> str:
+        record: dict[str, Any] = {"service": self.keypath, "device": self.device, "status": self.status}
+        if self.error is not None:
+            record["error"] = self.error
+        if self.drift:
+            record["drift"] = [drift._asdict() for drift in self.drift]
+        return json.dumps(record, sort_keys=True)
+
+
+class Report:
+    '''JSON lines report, one line per audited service, written as it comes'''
+
+    def __init__(self, stream: Optional[TextIO]) -> None:
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def write(self, result: ServiceAudit) -> None:
+        if self.stream is None:
+            return
+        line = result.to_json()
+        with self._lock:
+            self.stream.write(line + "\n")
+
+
+class DeviceAudit:
+    '''Audit of the services of one device
+
+    The device config is read (streamed and parsed) once, on the first
+    service, then every service intent is compared against it.
+    '''
+
+    def __init__(self, trans: Any, root: Any) -> None:
+        self.trans = trans
+        self.root = root
+        self.tctx = AuditContext(trans.th)
+        self.intent = Intent()
+        self._device: Optional[str] = None
+        self._config: Optional[ET.Element] = None
+
+    def config(self, device: str) -> ET.Element:
+        if self._device != device or self._config is None:
+            self._config = read_device_config(self.trans, device)
+            self._device = device
+        return self._config
+
+    def service(self, kind: str, device: str, service: Any) -> list[Drift]:
+        applied = getattr(self.intent, kind)(self.tctx, self.root, service, [])
+        return list(compare(render(applied, device), self.config(device), "/config"))
@@ -0,0 +1,223 @@
+"Reverse mapping of existing device ISIS config into isis service entries"
+
+import logging
+import xml.etree.ElementTree as ET
+from typing import Any, Callable, NamedTuple, Optional
+
+from . import utils
+from .device_config import child, children, entry, exists, text
+
+
+class Discovered(NamedTuple):
+    '''A service entry to create: kind ("instance"/"interface"), key, leaves
+
+    Leaves use the yang names, containers are nested dicts and empty
+    leaves / presence containers without leaves are True.
+    '''
+
+    kind: str
+    key: str
+    leaves: dict[str, Any]
+
+
+def _prune(leaves: dict[str, Any]) -> dict[str, Any]:
+    return {name: value for name, value in leaves.items() if value not in (None, False, "")}
+
+
+def _net(leaves: dict[str, Any], net_id: Optional[str]) -> None:
+    if not net_id:
+        return
+    try:
+        leaves["loopback0"], leaves["area-id"] = utils.parse_net_id(net_id)
+    except ValueError as err:
+        logging.warning(f"brownfield: {err}")
+
+
+def _level(level: Optional[str]) -> Optional[str]:
+    '''NED level names back to the circuit-type enumeration'''
+
+    return "level-2-only" if level == "level-2" else level
+
+
+def _decode(encrypted: Optional[str]) -> Optional[str]:
+    if not encrypted:
+        return None
+    try:
+        return utils.CiscoType7.decode(encrypted)
+    except (ValueError, UnicodeDecodeError) as err:
+        logging.warning(f"brownfield: cannot decode hello password: {err}")
+        return None
+
+
+def _decode_alu(key: Optional[str]) -> Optional[str]:
+    '''Hello key of SR OS: plain as written by the service, `"..." hash2` once synced
+
+    The hash and hash2 forms are one way: the key is dropped with a
+    warning, as an undecodable IOS-XR password.
+    '''
+
+    if not key:
+        return None
+    value, _, scheme = key.rpartition(" ")
+    if scheme in ("hash", "hash2") and value:
+        logging.warning(f"brownfield: cannot decode {scheme} hello key, it must be set again")
+        return None
+    return key.strip('"') or None
+
+
+#################################################################
+#   IOS-XR                                                      #
+#################################################################
+
+def discover_iosxr(config: ET.Element) -> list[Discovered]:
+    found = []
+    for tag in children(config, "router/isis/tag"):
+        instance_id = text(tag, "name")
+        unicast = child(tag, "address-family/ipv4/unicast")
+        leaves: dict[str, Any] = {
+            "ldp": exists(unicast, "mpls/ldp"),
+            "mpls": exists(unicast, "segment-routing/mpls"),
+            "mpls-sr-prefer": exists(unicast, "segment-routing/mpls/sr-prefer"),
+            "dist-link-state": exists(tag, "distribute/link-state"),
+        }
+        _net(leaves, text(tag, "net/id"))
+        block = child(tag, "segment-routing/global-block")
+        if block is not None:
+            leaves["sr"] = _prune({
+                "lower-bound": text(block, "lower-bound"),
+                "upper-bound": text(block, "upper-bound"),
+            }) or True
+        found.append(Discovered("instance", instance_id, _prune(leaves)))
+
+        for intf in children(tag, "interface"):
+            name = text(intf, "name")
+            unicast = child(intf, "address-family/ipv4/unicast")
+            leaves = {"isis-instance-id": instance_id}
+            if text(intf, "interface-type") == "passive":
+                leaves["interface-type"] = "loopback"
+                leaves["loopback-attribs"] = _prune({
+                    "unicast-tag": text(unicast, "tag"),
+                    "sr-id": text(unicast, "prefix-sid/absolute"),
+                }) or True
+            else:
+                leaves.update({
+                    "interface-type": "common",
+                    "circuit-type": text(intf, "circuit-type"),
+                    "metric": text(unicast, "metric"),
+                    "passwd": _decode(text(intf, "hello-password/encrypted")),
+                    "enable-sync-ldp": exists(unicast, "mpls/ldp/sync"),
+                })
+            found.append(Discovered("interface", name, _prune(leaves)))
+    return found
+
+
+#################################################################
+#   ALUSR                                                       #
+#################################################################
+
+def discover_alusr(config: ET.Element) -> list[Discovered]:
+    found = []
+    router = entry(config, "router", "Base")
+    system_address = text(entry(router, "interface", "system"), "address")
+    for isis in children(router, "isis-list"):
+        instance_id = text(isis, "id")
+        leaves: dict[str, Any] = {
+            "area-id": text(isis, "area-id/id"),
+            "loopback0": system_address.split("/", 1)[0] if system_address else None,
+            "disable-sync-ldp": exists(isis, "disable-ldp-sync"),
+            "export": text(isis, "export"),
+            "export-tunnel-table": text(router, "ldp/export-tunnel-table"),
+        }
+        labels = child(router, "mpls-labels/sr-labels")
+        if labels is not None or exists(isis, "segment-routing"):
+            leaves["sr"] = _prune({
+                "lower-bound": text(labels, "start"),
+                "upper-bound": text(labels, "end"),
+            }) or True
+        found.append(Discovered("instance", instance_id, _prune(leaves)))
+
+        for intf in children(isis, "interface"):
+            name = text(intf, "name")
+            leaves = {"isis-instance-id": instance_id}
+            if exists(intf, "passive"):
+                leaves["interface-type"] = "loopback"
+                leaves["loopback-attribs"] = _prune({
+                    "unicast-tag": text(intf, "tag"),
+                    "sr-id": text(intf, "ipv4-node-sid/label"),
+                }) or True
+            else:
+                level = entry(intf, "level", "2")
+                leaves.update({
+                    "interface-type": "common",
+                    "circuit-type": _level(text(intf, "level-capability")),
+                    "metric": text(level, "metric"),
+                    "passwd": _decode_alu(text(level, "hello-authentication-key/key")),
+                })
+            found.append(Discovered("interface", name, _prune(leaves)))
+    return found
+
+
+#################################################################
+#   huawei-vrp                                                  #
+#################################################################
+
+def discover_huawei(config: ET.Element) -> list[Discovered]:
+    found = []
+    for isis in children(config, "isis"):
+        instance_id = text(isis, "id")
+        leaves: dict[str, Any] = {}
+        _net(leaves, text(isis, "network-entity"))
+        block = child(isis, "segment-routing/global-block")
+        if block is not None:
+            leaves["sr"] = _prune({
+                "lower-bound": text(block, "start"),
+                "upper-bound": text(block, "end"),
+            }) or True
+        ti_lfa = text(isis, "frr/ti-lfa")
+        if ti_lfa:
+            leaves["fast-reroute"] = {"ti-lfa-level": ti_lfa}
+        found.append(Discovered("instance", instance_id, _prune(leaves)))
+
+    for trunk in children(config, "interface/Eth-Trunk"):
+        instance_id = text(trunk, "isis/enable")
+        if not instance_id:
+            continue
+        name = text(trunk, "name") or ""
+        trunk_id, _, subif_id = name.partition(".")
+        found.append(Discovered("interface", f"Eth-Trunk{name}", _prune({
+            "isis-instance-id": instance_id,
+            "interface-type": "common",
+            "common-attributes": _prune({"id": trunk_id, "type": "LAG", "subif-id": subif_id}),
+            "circuit-type": _level(text(trunk, "isis/circuit-level")),
+            "metric": text(trunk, "isis/cost/cost-value"),
+        })))
+
+    for loopback in children(config, "interface/LoopBack"):
+        instance_id = text(loopback, "isis/enable")
+        if not instance_id:
+            continue
+        loopback_id = text(loopback, "name")
+        found.append(Discovered("interface", f"Loopback{loopback_id}", _prune({
+            "isis-instance-id": instance_id,
+            "interface-type": "loopback",
+            "loopback-attribs": _prune({
+                "loopback-id": loopback_id,
+                "unicast-tag": text(loopback, "isis/tag-value"),
+            }),
+        })))
+    return found
+
+
+DISCOVER: dict[str, Callable[[ET.Element], list[Discovered]]] = {
+    "cisco-iosxr-cli": discover_iosxr,
+    "alu-sr-cli": discover_alusr,
+    "huawei-vrp-cli": discover_huawei,
+}
+
+
+def discover(ned: str, config: ET.Element) -> list[Discovered]:
+    '''Service entries matching the ISIS config of a device'''
+
+    if ned not in DISCOVER:
+        raise NotImplementedError(f"NED {ned} not supported for ISIS import")
+    return DISCOVER[ned](config)
@@ -0,0 +1,208 @@
+"Reverse index of the isis service dependencies and re-deploy of the dependents"
+
+import functools
+import logging
+import re
+import threading
+import time
+from typing import Any, Callable, Iterable
+
+import ncs
+
+from . import push
+from .actions.redeploy import redeploy_batch, touch
+from .actions.scheduler import Scheduler
+from .actions.selection import ServiceRef
+
+# ("inventory", "instance" | "interface", name) or ("instance", device, instance-id)
+Key = tuple[str, str, str]
+
+# dependents re-deployed per commit, devices in parallel
+REDEPLOY_BATCH = 50
+REDEPLOY_CONCURRENCY = 8
+
+_INVENTORY_RE = re.compile(r'^/rfs:rfs/rfs:inventory/bytel-isis:isis/(instance|interface)\{"?(.+?)"?\}(.*)$')
+_INSTANCE_RE = re.compile(r'^/rfs:rfs/bytel-isis:isis\{"?(.+?)"?\}/instance\{"?(.+?)"?\}(.*)$')
+
+# ncs:service-data nodes, written by FASTMAP and never an input
+SERVICE_META_DATA = {
+    "private", "modified", "directly-modified", "device-list", "used-by-customer-service",
+    "commit-queue", "log", "plan-location", "service-commit-queue-event",
+}
+
+# instance leaves the interfaces depend on (besides the instance-id key),
+# sr for the SRGB and domain the loopback SIDs are allocated in
+INSTANCE_INPUTS = ("area-id", "sr")
+
+
+def entry_keys(kind: str, device: str, service: Any) -> set[Key]:
+    '''What an instance/interface entry depends on'''
+
+    keys = set()
+    if service.inventory_template:
+        keys.add(("inventory", kind, str(service.inventory_template)))
+    if kind == "interface" and service.isis_instance_id:
+        keys.add(("instance", device, str(service.isis_instance_id)))
+    return keys
+
+
+def _entries(isis: Any) -> Iterable[tuple[str, Any]]:
+    for kind in ("instance", "interface"):
+        for entry in getattr(isis, kind):
+            yield kind, entry
+
+
+class DependencyIndex:
+    '''{inventory entry or isis instance: services using it}
+
+    Kept up to date by the creates (the service re-deployed is the
+    aggregate service for an aggregated device), rebuilt from CDB the
+    first time it is needed after a restart of the python VM.
+    '''
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._dependents: dict[Key, set[ServiceRef]] = {}
+        self._keys: dict[ServiceRef, frozenset[Key]] = {}
+        self.complete = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self._dependents.clear()
+            self._keys.clear()
+        self.complete = False
+
+    def record(self, ref: ServiceRef, keys: Iterable[Key]) -> None:
+        keys = frozenset(keys)
+        with self._lock:
+            for key in self._keys.get(ref, frozenset()) - keys:
+                self._dependents[key].discard(ref)
+            for key in keys:
+                self._dependents.setdefault(key, set()).add(ref)
+            self._keys[ref] = keys
+
+    def forget(self, ref: ServiceRef) -> None:
+        self.record(ref, ())
+        with self._lock:
+            self._keys.pop(ref, None)
+
+    def dependents(self, keys: Iterable[Key]) -> set[ServiceRef]:
+        with self._lock:
+            return set().union(*(self._dependents.get(key, set()) for key in keys))
+
+    def rebuild(self, root: ncs.maagic.Root) -> None:
+        found: dict[ServiceRef, set[Key]] = {}
+        for isis in root.rfs.isis:
+            device = str(isis.device)
+            aggregate = ServiceRef("device", device, "aggregate") if isis.aggregate.exists() else None
+            for kind, entry in _entries(isis):
+                ref = aggregate or ServiceRef(kind, device, str(entry.instance_id if kind == "instance" else entry.name))
+                found.setdefault(ref, set()).update(entry_keys(kind, device, entry))
+        self.reset()
+        for ref, keys in found.items():
+            self.record(ref, keys)
+        self.complete = True
+        logging.info(f"isis dependency index rebuilt: {len(found)} service(s)")
+
+    def track(self, kind: str) -> Callable[..., Any]:
+        '''cb_create decorator recording the dependencies of the service'''
+
+        def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+            @functools.wraps(fn)
+            def wrapper(self_: Any, tctx: Any, root: Any, service: Any, proplist: Any) -> Any:
+                result = fn(self_, tctx, root, service, proplist)
+                if kind == "device":
+                    isis = service._parent
+                    device = str(isis.device)
+                    keys = set().union(*(entry_keys(k, device, entry) for k, entry in _entries(isis)))
+                    self.record(ServiceRef(kind, device, "aggregate"), keys)
+                else:
+                    device = str(service._parent._parent.device)
+                    key = service.instance_id if kind == "instance" else service.name
+                    self.record(ServiceRef(kind, device, str(key)), entry_keys(kind, device, service))
+                return result
+            return wrapper
+        return decorator
+
+
+dependency_index = DependencyIndex()
+
+
+def changed_key(path: str, op: int) -> tuple[Any, int]:
+    '''(dependency key or None, iteration code) for one diff node'''
+
+    match = _INVENTORY_RE.match(path)
+    if match is not None:
+        kind, name, rest = match.groups()
+        key: Key = ("inventory", kind, name)
+    else:
+        match = _INSTANCE_RE.match(path)
+        if match is None:
+            return None, ncs.ITER_RECURSE
+        device, instance_id, rest = match.groups()
+        key = ("instance", device, instance_id)
+        if rest and rest.lstrip("/").split("/")[0] not in INSTANCE_INPUTS:
+            return None, ncs.ITER_CONTINUE
+
+    if not rest:
+        # entry created or deleted: that is a change, modified: look inside
+        return (None, ncs.ITER_RECURSE) if op == ncs.MOP_MODIFIED else (key, ncs.ITER_CONTINUE)
+    if rest.lstrip("/").split("/")[0] in SERVICE_META_DATA:
+        return None, ncs.ITER_CONTINUE
+    return key, ncs.ITER_CONTINUE
+
+
+class DependencySubscriber(ncs.cdb.Subscriber):
+    """Re-deploys, after the commit, the services depending on a changed
+    inventory entry or isis instance"""
+
+    def init(self) -> None:
+        self.register("/rfs:rfs/rfs:inventory/bytel-isis:isis", priority=100)
+        self.register("/rfs:rfs/bytel-isis:isis/bytel-isis:instance", priority=100)
+
+    def pre_iterate(self) -> set[Key]:
+        return set()
+
+    def iterate(self, kp: Any, op: int, oldv: Any, newv: Any, state: set[Key]) -> int:
+        key, code = changed_key(str(kp), op)
+        if key is not None:
+            state.add(key)
+        return code
+
+    def should_post_iterate(self, state: set[Key]) -> bool:
+        return bool(state)
+
+    def post_iterate(self, state: set[Key]) -> None:
+        with ncs.maapi.single_read_trans("admin", "system") as trans:
+            root = ncs.maagic.get_root(trans)
+            if not dependency_index.complete:
+                dependency_index.rebuild(root)
+            options = push.PushOptions.from_input(root)
+
+        services = sorted(dependency_index.dependents(state))
+        self.log.info(f"isis dependencies changed: {sorted(state)}, re-deploying {len(services)} service(s)")
+        if not services:
+            return
+
+        if options.asynchronous:
+            tag = f"isis-dependents-{time.strftime('%Y%m%dT%H%M%S')}"
+            outcomes = push.push_services("admin", services, options, tag, REDEPLOY_CONCURRENCY, REDEPLOY_BATCH)
+            for outcome in outcomes:
+                if not outcome.ok:
+                    self.log.error(f"queuing the re-deploy of {outcome.service.keypath} failed: {outcome.error}")
+            return
+
+        def work(trans: ncs.maapi.Transaction, service: ServiceRef) -> str:
+            if not trans.exists(service.keypath):
+                dependency_index.forget(service)
+                return "gone"
+            return touch(trans, service)
+
+        outcomes = Scheduler(REDEPLOY_CONCURRENCY, REDEPLOY_BATCH, self.log.info).run(
+            services,
+            lambda: redeploy_batch("admin", "isis-dependents"),
+            work,
+        )
+        for outcome in outcomes:
+            if not outcome.ok:
+                self.log.error(f"re-deploy of {outcome.service.keypath} failed: {outcome.error}")
@@ -0,0 +1,81 @@
+"Device config read as XML, streamed one device at a time"
+
+import socket
+import xml.etree.ElementTree as ET
+from typing import Any, Iterator, Optional
+
+import _ncs
+
+CHUNK_SIZE = 65536
+
+
+def local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def children(element: Optional[ET.Element], path: str) -> Iterator[ET.Element]:
+    '''Children at a "/" separated path of local names (namespaces ignored)'''
+
+    if element is None:
+        return
+    head, _, rest = path.partition("/")
+    for child in element:
+        if local_name(child.tag) == head:
+            if rest:
+                yield from children(child, rest)
+            else:
+                yield child
+
+
+def child(element: Optional[ET.Element], path: str) -> Optional[ET.Element]:
+    return next(children(element, path), None)
+
+
+def text(element: Optional[ET.Element], path: str) -> Optional[str]:
+    node = child(element, path)
+    if node is None:
+        return None
+    return (node.text or "").strip()
+
+
+def exists(element: Optional[ET.Element], path: str) -> bool:
+    return child(element, path) is not None
+
+
+def entry(element: Optional[ET.Element], path: str, key: str) -> Optional[ET.Element]:
+    '''List entry at `path` whose first leaf (the key) equals `key`'''
+
+    for node in children(element, path):
+        if len(node) and (node[0].text or "").strip() == str(key):
+            return node
+    return None
+
+
+def read_device_config(trans: Any, device: str) -> ET.Element:
+    '''The <config> subtree of a device, parsed while it is streamed
+
+    Uses maapi save_config so the whole tree comes in one read instead of
+    one CDB round-trip per node.
+    '''
+
+    maapi = trans.maapi
+    path = f"/ncs:devices/device{{{device}}}/config"
+    save_id = maapi.save_config(trans.th, _ncs.maapi.CONFIG_XML, path)
+    parser = ET.XMLParser()
+    sock = socket.socket()
+    try:
+        _ncs.stream_connect(sock, save_id, 0, "127.0.0.1", _ncs.PORT)
+        while True:
+            data = sock.recv(CHUNK_SIZE)
+            if not data:
+                break
+            parser.feed(data)
+    finally:
+        sock.close()
+    maapi.save_config_result(save_id)
+    document = parser.close()
+
+    config = child(document, "devices/device/config")
+    if config is None:
+        config = ET.Element("config")
+    return config
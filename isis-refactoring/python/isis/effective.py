@@ -0,0 +1,226 @@
+"Effective configuration of the isis services, kept in operational data"
+
+import re
+from typing import Any, Iterable, Iterator
+
+import ncs
+
+from . import interface_index, sid_pool
+from .actions.selection import ServiceRef
+from .audit import AuditContext
+from .dependencies import SERVICE_META_DATA, Key, changed_key, dependency_index
+from .validation import InputCheck
+
+# views written per operational transaction
+PUBLISH_BATCH = 500
+
+_SERVICE_RE = re.compile(r'^/rfs:rfs/bytel-isis:isis\{"?(.+?)"?\}/(instance|interface)\{"?(.+?)"?\}(.*)$')
+_DEVICE_RE = re.compile(r'^/rfs:rfs/bytel-isis:isis\{"?(.+?)"?\}$')
+
+# circuit-type as rendered, for the NEDs without level-2-only
+CIRCUIT_TYPES = {
+    "alu-sr-cli": {"level-2-only": "level-2"},
+    "huawei-vrp-cli": {"level-2-only": "level-2"},
+}
+
+View = dict[str, Any]
+
+
+def _value(value: Any) -> Any:
+    return None if value in (None, "", "None") else value
+
+
+def instance_view(handler: Any) -> View:
+    '''Effective leaves of an instance, from its input model'''
+
+    model = handler.model
+    ned = handler.device.ned_type
+    is_name = model.is_name
+    if ned == "huawei-vrp-cli" and is_name is None:
+        is_name = handler.device.name
+    return {
+        "ned": ned,
+        "area-id": model.area_id,
+        "loopback0": model.loopback0,
+        "net-id": model.net_id,
+        "is-name": is_name,
+        "sr": model.sr,
+        "sr-lower-bound": _value(model.sr_lower_bound) if model.sr else None,
+        "sr-upper-bound": _value(model.sr_upper_bound) if model.sr else None,
+        "ldp": model.ldp,
+        "mpls": model.mpls,
+        "ti-lfa-level": _value(model.ti_lfa_level),
+    }
+
+
+def interface_view(handler: Any) -> View:
+    '''Effective leaves of an interface, from its input model'''
+
+    model = handler.model
+    ned = handler.device.ned_type
+    circuit_type = _value(model.circuit_type)
+    circuit_type = CIRCUIT_TYPES.get(ned, {}).get(circuit_type, circuit_type)
+    return {
+        "ned": ned,
+        "instance-id": model.instance_id,
+        "interface-type": model.interface_type,
+        "device-interface": interface_index.interface_name(ned, model),
+        "circuit-type": circuit_type,
+        "metric": _value(model.metric),
+        "hello-password": bool(model.passwd),
+        "enable-sync-ldp": model.enable_sync_ldp,
+        "sr-id": _value(model.sr_id),
+        "unicast-tag": _value(model.unicast_tag),
+        "loopback-id": _value(model.loopback_id),
+    }
+
+
+def compute(check: InputCheck, tctx: Any, root: Any, ref: ServiceRef, service: Any) -> View:
+    '''View of one service, its input problems included'''
+
+    try:
+        handler = getattr(check, ref.kind)(tctx, root, service, [])
+        problems = handler.validate()
+        view = (instance_view if ref.kind == "instance" else interface_view)(handler)
+    except Exception as err:
+        problems, view = [str(err) or type(err).__name__], {}
+    view["inventory-template"] = service.inventory_template
+    view["problem"] = "; ".join(problems) or None
+    return view
+
+
+def views(trans: ncs.maapi.Transaction, refs: Iterable[ServiceRef]) -> Iterator[tuple[ServiceRef, View]]:
+    '''(service, view) of the services still in the transaction'''
+
+    root = ncs.maagic.get_root(trans)
+    if not sid_pool.sid_pools.complete:
+        # the allocated sr-ids are read from the pools
+        sid_pool.sid_pools.rebuild(sid_pool.pool_entries(root))
+    tctx = AuditContext(trans.th)
+    check = InputCheck()
+    for ref in refs:
+        if ref.kind == "device":
+            # aggregated device: the views are the ones of its entries
+            isis = root.rfs.isis[ref.device] if ref.device in root.rfs.isis else None
+            entries = [] if isis is None else [
+                ServiceRef(kind, ref.device, str(entry.instance_id if kind == "instance" else entry.name))
+                for kind in ("instance", "interface") for entry in getattr(isis, kind)
+            ]
+            yield from views(trans, entries)
+        elif trans.exists(ref.keypath):
+            yield ref, compute(check, tctx, root, ref, ncs.maagic.get_node(trans, ref.keypath))
+
+
+def publish(username: str, found: Iterable[tuple[ServiceRef, View]], gone: Iterable[ServiceRef] = ()) -> int:
+    '''Write the views (and remove the ones of the services gone) in
+    operational data, PUBLISH_BATCH per transaction'''
+
+    count = 0
+    batch: list[tuple[ServiceRef, View]] = [(ref, {}) for ref in gone]
+    for item in found:
+        batch.append(item)
+        if len(batch) >= PUBLISH_BATCH:
+            count += _publish(username, batch)
+            batch = []
+    if batch:
+        count += _publish(username, batch)
+    return count
+
+
+def _publish(username: str, batch: list[tuple[ServiceRef, View]]) -> int:
+    with ncs.maapi.single_write_trans(username, "system", db=ncs.OPERATIONAL) as trans:
+        effective = ncs.maagic.get_root(trans).rfs.isis_effective
+        for ref, view in batch:
+            entries = getattr(effective, ref.kind)
+            if (ref.device, ref.key) in entries:
+                del entries[ref.device, ref.key]
+            if not view:
+                continue
+            entry = entries.create(ref.device, ref.key)
+            for name, value in view.items():
+                if value is not None:
+                    setattr(entry, name.replace("-", "_"), value)
+        trans.apply()
+    return len(batch)
+
+
+def device_views(trans: ncs.maapi.Transaction, devices: Iterable[str]) -> Iterator[ServiceRef]:
+    '''Views of the given devices (all their services deleted at once)'''
+
+    devices = set(devices)
+    effective = ncs.maagic.get_root(trans).rfs.isis_effective
+    for kind in ("instance", "interface"):
+        for entry in getattr(effective, kind):
+            if entry.device in devices:
+                yield ServiceRef(kind, str(entry.device), str(entry.instance_id if kind == "instance" else entry.name))
+
+
+class Changes:
+    '''What one commit changed, collected by EffectiveSubscriber.iterate'''
+
+    def __init__(self) -> None:
+        self.services: set[ServiceRef] = set()
+        self.gone: set[ServiceRef] = set()
+        self.devices: set[str] = set()
+        self.keys: set[Key] = set()
+
+
+class EffectiveSubscriber(ncs.cdb.Subscriber):
+    """Recomputes, after the commit, the effective view of the services
+    changed directly or through an inventory entry or isis instance"""
+
+    def init(self) -> None:
+        # the input lists only: not the aggregate service nor the views
+        self.register("/rfs:rfs/rfs:inventory/bytel-isis:isis", priority=110)
+        self.register("/rfs:rfs/bytel-isis:isis/bytel-isis:instance", priority=110)
+        self.register("/rfs:rfs/bytel-isis:isis/bytel-isis:interface", priority=110)
+
+    def pre_iterate(self) -> Changes:
+        return Changes()
+
+    def iterate(self, kp: Any, op: int, oldv: Any, newv: Any, state: Changes) -> int:
+        path = str(kp)
+        key, code = changed_key(path, op)
+        if key is not None:
+            state.keys.add(key)
+        match = _SERVICE_RE.match(path)
+        if match is None:
+            match = _DEVICE_RE.match(path)
+            if match is not None and op == ncs.MOP_DELETED:
+                state.devices.add(match.group(1))
+                return ncs.ITER_CONTINUE
+            return code
+        device, kind, name, rest = match.groups()
+        if rest.lstrip("/").split("/")[0] in SERVICE_META_DATA:
+            # written by FASTMAP (proplist and its fingerprint): not an input
+            return ncs.ITER_CONTINUE
+        if op == ncs.MOP_DELETED and not rest:
+            state.gone.add(ServiceRef(kind, device, name))
+        else:
+            state.services.add(ServiceRef(kind, device, name))
+        # inside an instance, changed_key tells the inputs of its interfaces
+        return code if kind == "instance" else ncs.ITER_CONTINUE
+
+    def should_post_iterate(self, state: Changes) -> bool:
+        return bool(state.services or state.keys or state.gone or state.devices)
+
+    def post_iterate(self, state: Changes) -> None:
+        services = state.services
+        with ncs.maapi.single_read_trans("admin", "system") as trans:
+            if state.keys:
+                if not dependency_index.complete:
+                    dependency_index.rebuild(ncs.maagic.get_root(trans))
+                services = services | dependency_index.dependents(state.keys)
+            gone = set(state.gone)
+            if state.devices:
+                with ncs.maapi.single_read_trans("admin", "system", db=ncs.OPERATIONAL) as oper:
+                    gone.update(device_views(oper, state.devices))
+            count = publish("admin", views(trans, sorted(services)), sorted(gone))
+        self.log.info(f"isis effective views: {count} service(s) updated or removed")
+
+
+def refresh(username: str, refs: Iterable[ServiceRef]) -> int:
+    '''Recompute the views of the given services (all of them after an upgrade)'''
+
+    with ncs.maapi.single_read_trans(username, "system") as trans:
+        return publish(username, views(trans, refs))
@@ -0,0 +1,105 @@
+"Fingerprint of the service inputs and replay of the previous create result"
+
+import hashlib
+import json
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Optional
+
+from .registry import handlers
+
+if TYPE_CHECKING:
+    from sdn_nso_lib.ncs_utils.template import J2NSOTemplate
+
+PROP_FINGERPRINT = "isis-fingerprint"
+PROP_RESULT = "isis-result"
+
+Applied = list[tuple[str, dict[str, Any]]]
+
+
+def _code_revision() -> str:
+    '''Hash of the templates and python sources, so a package upgrade
+    never replays a result computed by another revision'''
+
+    package = Path(__file__).resolve().parents[2]
+    digest = hashlib.sha256()
+    for path in sorted(package.glob("templates/**/*.xml")) + sorted(package.glob("python/isis/**/*.py")):
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+CODE_REVISION = _code_revision()
+
+
+def of_inputs(ned: str, keypath: str, data: dict[str, Any]) -> str:
+    '''Fingerprint of everything a create reads to compute its variables'''
+
+    payload = json.dumps([CODE_REVISION, ned, keypath, data], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def of_result(applied: Applied) -> str:
+    '''Fingerprint of the templates applied and their variables'''
+
+    payload = json.dumps(applied, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class RecordingTemplate:
+    '''J2NSOTemplate wrapper recording the variables of each apply'''
+
+    def __init__(self, template: "J2NSOTemplate", applied: Applied) -> None:
+        self._template = template
+        self._applied = applied
+        self.variables: dict[str, Any] = {}
+
+    def add(self, name: str, value: Any, j2_data: Any = None) -> None:
+        self.variables[name] = value
+        self._template.add(name, value, j2_data=j2_data)
+
+    def add_dict(self, variables: dict[str, Any]) -> None:
+        self.variables.update(variables)
+        self._template.add_dict(variables)
+
+    def apply(self, name: str) -> None:
+        self._template.apply(name)
+        self._applied.append((name, dict(self.variables)))
+
+
+#################################################################
+#   Proplist storage                                            #
+#################################################################
+
+def previous(proplist: list[tuple[str, str]], fingerprint: str) -> Optional[Applied]:
+    '''Result of the previous create if its inputs had this fingerprint'''
+
+    props = dict(proplist or [])
+    if props.get(PROP_FINGERPRINT) != fingerprint or PROP_RESULT not in props:
+        return None
+    try:
+        return [(name, variables) for name, variables in json.loads(props[PROP_RESULT])]
+    except (TypeError, ValueError):
+        return None
+
+
+def record(
+    proplist: list[tuple[str, str]],
+    fingerprint: str,
+    applied: Applied,
+) -> list[tuple[str, str]]:
+    kept = [(k, v) for k, v in proplist or [] if k not in (PROP_FINGERPRINT, PROP_RESULT)]
+    result = json.dumps(applied, separators=(",", ":"), default=str)
+    return kept + [(PROP_FINGERPRINT, fingerprint), (PROP_RESULT, result)]
+
+
+def replay(service: Any, j2_filters: Any, applied: Applied) -> None:
+    '''Apply the templates of a previous create with its variables
+
+    FASTMAP removes what a create does not apply again, so the fast path
+    still applies the templates, it only skips computing the variables.
+    '''
+
+    for name, variables in applied:
+        tpl = handlers.template(service, j2_filters=j2_filters)
+        tpl.add_dict(variables)
+        tpl.apply(name)
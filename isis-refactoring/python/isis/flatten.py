@@ -0,0 +1,32 @@
+"Flattening of service data into template variables, in one pass"
+
+from typing import Any
+
+_SKIPPED = (list, tuple, set)
+
+
+def _walk(data: dict[str, Any], prefix: str, variables: dict[str, Any]) -> None:
+    for var, val in data.items():
+        if isinstance(val, _SKIPPED):
+            continue
+        name = f"{prefix}_{var.upper()}" if prefix else var.upper()
+        if isinstance(val, dict):
+            _walk(val, name, variables)
+        elif isinstance(val, bool):
+            variables[name] = "true" if val else "false"
+        else:
+            variables[name] = val
+
+
+def flatten(data: dict[str, Any], prefix: str = "") -> dict[str, Any]:
+    '''Template variables of `data`, as the former recursive add_all_vars
+
+    {"sr": {"lower_bound": 1}, "mpls": True} with prefix "" gives
+    {"SR_LOWER_BOUND": 1, "MPLS": "true"}. The map is built in a single
+    walk and handed to the template with one add_dict call: a plan cached
+    per data shape would need the shape as key, computed by the same walk.
+    '''
+
+    variables: dict[str, Any] = {}
+    _walk(data, prefix, variables)
+    return variables
@@ -0,0 +1,112 @@
+"Interface names configured on the devices, indexed once per transaction"
+
+from typing import Any, Iterator, Optional
+
+import ncs
+
+from .txcache import TransactionCache
+
+# IOS-XR interface lists, the LAG ones (Bundle-Ether) included; the
+# sub-interfaces are in the "<type>-subinterface" container of each type
+IOSXR_TYPES = (
+    "Loopback", "Bundle-Ether", "GigabitEthernet", "TenGigE",
+    "TwentyFiveGigE", "HundredGigE", "FourHundredGigE",
+)
+
+_indexes = TransactionCache()
+
+
+def _child(node: Any, name: str) -> Optional[Any]:
+    try:
+        return getattr(node, name.replace("-", "_"))
+    except AttributeError:
+        return None
+
+
+def _keys(node: Optional[Any], key: str) -> Iterator[str]:
+    '''Keys of the entries of a device config list, none if it is missing'''
+
+    if node is None:
+        return
+    for entry in node:
+        value = _child(entry, key)
+        if value is not None:
+            yield str(value)
+
+
+def _iosxr(config: Any) -> Iterator[str]:
+    interface = _child(config, "interface")
+    for kind in IOSXR_TYPES:
+        yield from (f"{kind}{key}" for key in _keys(_child(interface, kind), "id"))
+        sub = _child(_child(interface, f"{kind}-subinterface"), kind)
+        yield from (f"{kind}{key}" for key in _keys(sub, "id"))
+
+
+def _alusr(config: Any) -> Iterator[str]:
+    try:
+        router = _child(config, "router")["Base"]
+    except (KeyError, TypeError):
+        return
+    yield from _keys(_child(router, "interface"), "interface-name")
+
+
+def _huawei(config: Any) -> Iterator[str]:
+    interface = _child(config, "interface")
+    yield from (f"Eth-Trunk{name}" for name in _keys(_child(interface, "Eth-Trunk"), "name"))
+    yield from (f"LoopBack{name}" for name in _keys(_child(interface, "LoopBack"), "name"))
+
+
+INTERFACES = {
+    "cisco-iosxr-cli": _iosxr,
+    "alu-sr-cli": _alusr,
+    "huawei-vrp-cli": _huawei,
+}
+
+
+def device_interfaces(root: Any, device_name: str, ned: str) -> frozenset[str]:
+    '''Names of the interfaces of a device, in the NED naming (Bundle-Ether30.1450)
+
+    Read from the device config tree of the transaction once per device,
+    then shared by all the interface services of the transaction.
+    '''
+
+    def load() -> frozenset[str]:
+        config = root.devices.device[device_name].config
+        return frozenset(INTERFACES[ned](config))
+
+    return _indexes.get_or_load(ncs.maagic.get_trans(root).th, (device_name, ned), load)
+
+
+def interface_name(ned: str, model: Any) -> Optional[str]:
+    '''Name of the device interface an isis interface service configures
+
+    IOS-XR and SR OS use the service name; huawei builds it from
+    common-attributes (Eth-Trunk<id>[.<subif-id>]) or loopback-attribs.
+    '''
+
+    if ned != "huawei-vrp-cli":
+        return model.name
+    if model.template_suffix == "loopback":
+        return None if model.loopback_id is None else f"LoopBack{model.loopback_id}"
+    if model.if_id is None or model.if_type != "LAG":
+        return None
+    suffix = "" if model.subif_id is None else f".{model.subif_id}"
+    return f"Eth-Trunk{model.if_id}{suffix}"
+
+
+def missing_interface(root: Any, device: str, ned: str, model: Any) -> Optional[str]:
+    '''The device interface of a service when it is not on the device
+
+    A device whose config holds no interface at all (never synced) is
+    not checked.
+    '''
+
+    if ned not in INTERFACES:
+        return None
+    name = interface_name(ned, model)
+    if name is None:
+        return None
+    known = device_interfaces(root, device, ned)
+    if not known or name in known:
+        return None
+    return name
@@ -0,0 +1,112 @@
+"Transaction-scoped cache of the resolved inventory templates"
+
+import functools
+import logging
+from typing import Any, Callable
+
+from .registry import handlers
+from .txcache import TransactionCache
+
+INVENTORY_MANAGER = "inventory_manager.api:InventoryManager"
+
+
+class ReadOnlyDict(dict):
+    '''dict view of a cached inventory, shared by several services'''
+
+    def _readonly(self, *args: Any, **kwargs: Any) -> None:
+        raise TypeError("cached inventory data is read-only")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly  # type: ignore
+    clear = pop = popitem = setdefault = update = _readonly  # type: ignore
+
+    def __copy__(self) -> dict[str, Any]:
+        return dict(self)
+
+    def __deepcopy__(self, memo: dict[int, Any]) -> dict[str, Any]:
+        return thaw(self)
+
+    def __reduce__(self) -> Any:
+        return (dict, (thaw(self),))
+
+
+def freeze(data: Any) -> Any:
+    if isinstance(data, dict):
+        return ReadOnlyDict((var, freeze(val)) for var, val in data.items())
+    return data
+
+
+def thaw(data: Any) -> Any:
+    if isinstance(data, dict):
+        return {var: thaw(val) for var, val in data.items()}
+    return data
+
+
+def service_type_of(service: Any) -> str:
+    '''"instance" or "interface" from the keypath of a service list entry'''
+
+    last = str(service._path).rsplit("/", 1)[-1]
+    return last.split("{", 1)[0].rsplit(":", 1)[-1]
+
+
+class InventoryCache:
+    '''Resolves each inventory entry once per transaction
+
+    Keyed by (transaction handle, inventory name, service type). A miss
+    goes through InventoryManager.subscribe, a hit hands out the same
+    read-only view without calling it: the services depending on an
+    inventory entry are tracked by the dependency index, which re-deploys
+    them when the entry changes.
+    '''
+
+    def __init__(self) -> None:
+        self.cache = TransactionCache()
+
+    def subscribe(self, policy: dict[str, list[str]], service_type: str) -> Callable[..., Any]:
+        ref = policy["leafref"][0].replace("-", "_")
+
+        def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+            def store(self_: Any, tctx: Any, root: Any, service: Any, proplist: Any,
+                      inventory: dict[str, Any]) -> Any:
+                view = freeze(inventory)
+                name = getattr(service, ref)
+                if name:
+                    view = self.cache.put(tctx.th, (name, service_type), view)
+                return fn(self_, tctx, root, service, proplist, view)
+
+            @functools.lru_cache(maxsize=None)
+            def resolver() -> Callable[..., Any]:
+                return handlers.load(INVENTORY_MANAGER).subscribe(policy)(store)
+
+            @functools.wraps(fn)
+            def wrapper(self_: Any, tctx: Any, root: Any, service: Any, proplist: Any) -> Any:
+                name = getattr(service, ref)
+                if name:
+                    view = self.cache.get(tctx.th, (name, service_type))
+                    if view is not None:
+                        return fn(self_, tctx, root, service, proplist, view)
+                return resolver()(self_, tctx, root, service, proplist)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def publish(fn: Callable[..., Any]) -> Callable[..., Any]:
+        '''InventoryManager.publish, applied on the first call'''
+
+        @functools.lru_cache(maxsize=None)
+        def published() -> Callable[..., Any]:
+            return handlers.load(INVENTORY_MANAGER).publish(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            return published()(*args, **kwargs)
+        return wrapper
+
+    def invalidate(self, name: str, service_type: str) -> None:
+        '''Drop the views of an inventory entry, in every transaction'''
+
+        dropped = self.cache.invalidate(lambda key: key == (name, service_type))
+        if dropped:
+            logging.info(f"inventory {service_type} {name}: {dropped} cached resolution(s) dropped")
+
+
+inventory_cache = InventoryCache()
@@ -0,0 +1,110 @@
+import functools
+import json
+import logging
+from typing import Any, Callable, Optional
+
+import ncs
+
+from ..inventory_cache import inventory_cache
+from ..registry import handlers
+from ..ressources import REFS_POLICY
+
+# proplist entries of the device service holding the proplist of each entry
+PROP_ENTRY = "isis-entry "
+
+# entry lists a device service renders (instances first, as they are committed)
+ENTRY_KINDS = ("instance", "interface")
+
+
+def aggregated(service: ncs.maagic.ListElement) -> bool:
+    '''True when the device of an instance/interface entry is in aggregate mode'''
+
+    return bool(service._parent._parent.aggregate.exists())
+
+
+def unless_aggregated(fn: Callable[..., Any]) -> Callable[..., Any]:
+    '''cb_create wrapper leaving the entries of an aggregated device to its device service'''
+
+    @functools.wraps(fn)
+    def wrapper(self_: Any, tctx: Any, root: Any, service: Any, proplist: Any) -> Any:
+        if aggregated(service):
+            logging.info(f"{service._path} rendered by the aggregate service of its device")
+            return []
+        return fn(self_, tctx, root, service, proplist)
+    return wrapper
+
+
+def _entry_key(kind: str, entry: ncs.maagic.ListElement) -> str:
+    return f"{kind} {entry.instance_id if kind == 'instance' else entry.name}"
+
+
+class IsisDeviceService:
+    '''Renders every instance and interface of an isis device in one create
+
+    The inputs are the usual instance/interface lists: each entry goes
+    through its own handler (inventory, fingerprint, NED branch), but
+    FASTMAP tracks a single service per device, so one set of
+    backpointers and refcounts instead of one per entry.
+    '''
+
+    def __init__(
+        self,
+        service: ncs.maagic.Container,
+        proplist: Optional[list[tuple[str, str]]] = None,
+    ) -> None:
+        self.ncs_service = service
+        self.isis = service._parent
+        self.proplist = list(proplist or [])
+
+    @inventory_cache.subscribe(REFS_POLICY, "instance")
+    def instance(self, tctx: Any, root: Any, service: Any, proplist: Any, inventory: Any) -> list[tuple[str, str]]:
+        service_class = handlers.handler("instance", service.inventory_logic.name)
+        handler = service_class(service=service, inventory_data=inventory, proplist=proplist)
+        handler.apply()
+        return handler.proplist
+
+    @inventory_cache.subscribe(REFS_POLICY, "interface")
+    def interface(self, tctx: Any, root: Any, service: Any, proplist: Any, inventory: Any) -> list[tuple[str, str]]:
+        service_class = handlers.handler("interface", service.inventory_logic.name)
+        handler = service_class(service=service, inventory_data=inventory, proplist=proplist)
+        handler.apply()
+        return handler.proplist
+
+    def _entry_proplists(self) -> dict[str, list[tuple[str, str]]]:
+        return {
+            name[len(PROP_ENTRY):]: [tuple(prop) for prop in json.loads(value)]
+            for name, value in self.proplist
+            if name.startswith(PROP_ENTRY)
+        }
+
+    def add_kickers(self, root: ncs.maagic.Root) -> None:
+        '''Re-deploy the device service when one of its entries changes
+
+        The entries are outside the service subtree, a data kicker per
+        list (created by this service, so removed with it) brings them in.
+        '''
+
+        device = str(self.isis.device)
+        for kind in ENTRY_KINDS:
+            kicker = root.kickers.data_kicker.create(f"isis-aggregate-{device}-{kind}")
+            kicker.monitor = f"/rfs:rfs/bytel-isis:isis[bytel-isis:device='{device}']/bytel-isis:{kind}"
+            kicker.kick_node = f"/rfs:rfs/bytel-isis:isis[bytel-isis:device='{device}']/bytel-isis:aggregate"
+            kicker.action_name = "reactive-re-deploy"
+
+    def apply(self, tctx: Any, root: ncs.maagic.Root) -> None:
+        previous = self._entry_proplists()
+        proplist = [(name, value) for name, value in self.proplist if not name.startswith(PROP_ENTRY)]
+
+        for kind in ENTRY_KINDS:
+            render = getattr(self, kind)
+            for entry in getattr(self.isis, kind):
+                key = _entry_key(kind, entry)
+                try:
+                    result = render(tctx, root, entry, previous.get(key, []))
+                except Exception:
+                    logging.error(f"ISIS device {self.isis.device}: {key} failed")
+                    raise
+                proplist.append((f"{PROP_ENTRY}{key}", json.dumps(result, separators=(",", ":"))))
+
+        self.add_kickers(root)
+        self.proplist = proplist
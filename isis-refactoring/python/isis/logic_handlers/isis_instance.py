@@ -1,12 +1,17 @@
-import logging
-from typing import Any
+from typing import TYPE_CHECKING, Any, Mapping, Optional
 
 import ncs
 from rfs.generic import GenericService
-from sdn_nso_lib.ncs_utils.template import J2NSOTemplate
 
-from .. import utils
+from .. import fingerprint, flatten, stats
+from ..model import IsisInstanceInput, with_values
+from ..registry import handlers
 from ..ressources import REFS_POLICY
+from ..tracing import tracer
+
+if TYPE_CHECKING:
+    # jinja is only imported by the first template (see registry)
+    from sdn_nso_lib.ncs_utils.template import J2NSOTemplate
 
 class DeviceError(Exception):
     """Generic error communicating with device."""
@@ -20,6 +25,7 @@ class IsisInstanceService(GenericService):
         self,
         service: ncs.maagic.ListElement,
         inventory_data: dict[str, Any],
+        proplist: Optional[list[tuple[str, str]]] = None,
     ) -> None:
         
         super().__init__(
@@ -28,6 +34,9 @@ class IsisInstanceService(GenericService):
             device_name_path="../device",
             template_ref=REFS_POLICY["leafref"][0],
         )
+        self.proplist = list(proplist or [])
+        self.applied: fingerprint.Applied = []
+        self.model: Optional[IsisInstanceInput] = None
 
 #################################################################
 #   Definition des methode generiques au fournisseurs           #
@@ -35,69 +44,76 @@ class IsisInstanceService(GenericService):
 
     def add_all_vars(
         self,
-        data_list: dict[str, Any],
+        data_list: Mapping[str, Any],
         prefix: str,
-        template_handler: J2NSOTemplate,
+        template_handler: "J2NSOTemplate",
     ) -> None:
 
         isis_common_vars = {
             "DEVICE": self.device.name,
-            "INSTANCE_ID": self.ncs_service.instance_id,
+            "INSTANCE_ID": self.model.instance_id,
         }
-        logging.info(isis_common_vars)
         template_handler.add_dict(isis_common_vars)
 
-        for var, val in data_list.items():
-   
-            if not isinstance(val, (dict, list, tuple, set)):
-                if prefix == "":
-                    new_prefix = var.upper()
-                else:
-                    new_prefix = f"{prefix}_{var.upper()}"
-
-                if isinstance(val, bool):
-                    vale = "true" if val else "false"
-                else:
-                    vale = val
-
-                template_handler.add(new_prefix, vale, j2_data=self.j2_data)
-                logging.info(f'{new_prefix} :  {vale}')
-       
-
-            if isinstance(val, dict):
-                if prefix == "":
-                    new_prefix = var.upper()
-                else:
-                    new_prefix = f"{prefix}_{var.upper()}"
-                self.add_all_vars(val, new_prefix, template_handler)
+        variables = flatten.flatten(data_list, prefix)
+        template_handler.add_dict(variables)
+
+    def _new_template(self) -> "J2NSOTemplate":
+        template = handlers.template(self.ncs_service, j2_filters=self.j2_filters)
+        return fingerprint.RecordingTemplate(template, self.applied)
 
 #################################################################
 #      specific methods                                         #
 #################################################################
 
+    # template variables set by add_all_vars besides the flattened data,
+    # then the ones each apply_* method adds, per template it applies
+    common_variables = ("DEVICE", "INSTANCE_ID")
+    template_variables = {
+        "alu-sr-cli/alu-sr-cli-isis-instance-template": (
+            "SR", "SR_LOWER_BOUND", "SR_UPPER_BOUND", "DISABLE_SYNC_LDP", "EXPORT", "EXPORT_TUNNEL_TABLE",
+        ),
+        "cisco-iosxr-cli/cisco-iosxr-cli-isis-instance-template": (
+            "SR", "SR_LOWER_BOUND", "SR_UPPER_BOUND", "LDP", "MPLS", "MPLS_SR_PREFER", "DIST_LINK_STATE",
+        ),
+        "huawei-vrp-cli/huawei-vrp-cli-isis-instance-template": (
+            "SR", "SR_LOWER_BOUND", "SR_UPPER_BOUND", "FAST_REROUTE_TI_LFA_LEVEL",
+        ),
+    }
+
     mandatory_leaves = {
         "cisco": ["area_id", "loopback0"],
         "nokia": ["area_id", "loopback0"],
         "huawei": ["area_id", "loopback0"],
     }
 
-    def _prepare_common_data(self) -> dict[str, Any]:
+    ned_keys = {"cisco-iosxr-cli": "cisco", "alu-sr-cli": "nokia", "huawei-vrp-cli": "huawei"}
 
-        data: dict[str, Any] = dict(self.data)
+    def _missing_leaves(self, ned: str) -> list[str]:
+        return [
+            f"{leaf} must be configured for ISIS instance "f"{self.model.instance_id}"
+            for leaf in self.mandatory_leaves[ned]
+            if getattr(self.model, leaf) is None
+        ]
 
-        if "net_id" not in data:
-            loopback = data.get("loopback0")
-            area_id = data.get("area_id")
-            if loopback and area_id:
-                data["net_id"] = utils.generate_net_id(loopback, area_id)
-        return data
-    
-  
-    def _add_sr_vars(self, data, tpl):
-       sr = data.get("sr") or {}
-       tpl.add("SR", "True" if sr else "False", j2_data=self.j2_data)
-       tpl.add("SR_LOWER_BOUND", sr.get("lower_bound") or "", j2_data=self.j2_data)
-       tpl.add("SR_UPPER_BOUND", sr.get("upper_bound") or "", j2_data=self.j2_data)
+    def _check_mandatory_leaves(self, ned: str) -> None:
+        missing = self._missing_leaves(ned)
+        if missing:
+            raise ServiceInputError("; ".join(missing))
+
+    def validate(self) -> list[str]:
+        '''Every input problem of the service, found without creating it'''
+
+        self.model = IsisInstanceInput.build(self.ncs_service.instance_id, self.data)
+        ned = self.ned_keys.get(self.device.ned_type)
+        if ned is None:
+            return [f"NED {self.device.ned_type} not supported for ISIS instance"]
+        return self._missing_leaves(ned)
+
+    def _add_sr_vars(self, tpl):
+       tpl.add("SR", "True" if self.model.sr else "False", j2_data=self.j2_data)
+       tpl.add("SR_LOWER_BOUND", self.model.sr_lower_bound, j2_data=self.j2_data)
+       tpl.add("SR_UPPER_BOUND", self.model.sr_upper_bound, j2_data=self.j2_data)
 
 #################################################################
 #   Methodes specifiques ALUSR                                  #
@@ -105,25 +121,24 @@ class IsisInstanceService(GenericService):
 
     def apply_nokia(self) -> None:
         ned = "nokia"
-        for leaf in self.mandatory_leaves[ned]:
-            value = self.data.get(leaf)
-            if value is None:
-                raise ServiceInputError(f"{leaf} must be configured for ISIS instance "f"{self.ncs_service.instance_id}")
+        self._check_mandatory_leaves(ned)
         self.apply_alusr_isis_instance()
 
     def apply_alusr_isis_instance(self) -> None:
-        data = self._prepare_common_data()
-        tpl = J2NSOTemplate(self.ncs_service, j2_filters=self.j2_filters)
+        model = self.model
+        tpl = self._new_template()
 
-        self.add_all_vars(data, "", tpl)
+        with stats.registry.phase("vars"):
+            self.add_all_vars(model.data, "", tpl)
 
-        self._add_sr_vars(data, tpl)
+        self._add_sr_vars(tpl)
 
-        tpl.add("DISABLE_SYNC_LDP", "True" if data.get("disable_sync_ldp") else "False", j2_data=self.j2_data)
-        tpl.add("EXPORT", data.get("export") or "None", j2_data=self.j2_data)
-        tpl.add("EXPORT_TUNNEL_TABLE", data.get("export_tunnel_table") or "None", j2_data=self.j2_data)
+        tpl.add("DISABLE_SYNC_LDP", "True" if model.disable_sync_ldp else "False", j2_data=self.j2_data)
+        tpl.add("EXPORT", model.export or "None", j2_data=self.j2_data)
+        tpl.add("EXPORT_TUNNEL_TABLE", model.export_tunnel_table or "None", j2_data=self.j2_data)
 
-        tpl.apply("alu-sr-cli/alu-sr-cli-isis-instance-template")
+        with stats.registry.phase("apply"):
+            tpl.apply("alu-sr-cli/alu-sr-cli-isis-instance-template")
 
 
 #################################################################
@@ -132,30 +147,26 @@ class IsisInstanceService(GenericService):
 
     def apply_cisco(self) -> None:
         ned = "cisco"
-        for leaf in self.mandatory_leaves[ned]:
-            value = self.data.get(leaf)
-            if value is None:
-                raise ServiceInputError(f"{leaf} must be configured for ISIS instance "f"{self.ncs_service.instance_id}")
+        self._check_mandatory_leaves(ned)
         self.apply_iosxr_isis_instance()
 
     def apply_iosxr_isis_instance(self) -> None:
-        data = self._prepare_common_data()
+        model = self.model
 
-        logging.info("SELF.DATA -> %r" , data)
+        tpl = self._new_template()
+        with stats.registry.phase("vars"):
+            self.add_all_vars(model.data, "", tpl)
 
-        tpl = J2NSOTemplate(self.ncs_service, j2_filters=self.j2_filters)
-        self.add_all_vars(data, "", tpl)
+        self._add_sr_vars(tpl)
 
-        self._add_sr_vars(data, tpl)
+        tpl.add("LDP", "True" if model.ldp else "False", j2_data=self.j2_data)
 
-        ldp_enabled = isinstance(data.get("ldp"), dict) or data.get("ldp") is True
-        tpl.add("LDP", "True" if ldp_enabled else "False", j2_data=self.j2_data)
+        tpl.add("MPLS", "True" if model.mpls else "False", j2_data=self.j2_data)
+        tpl.add("MPLS_SR_PREFER", "True" if model.mpls_sr_prefer else "False", j2_data=self.j2_data)
+        tpl.add("DIST_LINK_STATE", "True" if model.dist_link_state else "False", j2_data=self.j2_data)
 
-        tpl.add("MPLS", "True" if data.get("mpls") else "False", j2_data=self.j2_data)
-        tpl.add("MPLS_SR_PREFER", "True" if data.get("mpls_sr_prefer") else "False", j2_data=self.j2_data)
-        tpl.add("DIST_LINK_STATE", "True" if data.get("dist_link_state") else "False", j2_data=self.j2_data)
-
-        tpl.apply("cisco-iosxr-cli/cisco-iosxr-cli-isis-instance-template")
+        with stats.registry.phase("apply"):
+            tpl.apply("cisco-iosxr-cli/cisco-iosxr-cli-isis-instance-template")
 
 #################################################################
 #   Methodes specifiques huawei-vrp                             #
@@ -164,28 +175,25 @@ class IsisInstanceService(GenericService):
     def apply_huawei(self) -> None:
         
         ned = "huawei"
-        for leaf in self.mandatory_leaves[ned]:
-            value = self.data.get(leaf)
-            if value is None:
-                raise ServiceInputError(f"{leaf} must be configured for ISIS instance "f"{self.ncs_service.instance_id}")
+        self._check_mandatory_leaves(ned)
         self.apply_huawei_isis_instance()
 
     def apply_huawei_isis_instance(self) -> None:
-        data = self._prepare_common_data()
-
-        if "is_name" not in data:
-            data["is_name"] = self.device.name
-
-        tpl = J2NSOTemplate(self.ncs_service, j2_filters=self.j2_filters) 
-        self.add_all_vars(data, "", tpl)
+        model = self.model
+        data = model.data
+        if model.is_name is None:
+            data = with_values(data, is_name=self.device.name)
+
+        tpl = self._new_template() 
+        with stats.registry.phase("vars"):
+            self.add_all_vars(data, "", tpl)
                 
-        self._add_sr_vars(data, tpl)
+        self._add_sr_vars(tpl)
         
-        fr = data.get("fast_reroute") or {}
-        ti_lfa_level = fr.get("ti_lfa_level") or ""
-        tpl.add( "FAST_REROUTE_TI_LFA_LEVEL", ti_lfa_level, j2_data=self.j2_data)
+        tpl.add( "FAST_REROUTE_TI_LFA_LEVEL", model.ti_lfa_level, j2_data=self.j2_data)
 
-        tpl.apply("huawei-vrp-cli/huawei-vrp-cli-isis-instance-template")
+        with stats.registry.phase("apply"):
+            tpl.apply("huawei-vrp-cli/huawei-vrp-cli-isis-instance-template")
         
 #################################################################
 # Methodes apply                                                #
@@ -194,7 +202,20 @@ class IsisInstanceService(GenericService):
     def apply(self) -> None:
 
         ned = self.device.ned_type
-        logging.info(ned)
+        stats.registry.set_ned(ned)
+
+        with stats.registry.phase("fingerprint"):
+            digest = fingerprint.of_inputs(ned, str(self.ncs_service._path), self.data)
+            previous = fingerprint.previous(self.proplist, digest)
+        if previous is not None:
+            tracer.annotate(ned=ned, applied=previous, replayed=True)
+            with stats.registry.phase("apply"):
+                fingerprint.replay(self.ncs_service, self.j2_filters, previous)
+            return
+
+        with stats.registry.phase("prepare"):
+            self.model = IsisInstanceInput.build(self.ncs_service.instance_id, self.data)
+
         if ned == "cisco-iosxr-cli":
             self.apply_cisco()
         elif ned == "alu-sr-cli":
@@ -203,3 +224,6 @@ class IsisInstanceService(GenericService):
             self.apply_huawei()
         else:
             raise NotImplementedError(f"NED {ned} not supported for ISIS instance")
+
+        tracer.annotate(ned=ned, applied=self.applied)
+        self.proplist = fingerprint.record(self.proplist, digest, self.applied)
@@ -1,12 +1,20 @@
-import logging
-from typing import Any
+from typing import TYPE_CHECKING, Any, Mapping, Optional
 
 import ncs
 from rfs.generic import GenericService
-from sdn_nso_lib.ncs_utils.template import J2NSOTemplate
 
-from .. import utils
-from ..ressources import REFS_POLICY
+from .. import fingerprint, flatten, interface_index, sid_pool, stats, utils
+from ..actions.selection import ServiceRef
+from ..model import IsisInterfaceInput, with_values
+from ..registry import handlers
+from ..ressources import NEDS, REFS_POLICY
+from ..sid_pool import sid_pools
+from ..tracing import tracer
+from ..uniqueness import sid_claim, uniqueness_index
+
+if TYPE_CHECKING:
+    # jinja is only imported by the first template (see registry)
+    from sdn_nso_lib.ncs_utils.template import J2NSOTemplate
 
 
 class DeviceError(Exception):
@@ -21,6 +29,7 @@ class IsisInterfaceService(GenericService):
         self,
         service: ncs.maagic.ListElement,
         inventory_data: dict[str, Any],
+        proplist: Optional[list[tuple[str, str]]] = None,
     ) -> None:
         
         super().__init__(
@@ -29,7 +38,10 @@ class IsisInterfaceService(GenericService):
             device_name_path="../device",
             template_ref=REFS_POLICY["leafref"][0],
         )
+        self.proplist = list(proplist or [])
+        self.applied: fingerprint.Applied = []
         self.root = ncs.maagic.get_root(service)
+        self.model: Optional[IsisInterfaceInput] = None
 
 #################################################################
 #   Definition des methode generiques au fournisseurs           #
@@ -37,112 +49,141 @@ class IsisInterfaceService(GenericService):
 
     def add_all_vars(
         self,
-        data_list: dict[str, Any],
+        data_list: Mapping[str, Any],
         prefix: str,
-        template_handler: J2NSOTemplate,
+        template_handler: "J2NSOTemplate",
     ) -> None:
 
-        merged_interface_type = self.data.get("interface_type", self.ncs_service.interface_type)
-        merged_instance_id = self.data.get("isis_instance_id", self.ncs_service.isis_instance_id)
-
         isis_interface_common_vars = {
             "DEVICE": self.device.name,
-            "INTERFACE_NAME": self.ncs_service.name,
-            "INTERFACE_TYPE": merged_interface_type,
-            "INSTANCE_ID": merged_instance_id,
+            "INTERFACE_NAME": self.model.name,
+            "INTERFACE_TYPE": self.model.interface_type,
+            "INSTANCE_ID": self.model.instance_id,
         }
 
-        logging.info(isis_interface_common_vars)
         template_handler.add_dict(isis_interface_common_vars)
 
-        for var, val in data_list.items():
-            if var == "passwd":
-               continue 
-
-        for var, val in data_list.items():
-
-            if not isinstance(val, (dict, list, tuple, set)):
-                if prefix == "":
-                    new_prefix = var.upper()
-                else:
-                    new_prefix = f"{prefix}_{var.upper()}"
+        variables = flatten.flatten(data_list, prefix)
+        template_handler.add_dict(variables)
 
-                if isinstance(val, bool):
-                    vale = "true" if val else "false"
-                else:
-                    vale = val
-
-                template_handler.add(new_prefix, vale, j2_data=self.j2_data)
-                logging.info(f"{new_prefix} :  {vale}")
-
-            if isinstance(val, dict):
-                if prefix == "":
-                    new_prefix = var.upper()
-                else:
-                    new_prefix = f"{prefix}_{var.upper()}"
-                self.add_all_vars(val, new_prefix, template_handler)
+    def _new_template(self) -> "J2NSOTemplate":
+        template = handlers.template(self.ncs_service, j2_filters=self.j2_filters)
+        return fingerprint.RecordingTemplate(template, self.applied)
 
 #################################################################
 #      specific methods                                         #
 #################################################################
 
-    def _prepare_common_data(self) -> dict[str, Any]:
-        data: dict[str, Any] = dict(self.data)
-
-        if "interface_type" not in data:
-            it = getattr(self.ncs_service, "interface_type", None)
-            if it not in (None, ""):
-                data["interface_type"] = str(it)
-
-        if "isis_instance_id" not in data:
-            inst = getattr(self.ncs_service, "isis_instance_id", None)
-            if inst not in (None, ""):
-                data["isis_instance_id"] = str(inst)
-
+    # template variables set by add_all_vars besides the flattened data,
+    # then the ones each apply_* method adds, per template it applies
+    common_variables = ("DEVICE", "INTERFACE_NAME", "INTERFACE_TYPE", "INSTANCE_ID")
+    template_variables = {
+        "alu-sr-cli/alu-sr-cli-isis-interface-common-template": ("PASSWD",),
+        "alu-sr-cli/alu-sr-cli-isis-interface-loopback-template": (
+            "PASSWD", "NAME", "LOOPBACK_SR_ID", "LOOPBACK_UNICAST_TAG",
+        ),
+        "cisco-iosxr-cli/cisco-iosxr-cli-isis-interface-common-template": ("PASSWD", "ENABLE_SYNC_LDP"),
+        "cisco-iosxr-cli/cisco-iosxr-cli-isis-interface-loopback-template": (
+            "PASSWD", "NAME", "LOOPBACK_SR_ID", "LOOPBACK_UNICAST_TAG", "ENABLE_SYNC_LDP",
+        ),
+        "huawei-vrp-cli/huawei-vrp-cli-isis-interface-common-template": ("IF_ATTR_TYPE", "NAME"),
+        "huawei-vrp-cli/huawei-vrp-cli-isis-interface-loopback-template": ("LOOPBACK_ID", "LOOPBACK_UNICAST_TAG"),
+    }
+
+    def _input_problems(self) -> list[str]:
+        model = self.model
+        problems = []
         missing = []
-        if not data.get("interface_type"):
+        if not model.interface_type:
             missing.append("interface-type")
-        if not data.get("isis_instance_id"):
+        if not model.instance_id:
             missing.append("isis-instance-id")
-
         if missing:
-            raise ServiceInputError("Missing mandatory leaves for ISIS interface "f"(must be set in service or inventory): {', '.join(missing)}")
-
-        self.data = data
-        return data
-
-    def _template_suffix(self) -> str:
-        interface_type = self.data.get("interface_type")
-        if str(interface_type) == "loopback":
-            return "loopback"
-        return "common"
-
-    def _get_loopback_attribs(self, data: dict[str, Any]) -> dict[str, Any]:
-        loopback_data = (data.get("loopback_attribs")or data.get("loopback-attribs")or {})
-        
-        sr_id = (loopback_data.get("sr_id")or loopback_data.get("sr-id"))
-        loopback_id = (loopback_data.get("loopback_id")or loopback_data.get("loopback-id"))
-        unicast_tag = (loopback_data.get("unicast_tag")or loopback_data.get("unicast-tag"))
-
-        if sr_id is None and unicast_tag is None and loopback_id is None:
-            loopback = getattr(self.ncs_service, "loopback_attribs", None)
-            if loopback is not None and loopback.exists():
-                sr_id = getattr(loopback, "sr_id", None)
-                loopback_id = getattr(loopback, "loopback_id", None)
-                unicast_tag = getattr(loopback, "unicast_tag", None)
-
-        return {
-            "sr_id": sr_id,
-            "loopback_id": loopback_id,
-            "unicast_tag": unicast_tag
-        }
-
-    def _add_loopback_vars(self, tpl: J2NSOTemplate, data: dict[str, Any]) -> None:
-        tpl.add("NAME", self.ncs_service.name, j2_data=self.j2_data)
-        attribs = self._get_loopback_attribs(data)
-
-        tpl.add("LOOPBACK_SR_ID",str(attribs["sr_id"]) if attribs["sr_id"] is not None else "None",j2_data=self.j2_data)
-        tpl.add("LOOPBACK_UNICAST_TAG",str(attribs["unicast_tag"]) if attribs["unicast_tag"] is not None else "None",j2_data=self.j2_data)
+            problems.append("Missing mandatory leaves for ISIS interface "f"(must be set in service or inventory): {', '.join(missing)}")
+
+        if self.device.ned_type == "huawei-vrp-cli":
+            if model.template_suffix == "common":
+                if model.if_id is None or model.if_type is None:
+                    problems.append("Please provide common-attributes to the service (id, type or subif-id)")
+                elif model.if_type != "LAG":
+                    problems.append("Template must be updated to manage ISIS on physical interfaces")
+            elif model.loopback_id is None:
+                problems.append("Please provide loopback-id in loopback-attribs for Huawei loopback interface")
+
+        missing = interface_index.missing_interface(self.root, self.device.name, self.device.ned_type, model)
+        if missing is not None:
+            problems.append(f"Interface {missing} not found on device {self.device.name}")
+        return problems
+
+    def _check_mandatory_leaves(self) -> None:
+        problems = self._input_problems()
+        if problems:
+            raise ServiceInputError("; ".join(problems))
+
+    # NEDs whose loopback template sets the prefix SID (LOOPBACK_SR_ID)
+    sid_neds = ("cisco-iosxr-cli", "alu-sr-cli")
+
+    # False for the handlers that only compute the intent (audit)
+    allocate_sids = True
+
+    def _needs_sid(self, model: IsisInterfaceInput) -> bool:
+        return model.sr_id is None and model.template_suffix == "loopback" and self.device.ned_type in self.sid_neds
+
+    def _held_sr_id(self) -> Optional[int]:
+        owner = str(self.ncs_service._path)
+        held = (
+            sid_pool.pending(ncs.maagic.get_trans(self.root).th).owned(owner)
+            or sid_pools.owned(owner)
+            or sid_pool.from_proplist(self.proplist)
+        )
+        return None if held is None else held[1]
+
+    def _sr_id(self, model: IsisInterfaceInput) -> Optional[int]:
+        '''Prefix SID of a loopback without sr-id, from the pool of its ISIS domain'''
+
+        if not self._needs_sid(model):
+            return None
+        if not self.allocate_sids:
+            return self._held_sr_id()
+        srgb = sid_pool.srgb(self.root, self.ncs_service._parent._parent, model.instance_id)
+        if srgb is None:
+            return None
+        if not sid_pools.complete:
+            sid_pools.rebuild(sid_pool.pool_entries(self.root))
+
+        domain = srgb[0]
+        owner = str(self.ncs_service._path)
+        ref = ServiceRef("interface", self.device.name, str(self.ncs_service.name))
+
+        def taken(sid: int) -> bool:
+            if sid_pool.entry_owner(self.root, domain, sid) not in (None, owner):
+                return True
+            return any(other != ref for other in uniqueness_index.holders(sid_claim(domain, sid)))
+
+        pending = sid_pool.pending(ncs.maagic.get_trans(self.root).th)
+        sid = sid_pools.allocate(owner, srgb, pending, sid_pool.from_proplist(self.proplist), taken)
+        # written by the create: FASTMAP removes it with the service, and
+        # SidPoolSubscriber marks the SID used once it is committed
+        sid_pool.persist(self.root, domain, sid, owner)
+        self.proplist = sid_pool.to_proplist(self.proplist, domain, sid)
+        return sid
+
+    def validate(self) -> list[str]:
+        '''Every input problem of the service, found without creating it'''
+
+        self.model = IsisInterfaceInput.build(self.ncs_service, self.data)
+        if self._needs_sid(self.model):
+            self.model = IsisInterfaceInput.build(self.ncs_service, self.data, self._held_sr_id())
+        if self.device.ned_type not in NEDS:
+            return [f"NED {self.device.ned_type} not supported for ISIS interface"]
+        return self._input_problems()
+
+    def _add_loopback_vars(self, tpl: "J2NSOTemplate") -> None:
+        model = self.model
+        tpl.add("NAME", model.name, j2_data=self.j2_data)
+
+        tpl.add("LOOPBACK_SR_ID",str(model.sr_id) if model.sr_id is not None else "None",j2_data=self.j2_data)
+        tpl.add("LOOPBACK_UNICAST_TAG",str(model.unicast_tag) if model.unicast_tag is not None else "None",j2_data=self.j2_data)
 
 
 #################################################################
@@ -150,110 +191,94 @@ class IsisInterfaceService(GenericService):
 #################################################################
 
     def apply_nokia(self) -> None:
-        data = self._prepare_common_data()
-
-        tpl = J2NSOTemplate(self.ncs_service, j2_filters=self.j2_filters)
-        self.add_all_vars(data, "", tpl)
+        model = self.model
+        tpl = self._new_template()
+        with stats.registry.phase("vars"):
+            self.add_all_vars(model.data, "", tpl)
 
-        passwd = data.get("passwd") or getattr(self.ncs_service, "passwd", None)
-        if passwd:
-            tpl.add("PASSWD", passwd, j2_data=self.j2_data)
+        if model.passwd:
+            tpl.add("PASSWD", model.passwd, j2_data=self.j2_data)
         else:
             tpl.add("PASSWD", "None", j2_data=self.j2_data)
 
-        suffix = self._template_suffix()
+        suffix = model.template_suffix
 
         if suffix == "loopback":
-            self._add_loopback_vars(tpl, data)
+            self._add_loopback_vars(tpl)
   
-        tpl.apply(f"alu-sr-cli/alu-sr-cli-isis-interface-{suffix}-template")
+        with stats.registry.phase("apply"):
+            tpl.apply(f"alu-sr-cli/alu-sr-cli-isis-interface-{suffix}-template")
 
 ##################################################################
 #   Methodes specifiques IOSXR                                  #
 ##################################################################
 
     def apply_iosxr(self) -> None:
-        data = self._prepare_common_data()
-        logging.info("SELF.DATA -> %r" , data)
+        model = self.model
 
-        tpl = J2NSOTemplate(self.ncs_service, j2_filters=self.j2_filters)
-        self.add_all_vars(data, "", tpl)
+        tpl = self._new_template()
+        with stats.registry.phase("vars"):
+            self.add_all_vars(model.data, "", tpl)
 
-        passwd = data.get("passwd") or getattr(self.ncs_service, "passwd", None)
-        if passwd:
-            encrypted = utils.generate_isis_passwd(self.root,passwd,self.device.name,self.ncs_service.name)
+        if model.passwd:
+            with stats.registry.phase("passwd"):
+                encrypted = utils.generate_isis_passwd(
+                    self.root, model.passwd, self.device.name, model.name, model.instance_id
+                )
             tpl.add("PASSWD", encrypted, j2_data=self.j2_data)
         else:
             tpl.add("PASSWD", "None", j2_data=self.j2_data)   
 
-        suffix = self._template_suffix()
+        suffix = model.template_suffix
         if suffix == "loopback":
-            self._add_loopback_vars(tpl, data)
+            self._add_loopback_vars(tpl)
 
-        tpl.add("ENABLE_SYNC_LDP", "True" if data.get("enable_sync_ldp") else "False", j2_data=self.j2_data)
+        tpl.add("ENABLE_SYNC_LDP", "True" if model.enable_sync_ldp else "False", j2_data=self.j2_data)
 
-        tpl.apply(f"cisco-iosxr-cli/cisco-iosxr-cli-isis-interface-{suffix}-template")
+        with stats.registry.phase("apply"):
+            tpl.apply(f"cisco-iosxr-cli/cisco-iosxr-cli-isis-interface-{suffix}-template")
 
 #################################################################
 #   Methodes specifiques huawei-vrp                             #
 #################################################################
 
     def apply_huawei(self) -> None:
-        data = self._prepare_common_data()
+        model = self.model
+        data = model.data
+        if model.circuit_type == "level-2-only":
+            data = with_values(data, circuit_type="level-2")
 
-        circuit_type = data.get("circuit_type")
-        if circuit_type == "level-2-only":
-            data["circuit_type"] = "level-2"
+        tpl = self._new_template()
+        with stats.registry.phase("vars"):
+            self.add_all_vars(data, "", tpl)
 
-        tpl = J2NSOTemplate(self.ncs_service, j2_filters=self.j2_filters)
-        self.add_all_vars(data, "", tpl)
-
-        suffix = self._template_suffix()
+        suffix = model.template_suffix
 
         if suffix == "common":
-            common_data = (data.get("common_attributes") or data.get("common-attributes")  or {} )
-
-            interface_id = common_data.get("id")
-            interface_subif_id = ( common_data.get("subif_id") or common_data.get("subif-id") )
-            if_attr_type = common_data.get("type")
-
-            common_attr = getattr(self.ncs_service, "common_attributes", None)
-            if (interface_id is None or if_attr_type is None) and common_attr is not None and common_attr.exists():
-                if_attr_type = if_attr_type or common_attr.type
-                interface_id = interface_id or common_attr.id
-                if interface_subif_id is None:
-                    interface_subif_id = common_attr.subif_id
-
-            if interface_id is None or if_attr_type is None:
-                raise ServiceInputError( "Please provide common-attributes to the service (id, type or subif-id)")
-
-            if if_attr_type != "LAG":
-                raise ServiceInputError("Template must be updated to manage ISIS on physical interfaces")
-
+            # common-attributes already checked in the prepare phase
+            interface_id, if_attr_type, interface_subif_id = model.if_id, model.if_type, model.subif_id
             interface_name = ( f"{interface_id}.{interface_subif_id}" if interface_subif_id is not None else interface_id )
 
             tpl.add("IF_ATTR_TYPE", if_attr_type, j2_data=self.j2_data)
             tpl.add("NAME", interface_name, j2_data=self.j2_data)
 
-            tpl.apply("huawei-vrp-cli/huawei-vrp-cli-isis-interface-common-template")
+            with stats.registry.phase("apply"):
+                tpl.apply("huawei-vrp-cli/huawei-vrp-cli-isis-interface-common-template")
             return
 
         elif suffix == "loopback":
-            attribs = self._get_loopback_attribs(data)
-            
-            loopback_id = attribs["loopback_id"]
-            unicast_tag = attribs["unicast_tag"]
-
-            if loopback_id is None:
-                raise ServiceInputError("Please provide loopback-id in loopback-attribs for Huawei loopback interface")
+            loopback_id = model.loopback_id
+            unicast_tag = model.unicast_tag
 
             tpl.add("LOOPBACK_ID", str(loopback_id), j2_data=self.j2_data)
             tpl.add("LOOPBACK_UNICAST_TAG",str(unicast_tag) if unicast_tag is not None else "None", j2_data=self.j2_data)
 
-            tpl.apply("huawei-vrp-cli/huawei-vrp-cli-isis-interface-loopback-template")
+            with stats.registry.phase("apply"):
+                tpl.apply("huawei-vrp-cli/huawei-vrp-cli-isis-interface-loopback-template")
             return
 
-        tpl.apply(f"huawei-vrp-cli/huawei-vrp-cli-isis-interface-{suffix}-template")
+        with stats.registry.phase("apply"):
+            tpl.apply(f"huawei-vrp-cli/huawei-vrp-cli-isis-interface-{suffix}-template")
 
 #################################################################
 # Methodes apply                                                #
@@ -261,7 +286,27 @@ class IsisInterfaceService(GenericService):
 
     def apply(self) -> None:
         ned = self.device.ned_type
-        logging.info(ned)
+        stats.registry.set_ned(ned)
+
+        with stats.registry.phase("prepare"):
+            self.model = IsisInterfaceInput.build(self.ncs_service, self.data)
+            sr_id = self._sr_id(self.model)
+            if sr_id is not None:
+                self.model = IsisInterfaceInput.build(self.ncs_service, self.data, sr_id)
+            # before the replay: the device interfaces are not in the fingerprint
+            self._check_mandatory_leaves()
+
+        with stats.registry.phase("fingerprint"):
+            # the allocated SID is an input: a new one (SRGB changed) renders again
+            data = self.data if sr_id is None else with_values(self.data, allocated_sr_id=sr_id)
+            digest = fingerprint.of_inputs(ned, str(self.ncs_service._path), data)
+            previous = fingerprint.previous(self.proplist, digest)
+        if previous is not None:
+            tracer.annotate(ned=ned, applied=previous, replayed=True)
+            with stats.registry.phase("apply"):
+                fingerprint.replay(self.ncs_service, self.j2_filters, previous)
+            return
+
         if ned == "cisco-iosxr-cli":
             self.apply_iosxr()
         elif ned == "alu-sr-cli":
@@ -269,4 +314,7 @@ class IsisInterfaceService(GenericService):
         elif ned == "huawei-vrp-cli":
             self.apply_huawei()
         else:
-            raise NotImplementedError(f"NED {ned} not supported for ISIS interface")
\ No newline at end of file
+            raise NotImplementedError(f"NED {ned} not supported for ISIS interface")
+
+        tracer.annotate(ned=ned, applied=self.applied)
+        self.proplist = fingerprint.record(self.proplist, digest, self.applied)
@@ -1,13 +1,20 @@
 # -*- mode: python; python-indent: 4 -*-
 
+from .startup import import_timer  # first, so that it times the imports below
+
+import time
 import ncs
 from typing import Any
 from ncs.application import Service
-from inventory_manager.api import InventoryManager
 from .ressources import REFS_POLICY
+from . import stats
+from .profiling import capture
+from .tracing import tracer
+from .dependencies import dependency_index
+from .inventory_cache import inventory_cache, service_type_of
+from .registry import TEMPLATE, handlers
 
-from .logic_handlers.isis_instance import IsisInstanceService 
-from .logic_handlers.isis_interface import IsisInterfaceService 
+from .logic_handlers.isis_device import unless_aggregated
 
 class DeviceError(Exception):
     """Generic error communicating with device."""
@@ -18,57 +25,80 @@ class ServiceInputError(Exception):
 class IsisInstance(Service):
     
     @Service.create  # type: ignore
-    @InventoryManager.subscribe(REFS_POLICY)  
+    @unless_aggregated
+    @capture.profile
+    @dependency_index.track("instance")
+    @tracer.trace("instance")
+    @stats.registry.measure("instance")
+    @inventory_cache.subscribe(REFS_POLICY, "instance")
     def cb_create(
         self,
         tctx: Any,
         root: ncs.maagic.Root,
         service: ncs.maagic.ListElement,
-        proplist: tuple[str, str],
+        proplist: list[tuple[str, str]],
         inventory: dict[str, Any],
-    ) -> None:
+    ) -> list[tuple[str, str]]:
+        stats.registry.phase_done("inventory")
 
-        specific_logics: dict[str, type[IsisInstanceService]] = {}
-        service_class: type[IsisInstanceService]
-        if service.inventory_logic.name in specific_logics:
-            service_class = specific_logics[service.inventory_logic.name]
-        else:
-            service_class = IsisInstanceService
+        service_class = handlers.handler("instance", service.inventory_logic.name)
         rfs_service = service_class(
-            service=service, inventory_data=inventory
+            service=service, inventory_data=inventory, proplist=proplist
         )
         rfs_service.apply()
+        return rfs_service.proplist
 
 
 
 class IsisInterface(Service):
     
     @Service.create  # type: ignore
-    @InventoryManager.subscribe(REFS_POLICY)  
+    @unless_aggregated
+    @capture.profile
+    @dependency_index.track("interface")
+    @tracer.trace("interface")
+    @stats.registry.measure("interface")
+    @inventory_cache.subscribe(REFS_POLICY, "interface")
     def cb_create(
         self,
         tctx: Any,
         root: ncs.maagic.Root,
         service: ncs.maagic.ListElement,
-        proplist: tuple[str, str],
+        proplist: list[tuple[str, str]],
         inventory: dict[str, Any],
-    ) -> None:
+    ) -> list[tuple[str, str]]:
+        stats.registry.phase_done("inventory")
 
-        specific_logics: dict[str, type[IsisInterfaceService]] = {}
-        service_class: type[IsisInterfaceService]
-        if service.inventory_logic.name in specific_logics:
-            service_class = specific_logics[service.inventory_logic.name]
-        else:
-            service_class = IsisInterfaceService
+        service_class = handlers.handler("interface", service.inventory_logic.name)
         rfs_service = service_class(
-            service=service, inventory_data=inventory
+            service=service, inventory_data=inventory, proplist=proplist
         )
         rfs_service.apply()
+        return rfs_service.proplist
+
+
+class IsisDevice(Service):
+
+    @Service.create  # type: ignore
+    @capture.profile
+    @dependency_index.track("device")
+    @tracer.trace("device")
+    @stats.registry.measure("device")
+    def cb_create(
+        self,
+        tctx: Any,
+        root: ncs.maagic.Root,
+        service: ncs.maagic.Container,
+        proplist: list[tuple[str, str]],
+    ) -> list[tuple[str, str]]:
+        rfs_service = handlers.handler("device")(service=service, proplist=proplist)
+        rfs_service.apply(tctx, root)
+        return rfs_service.proplist
 
 
 class IsisInventory(Service):
     @Service.create  # type: ignore
-    @InventoryManager.publish
+    @inventory_cache.publish
     def cb_create(
         self,
         tctx: Any,
@@ -76,7 +106,7 @@ class IsisInventory(Service):
         service: ncs.maagic.ListElement,
         proplist: tuple[str, str]
     ) -> None:
-        return 
+        inventory_cache.invalidate(service.name, service_type_of(service))
 
 
 # --------------------------------------------
@@ -88,11 +118,78 @@ class Main(ncs.application.Application):
     
     def setup(self) -> None:
         self.log.info("Main RUNNING")
-        
+        start = time.perf_counter()
+        # only needed now, not by the services above
+        from . import template_check
+        from .rendering import TemplateError
+        from .validation import IsisInputValidation
+        from .sid_pool import SidPoolSubscriber
+        from .effective import EffectiveSubscriber
+        from .push import Tracker
+        from .actions.aggregate import IsisAggregateDisable
+        from .actions.audit import IsisFleetAudit
+        from .actions.effective import IsisEffectiveRefresh
+        from .actions.importer import IsisFleetImport
+        from .actions.passwd import IsisPasswdRotation
+        from .actions.profile import IsisProfileCapture
+        from .actions.provision import IsisFleetProvision
+        from .actions.push import IsisPushPurge
+        from .actions.redeploy import IsisFleetRedeploy
+        from .actions.sid_pool import IsisSidRelease, IsisSidReserve
+        from .actions.stats import IsisStatsReset
+        from .actions.trace import IsisTraceSettings
+        from .dependencies import DependencySubscriber
+
+        import_timer.stop()
+        for line in import_timer.report():
+            self.log.info(line)
+
+        # templates parsed and checked now rather than by the first commit
+        problems = template_check.preload()
+        for problem in problems:
+            self.log.error(f"template check: {problem}")
+        if problems:
+            raise TemplateError(f"{len(problems)} isis template problem(s): {'; '.join(problems)}")
+        # the loader the handlers apply them with (jinja), not the first create
+        handlers.load(TEMPLATE)
+
         self.register_service("isis-instance-servicepoint", IsisInstance, "isis-instance")
         self.register_service("isis-interface-servicepoint", IsisInterface, "isis-interface")
+        self.register_service("isis-device-servicepoint", IsisDevice, "isis-device")
         
         self.register_service("isis-inventory-servicepoint", IsisInventory, "isis-inventory")
+        self.register_validation("isis-inputs-validation", IsisInputValidation)
+
+        self.register_action("isis-stats-reset-actionpoint", IsisStatsReset)
+        self.register_action("isis-stats-profile-actionpoint", IsisProfileCapture)
+        self.register_action("isis-stats-trace-actionpoint", IsisTraceSettings)
+        self.register_action("isis-fleet-redeploy-actionpoint", IsisFleetRedeploy)
+        self.register_action("isis-fleet-import-actionpoint", IsisFleetImport)
+        self.register_action("isis-fleet-audit-actionpoint", IsisFleetAudit)
+        self.register_action("isis-fleet-rotate-passwd-actionpoint", IsisPasswdRotation)
+        self.register_action("isis-fleet-provision-actionpoint", IsisFleetProvision)
+        self.register_action("isis-fleet-refresh-effective-actionpoint", IsisEffectiveRefresh)
+        self.register_action("isis-aggregate-disable-actionpoint", IsisAggregateDisable)
+        self.register_action("isis-sid-reserve-actionpoint", IsisSidReserve)
+        self.register_action("isis-sid-release-actionpoint", IsisSidRelease)
+        self.register_action("isis-push-purge-actionpoint", IsisPushPurge)
+        self.stats_publisher = stats.Publisher(self.log)
+        self.stats_publisher.start()
+        self.dependency_subscriber = DependencySubscriber(app=self)
+        self.dependency_subscriber.start()
+        self.sid_pool_subscriber = SidPoolSubscriber(app=self)
+        self.sid_pool_subscriber.start()
+        self.effective_subscriber = EffectiveSubscriber(app=self)
+        self.effective_subscriber.start()
+        self.push_tracker = Tracker(self.log)
+        self.push_tracker.start()
+        self.log.info(f"isis setup: {(time.perf_counter() - start) * 1000:.1f} ms "
+                      f"({(time.perf_counter() - import_timer.started) * 1000:.1f} ms since the first import)")
 
     def teardown(self) -> None:
+        self.push_tracker.stop()
+        self.effective_subscriber.stop()
+        self.sid_pool_subscriber.stop()
+        self.dependency_subscriber.stop()
+        self.stats_publisher.stop()
         self.log.info("Main FINISHED")
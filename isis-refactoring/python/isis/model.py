@@ -0,0 +1,186 @@
+"Immutable input models of the isis services, built once per create"
+
+from typing import Any, Mapping, Optional
+
+from . import utils
+from .inventory_cache import ReadOnlyDict, freeze
+
+
+class _Frozen:
+    '''Base of the slotted read-only models'''
+
+    __slots__ = ()
+
+    def __init__(self, **values: Any) -> None:
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__ if name != "data")
+        return f"{type(self).__name__}({fields})"
+
+
+def _str(value: Any) -> Optional[str]:
+    return None if value is None or value == "" else str(value)
+
+
+def _either(values: Mapping[str, Any], name: str) -> Any:
+    # inventory entries may use the yang names ("sr-id") instead of "sr_id"
+    value = values.get(name)
+    return values.get(name.replace("_", "-")) if value is None else value
+
+
+class IsisInstanceInput(_Frozen):
+    '''Input of an isis instance: service leaves merged over its inventory
+
+    `data` keeps the merged leaves (plus the derived net_id), it is the
+    source of the generic template variables.
+    '''
+
+    __slots__ = (
+        "instance_id",
+        "area_id",
+        "loopback0",
+        "net_id",
+        "sr",
+        "sr_lower_bound",
+        "sr_upper_bound",
+        "ldp",
+        "mpls",
+        "mpls_sr_prefer",
+        "dist_link_state",
+        "disable_sync_ldp",
+        "export",
+        "export_tunnel_table",
+        "ti_lfa_level",
+        "is_name",
+        "data",
+    )
+
+    @classmethod
+    def build(cls, instance_id: str, data: Mapping[str, Any]) -> "IsisInstanceInput":
+        merged = dict(data)
+        if "net_id" not in merged:
+            loopback, area_id = merged.get("loopback0"), merged.get("area_id")
+            if loopback and area_id:
+                merged["net_id"] = utils.generate_net_id(loopback, area_id)
+
+        sr = merged.get("sr") or {}
+        fast_reroute = merged.get("fast_reroute") or {}
+        ldp = merged.get("ldp")
+        return cls(
+            instance_id=str(instance_id),
+            area_id=merged.get("area_id"),
+            loopback0=merged.get("loopback0"),
+            net_id=merged.get("net_id"),
+            sr=bool(sr),
+            sr_lower_bound=sr.get("lower_bound") or "",
+            sr_upper_bound=sr.get("upper_bound") or "",
+            ldp=isinstance(ldp, dict) or ldp is True,
+            mpls=bool(merged.get("mpls")),
+            mpls_sr_prefer=bool(merged.get("mpls_sr_prefer")),
+            dist_link_state=bool(merged.get("dist_link_state")),
+            disable_sync_ldp=bool(merged.get("disable_sync_ldp")),
+            export=merged.get("export"),
+            export_tunnel_table=merged.get("export_tunnel_table"),
+            ti_lfa_level=fast_reroute.get("ti_lfa_level") or "",
+            is_name=merged.get("is_name"),
+            data=freeze(merged),
+        )
+
+
+class IsisInterfaceInput(_Frozen):
+    '''Input of an isis interface: service leaves merged over its inventory
+
+    The few leaves the inventory does not carry are read from the service
+    node here, once, so the NED branches never go back to CDB. A loopback
+    without sr-id gets the one allocated from its domain pool, if any.
+    '''
+
+    __slots__ = (
+        "name",
+        "interface_type",
+        "instance_id",
+        "circuit_type",
+        "metric",
+        "passwd",
+        "enable_sync_ldp",
+        "if_id",
+        "if_type",
+        "subif_id",
+        "sr_id",
+        "loopback_id",
+        "unicast_tag",
+        "data",
+    )
+
+    @classmethod
+    def build(
+        cls,
+        service: Any,
+        data: Mapping[str, Any],
+        allocated_sr_id: Optional[int] = None,
+    ) -> "IsisInterfaceInput":
+        merged = dict(data)
+        if "interface_type" not in merged:
+            interface_type = _str(getattr(service, "interface_type", None))
+            if interface_type is not None:
+                merged["interface_type"] = interface_type
+        if "isis_instance_id" not in merged:
+            instance_id = _str(getattr(service, "isis_instance_id", None))
+            if instance_id is not None:
+                merged["isis_instance_id"] = instance_id
+
+        loopback = _either(merged, "loopback_attribs") or {}
+        sr_id, loopback_id, unicast_tag = (_either(loopback, leaf) for leaf in ("sr_id", "loopback_id", "unicast_tag"))
+        if sr_id is None and unicast_tag is None and loopback_id is None:
+            node = getattr(service, "loopback_attribs", None)
+            if node is not None and node.exists():
+                sr_id, loopback_id, unicast_tag = node.sr_id, node.loopback_id, node.unicast_tag
+        if sr_id is None:
+            sr_id = allocated_sr_id
+
+        common = _either(merged, "common_attributes") or {}
+        if_id, if_type, subif_id = common.get("id"), common.get("type"), _either(common, "subif_id")
+        if if_id is None or if_type is None:
+            node = getattr(service, "common_attributes", None)
+            if node is not None and node.exists():
+                if_type = if_type or node.type
+                if_id = if_id or node.id
+                if subif_id is None:
+                    subif_id = node.subif_id
+
+        return cls(
+            name=str(service.name),
+            interface_type=merged.get("interface_type"),
+            instance_id=merged.get("isis_instance_id"),
+            circuit_type=merged.get("circuit_type"),
+            metric=merged.get("metric"),
+            passwd=merged.get("passwd") or getattr(service, "passwd", None),
+            enable_sync_ldp=bool(merged.get("enable_sync_ldp")),
+            if_id=if_id,
+            if_type=if_type,
+            subif_id=subif_id,
+            sr_id=sr_id,
+            loopback_id=loopback_id,
+            unicast_tag=unicast_tag,
+            data=freeze(merged),
+        )
+
+    @property
+    def template_suffix(self) -> str:
+        return "loopback" if str(self.interface_type) == "loopback" else "common"
+
+
+def with_values(data: ReadOnlyDict, **values: Any) -> dict[str, Any]:
+    '''Copy of a model `data` with some leaves replaced (NED specific values)'''
+
+    merged = dict(data)
+    merged.update(values)
+    return merged
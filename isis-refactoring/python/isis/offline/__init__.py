@@ -0,0 +1,13 @@
+"""Offline render engine for the isis services
+
+Runs IsisInstance/IsisInterface cb_create against local stand-ins for
+ncs.maagic, J2NSOTemplate and the inventory resolver, and renders the
+device XML of each NED from the templates/ directory.
+
+Importing this package installs the stand-ins in sys.modules, it must not
+be imported from the NSO python VM.
+"""
+
+from .engine import OfflineEngine, to_xml
+
+__all__ = ["OfflineEngine", "to_xml"]
@@ -0,0 +1,179 @@
+"Command line for the offline render engine (python -m isis.offline)"
+
+import argparse
+import cProfile
+import json
+import logging
+import pstats
+import sys
+from pathlib import Path
+
+from . import bench, cases, golden
+from .engine import OfflineEngine, to_xml
+
+
+def _render(args: argparse.Namespace) -> int:
+    engine = OfflineEngine()
+    for spec in args.device:
+        name, _, ned = spec.partition("=")
+        config = args.device_config.get(name)
+        engine.add_device(name, ned, config)
+    for payload in args.payloads:
+        engine.load(payload)
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
+    for _ in range(args.repeat):
+        rendered = engine.render()
+    if profiler:
+        profiler.disable()
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(args.profile)
+
+    print(to_xml(rendered))
+    return 0
+
+
+def _validate(args: argparse.Namespace) -> int:
+    engine = OfflineEngine()
+    for spec in args.device:
+        name, _, ned = spec.partition("=")
+        engine.add_device(name, ned)
+    services = []
+    for payload in args.payloads:
+        services += engine.load(payload)
+    problems = engine.validate(services)
+    for problem in problems:
+        print(problem)
+    return 1 if problems else 0
+
+
+def _golden(args: argparse.Namespace) -> int:
+    failed = 0
+    for result in golden.run(Path(args.directory)):
+        status = "ok" if result.ok else "FAIL"
+        print(f"{status:4} {result.name} ({result.elapsed * 1000:.1f} ms)")
+        if result.error:
+            print(f"     {result.error}")
+        for line in result.missing:
+            print(f"     - {line}")
+        for line in result.extra:
+            print(f"     + {line}")
+        failed += not result.ok
+    return 1 if failed else 0
+
+
+def _cases(args: argparse.Namespace) -> int:
+    failed = 0
+    for result in cases.run(args.pattern):
+        status = "ok" if result.ok else "FAIL"
+        print(f"{status:4} {result.name} ({result.elapsed * 1000:.1f} ms)")
+        if result.error:
+            print(f"     {result.error}")
+        failed += not result.ok
+    return 1 if failed else 0
+
+
+def _templates(args: argparse.Namespace) -> int:
+    from .. import template_check
+
+    problems = template_check.preload()
+    for problem in problems:
+        print(problem)
+    return 1 if problems else 0
+
+
+def _bench(args: argparse.Namespace) -> int:
+    if args.flattening:
+        result = bench.flattening(args.flattening, args.seed)
+        print(f"{result['iterations']} services: per variable {result['per_variable_s']:.3f} s,"
+              f" flatten {result['flatten_s']:.3f} s (x{result['speedup']})")
+        return 0
+    if args.compare:
+        baseline, current = bench.load(args.compare[0]), bench.load(args.compare[1])
+    else:
+        scenarios = [bench.Scenario.parse(spec) for spec in args.scenario or bench.DEFAULT_SCENARIOS]
+        mix = bench.DEFAULT_MIX
+        if args.ned_mix:
+            mix = {ned: float(weight or 1) for ned, _, weight in (spec.partition("=") for spec in args.ned_mix)}
+        current = bench.run(scenarios, mix, args.sharing, args.seed, not args.no_allocations, args.aggregate)
+        baseline = bench.load(args.baseline) if args.baseline else None
+        text = json.dumps(current, indent=2)
+        if args.output:
+            args.output.write_text(text + "\n")
+        for result in current["scenarios"]:
+            latency = result["latency_us"]
+            print(f"{result['scenario']:>10} {result['services']:>8} services {result['wall_s']:>9.3f} s"
+                  f"  p50 {latency['p50']} us  p99 {latency['p99']} us"
+                  f"  replay {result['replay_wall_s']:.3f} s  rss {result['peak_rss_kib']} KiB")
+        if baseline is None:
+            return 0
+
+    lines, regressions = bench.compare(baseline, current, args.tolerance)
+    for line in lines:
+        print(line)
+    return 1 if regressions else 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m isis.offline")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    render = sub.add_parser("render", help="render service payloads to device XML")
+    render.add_argument("payloads", nargs="+", type=Path)
+    render.add_argument("-d", "--device", action="append", default=[], metavar="NAME=NED",
+                        help="declare a device and its NED type")
+    render.add_argument("--device-config", action="append", default=[], metavar="NAME=FILE",
+                        help="current device config (XML) used for lookups")
+    render.add_argument("--repeat", type=int, default=1)
+    render.add_argument("--profile", type=int, default=0, metavar="N",
+                        help="profile the creates and print the top N functions")
+    render.set_defaults(func=_render)
+
+    validate = sub.add_parser("validate", help="report every service payload with bad inputs")
+    validate.add_argument("payloads", nargs="+", type=Path)
+    validate.add_argument("-d", "--device", action="append", default=[], metavar="NAME=NED",
+                          help="declare a device and its NED type")
+    validate.set_defaults(func=_validate)
+
+    check = sub.add_parser("golden", help="run the payloads -> expected golden suite")
+    check.add_argument("directory", nargs="?", default=str(golden.MAQUETTE_DIR))
+    check.set_defaults(func=_golden)
+
+    unit = sub.add_parser("cases", help="run the unit cases of the deterministic logic")
+    unit.add_argument("pattern", nargs="?", default="*", help="only the cases matching this glob")
+    unit.set_defaults(func=_cases)
+
+    templates = sub.add_parser("templates", help="check the template variables against the handlers")
+    templates.set_defaults(func=_templates)
+
+    scale = sub.add_parser("bench", help="render synthetic fleets and record latency, RSS and allocations")
+    scale.add_argument("-s", "--scenario", action="append", metavar="DEVICESxINTERFACES",
+                       help=f"fleet size, repeatable (default {' '.join(bench.DEFAULT_SCENARIOS)})")
+    scale.add_argument("--ned-mix", action="append", metavar="NED=WEIGHT",
+                       help="NED types of the fleet and their weight (default all, evenly)")
+    scale.add_argument("--sharing", type=float, default=0.0, metavar="RATIO",
+                       help="ratio of common interfaces taking their leaves from a shared inventory")
+    scale.add_argument("--seed", type=int, default=0)
+    scale.add_argument("--aggregate", action="store_true", help="devices in device-level (aggregate) mode")
+    scale.add_argument("--flattening", type=int, default=0, metavar="N",
+                       help="only time N emissions of the template variables, per variable vs flatten")
+    scale.add_argument("--no-allocations", action="store_true", help="skip the tracemalloc pass")
+    scale.add_argument("-o", "--output", type=Path, help="JSON result file")
+    scale.add_argument("--baseline", type=Path, help="JSON result file to compare with")
+    scale.add_argument("--compare", nargs=2, type=Path, metavar=("BASELINE", "CURRENT"),
+                       help="only compare two JSON result files")
+    scale.add_argument("--tolerance", type=float, default=0.10,
+                       help="relative growth reported as a regression (default 0.10)")
+    scale.set_defaults(func=_bench)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+    if args.command == "render":
+        args.device_config = dict(spec.partition("=")[::2] for spec in args.device_config)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,416 @@
+"Synthetic scale benchmark: generated fleets rendered through the offline engine"
+
+import copy
+import datetime
+import gc
+import json
+import logging
+import multiprocessing
+import platform
+import random
+import resource
+import statistics
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Iterator, NamedTuple, Optional
+
+from .. import fingerprint, flatten, stats
+from ..ressources import NEDS
+from ..utils import CiscoType7
+from .engine import RFS_NS, OfflineEngine
+from .golden import MAQUETTE_DIR
+from .template import OfflineTemplate
+
+ISIS_NS = "{http://bouyguestelecom.fr/isis}"
+
+DEFAULT_SCENARIOS = ("1x1", "1x500", "100x1", "100x50", "2000x1", "2000x5")
+DEFAULT_MIX = {ned: 1.0 for ned in NEDS}
+
+# leaves moved to the shared inventory entries when an interface shares them
+_SHARED_LEAVES = ("circuit-type", "metric", "passwd", "enable-sync-ldp")
+
+
+class Scenario(NamedTuple):
+    devices: int
+    interfaces: int
+
+    @classmethod
+    def parse(cls, spec: str) -> "Scenario":
+        '''"100x50": 100 devices with 50 isis interfaces each'''
+
+        devices, _, interfaces = spec.lower().partition("x")
+        return cls(int(devices), int(interfaces or 1))
+
+    @property
+    def name(self) -> str:
+        return f"{self.devices}x{self.interfaces}"
+
+
+#################################################################
+#   Fleet generator                                             #
+#################################################################
+
+def _isis(path: Path) -> ET.Element:
+    return ET.parse(path).getroot().find(f"{RFS_NS}rfs/{ISIS_NS}isis")
+
+
+def _leaf(element: ET.Element, name: str) -> Optional[ET.Element]:
+    return element.find(f"{ISIS_NS}{name}")
+
+
+class NedBase(NamedTuple):
+    '''Services of one NED in the maquette payloads, cloned for every device'''
+
+    instance: ET.Element
+    common: ET.Element
+    loopback: ET.Element
+
+    @classmethod
+    def load(cls, payloads: Path, ned: str) -> "NedBase":
+        def first(kind: str) -> ET.Element:
+            # the shortest name is the plain case (no subif, no alone variant)
+            paths = sorted(payloads.glob(f"{ned}-isis-{kind}-*.xml"), key=lambda path: len(path.name))
+            if not paths:
+                raise FileNotFoundError(f"no {ned}-isis-{kind}-*.xml payload in {payloads}")
+            return _isis(paths[0])
+
+        instance = first("instance-template").find(f"{ISIS_NS}instance")
+        common = first("interface-common-template").find(f"{ISIS_NS}interface")
+        loopback = first("interface-loopback-template").find(f"{ISIS_NS}interface")
+        return cls(instance, common, loopback)
+
+
+class Fleet:
+    '''Synthetic fleet: one isis service list per device, cloned from the maquette
+
+    Every device gets the instance and the loopback of its NED, plus
+    `interfaces - 1` common interfaces. `sharing` is the ratio of common
+    interfaces whose circuit-type/metric/passwd come from a shared
+    inventory entry instead of the service itself. With `aggregate` the
+    devices are in device-level mode.
+    '''
+
+    def __init__(
+        self,
+        scenario: Scenario,
+        ned_mix: dict[str, float],
+        sharing: float = 0.0,
+        seed: int = 0,
+        aggregate: bool = False,
+        payloads: Path = MAQUETTE_DIR / "payloads",
+    ) -> None:
+        self.scenario = scenario
+        self.sharing = sharing
+        self.aggregate = aggregate
+        self.bases = {ned: NedBase.load(payloads, ned) for ned in ned_mix}
+        self._random = random.Random(seed)
+        neds, weights = zip(*ned_mix.items())
+        self.devices = [
+            (f"BENCH-{ned.split('-')[0].upper()}-{index:05d}", ned)
+            for index, ned in enumerate(self._random.choices(neds, weights, k=scenario.devices), 1)
+        ]
+
+    def _loopback0(self, index: int) -> str:
+        return f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}"
+
+    def _interface_name(self, ned: str, index: int) -> str:
+        if ned == "cisco-iosxr-cli":
+            return f"Bundle-Ether{index}"
+        if ned == "huawei-vrp-cli":
+            return f"Eth-Trunk{index}"
+        return f"TO_PEER{index:04d}"
+
+    def _common(self, base: ET.Element, ned: str, index: int) -> ET.Element:
+        interface = copy.deepcopy(base)
+        _leaf(interface, "name").text = self._interface_name(ned, index)
+        metric = _leaf(interface, "metric")
+        if metric is not None:
+            metric.text = str(10 + index % 90)
+        attributes = _leaf(interface, "common-attributes")
+        if attributes is not None and _leaf(attributes, "id") is not None:
+            _leaf(attributes, "id").text = str(index)
+        if self._random.random() < self.sharing:
+            for name in _SHARED_LEAVES:
+                leaf = _leaf(interface, name)
+                if leaf is not None:
+                    interface.remove(leaf)
+            ET.SubElement(interface, f"{ISIS_NS}inventory-template").text = f"BENCH-{ned}-common"
+        return interface
+
+    def inventory(self) -> ET.Element:
+        '''<rfs> with the shared inventory entries, one per NED'''
+
+        rfs = ET.Element(f"{RFS_NS}rfs")
+        isis = ET.SubElement(ET.SubElement(rfs, f"{RFS_NS}inventory"), f"{ISIS_NS}isis")
+        for ned, base in self.bases.items():
+            entry = ET.SubElement(isis, f"{ISIS_NS}interface")
+            ET.SubElement(entry, f"{ISIS_NS}name").text = f"BENCH-{ned}-common"
+            for name in _SHARED_LEAVES:
+                leaf = _leaf(base.common, name)
+                if leaf is not None:
+                    entry.append(copy.deepcopy(leaf))
+        return rfs
+
+    def payloads(self) -> Iterator[tuple[str, str, ET.Element]]:
+        '''(device, ned, <rfs> payload) for every device of the fleet'''
+
+        for index, (device, ned) in enumerate(self.devices, 1):
+            base = self.bases[ned]
+            rfs = ET.Element(f"{RFS_NS}rfs")
+            isis = ET.SubElement(rfs, f"{ISIS_NS}isis")
+            ET.SubElement(isis, f"{ISIS_NS}device").text = device
+            if self.aggregate:
+                ET.SubElement(isis, f"{ISIS_NS}aggregate")
+            instance = copy.deepcopy(base.instance)
+            _leaf(instance, "loopback0").text = self._loopback0(index)
+            isis.append(instance)
+            isis.append(copy.deepcopy(base.loopback))
+            for number in range(1, self.scenario.interfaces):
+                isis.append(self._common(base.common, ned, number))
+            yield device, ned, rfs
+
+    def device_config(self, ned: str, payload: ET.Element) -> Optional[ET.Element]:
+        '''IOS-XR config holding the hello-passwords already on the device'''
+
+        if ned != "cisco-iosxr-cli":
+            return None
+        isis = payload.find(f"{ISIS_NS}isis")
+        config = ET.Element("config")
+        tag = ET.SubElement(ET.SubElement(ET.SubElement(config, "router"), "isis"), "tag")
+        ET.SubElement(tag, "name").text = _leaf(_leaf(isis, "instance"), "instance-id").text
+        for interface in isis.iterfind(f"{ISIS_NS}interface"):
+            passwd = _leaf(interface, "passwd")
+            if passwd is None:
+                continue
+            entry = ET.SubElement(tag, "interface")
+            ET.SubElement(entry, "name").text = _leaf(interface, "name").text
+            hello = ET.SubElement(entry, "hello-password")
+            ET.SubElement(hello, "encrypted").text = CiscoType7.encode(passwd.text)
+        return config
+
+    def engine(self) -> tuple[OfflineEngine, list[tuple[str, str, str]]]:
+        '''Offline engine loaded with the fleet, and its services in create order
+
+        In aggregate mode only the device services are created: the
+        entries they render would return at once from their own create.
+        '''
+
+        engine = OfflineEngine()
+        engine.load(self.inventory())
+        services = []
+        for device, ned, payload in self.payloads():
+            engine.add_device(device, ned, self.device_config(ned, payload))
+            loaded = engine.load(payload)
+            services += [service for service in loaded if (service[0] == "device") == self.aggregate]
+        return engine, services
+
+    @property
+    def entries(self) -> int:
+        '''Instances and interfaces of the fleet, the same in both modes'''
+
+        return self.scenario.devices * (1 + self.scenario.interfaces)
+
+
+#################################################################
+#   Measurements                                                #
+#################################################################
+
+def _percentiles(samples: list[int]) -> dict[str, int]:
+    if not samples:
+        return {"count": 0, "p50": 0, "p95": 0, "p99": 0, "max": 0}
+    ordered = sorted(samples)
+
+    def at(ratio: float) -> int:
+        return ordered[min(len(ordered) - 1, int(ratio * len(ordered)))]
+
+    return {"count": len(ordered), "p50": at(0.50), "p95": at(0.95), "p99": at(0.99), "max": ordered[-1]}
+
+
+def _create_all(engine: OfflineEngine, services: list[tuple[str, str, str]]) -> tuple[float, list[int]]:
+    '''Create every service in one transaction: (wall time in s, latencies in us)'''
+
+    from .maagic import Transaction
+
+    engine.root.trans = Transaction(engine.root)
+    engine.root.rendered.clear()
+    engine.root.applied.clear()
+    latencies = []
+    start = time.perf_counter()
+    for service in services:
+        begin = time.perf_counter()
+        engine.create(*service)
+        latencies.append(int((time.perf_counter() - begin) * 1_000_000))
+    return time.perf_counter() - start, latencies
+
+
+def run_scenario(
+    scenario: Scenario,
+    ned_mix: dict[str, float],
+    sharing: float = 0.0,
+    seed: int = 0,
+    allocations: bool = True,
+    aggregate: bool = False,
+) -> dict[str, Any]:
+    '''Generate, then create the fleet twice (first deploy, replay) and measure'''
+
+    fleet = Fleet(scenario, ned_mix, sharing, seed, aggregate)
+    start = time.perf_counter()
+    engine, services = fleet.engine()
+    generated = time.perf_counter() - start
+
+    stats.registry.reset()
+    gc.collect()
+    wall, latencies = _create_all(engine, services)
+    phases = stats.registry.snapshot()
+    replay_wall, replay_latencies = _create_all(engine, services)
+
+    result: dict[str, Any] = {
+        "scenario": scenario.name,
+        "devices": scenario.devices,
+        "interfaces": scenario.interfaces,
+        "services": fleet.entries,
+        "creates": len(services),
+        "generate_s": round(generated, 3),
+        "wall_s": round(wall, 3),
+        "services_per_s": round(fleet.entries / wall, 1) if wall else 0.0,
+        "latency_us": _percentiles(latencies),
+        "mean_us": int(statistics.fmean(latencies)) if latencies else 0,
+        "replay_wall_s": round(replay_wall, 3),
+        "replay_latency_us": _percentiles(replay_latencies),
+        "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "phases": phases,
+    }
+
+    if allocations:
+        # traced separately: tracemalloc slows the creates down several times
+        engine.proplists.clear()
+        gc.collect()
+        tracemalloc.start()
+        _create_all(engine, services)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["alloc_peak_bytes"] = peak
+        result["alloc_retained_bytes"] = current
+        result["alloc_per_service_bytes"] = peak // fleet.entries if fleet.entries else 0
+    return result
+
+
+def run(
+    scenarios: list[Scenario],
+    ned_mix: dict[str, float] = DEFAULT_MIX,
+    sharing: float = 0.0,
+    seed: int = 0,
+    allocations: bool = True,
+    aggregate: bool = False,
+) -> dict[str, Any]:
+    '''Run every scenario in its own process, so the peak RSS is its own'''
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for scenario in scenarios:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results.append(pool.submit(run_scenario, scenario, ned_mix, sharing, seed, allocations, aggregate).result())
+    return {
+        "revision": fingerprint.CODE_REVISION,
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "ned_mix": ned_mix,
+        "sharing": sharing,
+        "seed": seed,
+        "aggregate": aggregate,
+        "scenarios": results,
+    }
+
+
+#################################################################
+#   Flattening of the template variables                        #
+#################################################################
+
+def _per_variable(data: dict[str, Any], prefix: str, template: OfflineTemplate, j2_data: dict[str, Any]) -> None:
+    # the add_all_vars walk replaced by flatten: one add and one log per variable
+    for var, val in data.items():
+        name = f"{prefix}_{var.upper()}" if prefix else var.upper()
+        if isinstance(val, dict):
+            _per_variable(val, name, template, j2_data)
+        elif not isinstance(val, (list, tuple, set)):
+            value = ("true" if val else "false") if isinstance(val, bool) else val
+            template.add(name, value, j2_data=j2_data)
+            logging.info(f"{name} :  {value}")
+
+
+def flattening(iterations: int = 100_000, seed: int = 0) -> dict[str, Any]:
+    '''Seconds to emit the variables of the services of a 1x3 fleet
+    `iterations` times: per variable, then flatten + add_dict'''
+
+    engine, services = Fleet(Scenario(1, 3), {"cisco-iosxr-cli": 1.0}, seed=seed).engine()
+    samples = [engine.service(*service).to_dict() for service in services]
+    rounds = max(1, iterations // len(samples))
+    template = OfflineTemplate(None)
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for data in samples:
+            _per_variable(data, "", template, {})
+    per_variable = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for data in samples:
+            template.add_dict(flatten.flatten(data))
+    flattened = time.perf_counter() - start
+
+    return {
+        "iterations": rounds * len(samples),
+        "per_variable_s": round(per_variable, 3),
+        "flatten_s": round(flattened, 3),
+        "speedup": round(per_variable / flattened, 2) if flattened else 0.0,
+    }
+
+
+#################################################################
+#   Comparison of two result files                              #
+#################################################################
+
+# (metric, getter) compared between runs, lower is better for all of them
+METRICS = (
+    ("wall_s", lambda r: r["wall_s"]),
+    ("p50_us", lambda r: r["latency_us"]["p50"]),
+    ("p99_us", lambda r: r["latency_us"]["p99"]),
+    ("replay_wall_s", lambda r: r["replay_wall_s"]),
+    ("peak_rss_kib", lambda r: r["peak_rss_kib"]),
+    ("alloc_peak_bytes", lambda r: r.get("alloc_peak_bytes")),
+)
+
+
+def compare(baseline: dict[str, Any], current: dict[str, Any], tolerance: float = 0.10) -> tuple[list[str], int]:
+    '''Lines "scenario metric baseline -> current (+x%)", and the regressions count
+
+    A metric regresses when it grows by more than `tolerance`. Only the
+    scenarios present in both files are compared.
+    '''
+
+    lines, regressions = [], 0
+    before = {result["scenario"]: result for result in baseline["scenarios"]}
+    for result in current["scenarios"]:
+        old = before.get(result["scenario"])
+        if old is None:
+            continue
+        for metric, get in METRICS:
+            was, now = get(old), get(result)
+            if not was or now is None:
+                continue
+            change = (now - was) / was
+            flag = ""
+            if change > tolerance:
+                flag = "  REGRESSION"
+                regressions += 1
+            lines.append(f"{result['scenario']:>10} {metric:<17} {was:>12} -> {now:<12} ({change:+.1%}){flag}")
+    return lines, regressions
+
+
+def load(path: Path) -> dict[str, Any]:
+    with open(path) as stream:
+        return json.load(stream)
@@ -0,0 +1,1572 @@
+"Unit cases of the deterministic logic, run offline next to the golden suite"
+
+import fnmatch
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, NamedTuple, Optional
+from unittest.mock import patch
+
+from .. import flatten
+
+CASES: list[Callable[[], None]] = []
+
+
+def case(fn: Callable[[], None]) -> Callable[[], None]:
+    '''Register a case: a function failing by an assert or an exception'''
+
+    CASES.append(fn)
+    return fn
+
+
+class CaseResult(NamedTuple):
+    name: str
+    error: Optional[str]
+    elapsed: float
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def run(pattern: str = "*") -> list[CaseResult]:
+    results = []
+    for fn in CASES:
+        if not fnmatch.fnmatchcase(fn.__name__, pattern):
+            continue
+        start = time.perf_counter()
+        try:
+            fn()
+            error = None
+        except AssertionError as err:
+            error = f"AssertionError: {err}" if str(err) else "AssertionError"
+        except Exception as err:
+            error = f"{type(err).__name__}: {err}"
+        results.append(CaseResult(fn.__name__, error, time.perf_counter() - start))
+    return results
+
+
+#################################################################
+#   flatten                                                     #
+#################################################################
+
+@case
+def flatten_nested_and_bools() -> None:
+    data = {"sr": {"lower_bound": 1, "upper_bound": 9}, "mpls": True, "ldp": False, "metric": None}
+    assert flatten.flatten(data) == {
+        "SR_LOWER_BOUND": 1, "SR_UPPER_BOUND": 9, "MPLS": "true", "LDP": "false", "METRIC": None,
+    }
+
+
+@case
+def flatten_prefix_and_skipped_lists() -> None:
+    data = {"name": "Loopback0", "tags": [1, 2], "attribs": {"sr_id": 10, "ids": (1,)}}
+    assert flatten.flatten(data, "IF") == {"IF_NAME": "Loopback0", "IF_ATTRIBS_SR_ID": 10}
+
+
+@case
+def flatten_follows_the_data_not_a_cached_shape() -> None:
+    # same keys, a leaf first unset then set: no stale bool coercion
+    assert flatten.flatten({"passwd": None, "sr": True}) == {"PASSWD": None, "SR": "true"}
+    assert flatten.flatten({"passwd": True, "sr": {"id": 1}}) == {"PASSWD": "true", "SR_ID": 1}
+
+
+#################################################################
+#   push                                                        #
+#################################################################
+
+def _queue(pending: dict[int, Any], completed: Optional[dict[int, Any]]) -> SimpleNamespace:
+    history = None if completed is None else SimpleNamespace(queue_item=completed)
+    return SimpleNamespace(queue_item=pending, completed=history)
+
+
+@case
+def push_queue_state_needs_a_completion_record() -> None:
+    from .. import push
+
+    failed = SimpleNamespace(failed=[SimpleNamespace(name="OAR1", reason="timeout")])
+    queue = _queue(
+        {1: SimpleNamespace(status="executing"), 2: SimpleNamespace(status="failed", failed=[])},
+        {3: SimpleNamespace(failed=[]), 4: failed},
+    )
+    with patch.object(push.ncs.maagic, "get_node", lambda trans, path: queue, create=True):
+        assert push._queue_state(None, 1) == ("pending", None)
+        assert push._queue_state(None, 2)[0] == "failed"
+        assert push._queue_state(None, 3) == ("completed", None)
+        assert push._queue_state(None, 4) == ("failed", "OAR1: timeout")
+        assert push._queue_state(None, 5)[0] == "unknown"
+    with patch.object(push.ncs.maagic, "get_node", lambda trans, path: _queue({}, None), create=True):
+        assert push._queue_state(None, 3)[0] == "unknown"
+
+
+@case
+def push_services_queues_the_batches_of_a_device_in_order() -> None:
+    from .. import push
+    from ..actions.selection import ServiceRef
+
+    calls: list[tuple[str, list[str]]] = []
+    running: set[str] = set()
+    lock = threading.Lock()
+
+    def push_device(username: str, device: str, refs: list[ServiceRef], *args: Any) -> None:
+        with lock:
+            assert device not in running, f"two batches of {device} at once"
+            running.add(device)
+        time.sleep(0.01)
+        with lock:
+            running.discard(device)
+            calls.append((device, [ref.key for ref in refs]))
+
+    refs = [ServiceRef("interface", device, f"if{index}") for device in ("A", "B") for index in range(5)]
+    with patch.object(push, "push_device", push_device):
+        outcomes = push.push_services("admin", refs, push.PushOptions("async"), "tag", 4, 2)
+    assert all(outcome.error is None for outcome in outcomes), outcomes
+    assert [keys for device, keys in calls if device == "A"] == [["if0", "if1"], ["if2", "if3"], ["if4"]]
+    assert len(calls) == 6
+
+
+@case
+def push_purge_keeps_the_queued_and_recent_items() -> None:
+    import contextlib
+
+    from .. import push
+
+    class Entries(dict):
+        def __iter__(self) -> Any:
+            return iter(list(self.values()))
+
+    def days_ago(days: int) -> str:
+        return time.strftime(push.TIMESTAMP, time.localtime(time.time() - days * 86400))
+
+    old, recent = days_ago(10), days_ago(1)
+    node = SimpleNamespace(
+        item=Entries({
+            1: SimpleNamespace(id=1, status="completed", updated=old),
+            2: SimpleNamespace(id=2, status="queued", updated=old),
+            3: SimpleNamespace(id=3, status="rolled-back", updated=recent),
+            # written before the updated leaf existed
+            4: SimpleNamespace(id=4, status="failed", updated=None),
+        }),
+        service=Entries({
+            keypath: SimpleNamespace(keypath=keypath, queue_item=item_id)
+            for keypath, item_id in (("/a", 1), ("/b", 2), ("/c", 3), ("/d", 4))
+        }),
+    )
+    applied: list[bool] = []
+
+    @contextlib.contextmanager
+    def single_write_trans(username: str, context: str, db: int) -> Any:
+        yield SimpleNamespace(apply=lambda: applied.append(True))
+
+    with patch.object(push.ncs.maapi, "single_write_trans", single_write_trans, create=True), \
+            patch.object(push.ncs.maagic, "get_node", lambda trans, path: node, create=True):
+        assert push.pushes.purge(7) == 2
+        assert applied == [True]
+        assert sorted(node.item.keys()) == [2, 3] and sorted(node.service.keys()) == ["/b", "/c"], (node.item, node.service)
+        assert push.pushes.purge(0) == 1
+        assert sorted(node.item.keys()) == [2] and sorted(node.service.keys()) == ["/b"]
+
+
+#################################################################
+#   Inventory cache                                             #
+#################################################################
+
+@case
+def inventory_cache_resolves_each_entry_once_per_transaction() -> None:
+    from ..inventory_cache import InventoryCache, handlers
+
+    resolved = []
+
+    class Manager:
+        @staticmethod
+        def subscribe(policy: dict[str, list[str]]) -> Callable[..., Any]:
+            def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+                def wrapper(self_: Any, tctx: Any, root: Any, service: Any, proplist: Any) -> Any:
+                    # one CDB read of the inventory entry
+                    resolved.append((tctx.th, service.name))
+                    return fn(self_, tctx, root, service, proplist, {"metric": 10})
+                return wrapper
+            return decorator
+
+    cache = InventoryCache()
+    views = []
+
+    @cache.subscribe({"leafref": ["inventory-template"]}, "interface")
+    def create(self_: Any, tctx: Any, root: Any, service: Any, proplist: Any, inventory: Any) -> None:
+        views.append(inventory)
+
+    def run(th: int, name: str, template: Optional[str] = "T") -> None:
+        create(None, SimpleNamespace(th=th), None, SimpleNamespace(name=name, inventory_template=template), [])
+
+    with patch.object(handlers, "load", lambda ref: Manager):
+        for index in range(50):
+            run(1, f"BE{index}")
+        assert resolved == [(1, "BE0")], resolved
+        assert all(view is views[0] for view in views), "not one shared view"
+        run(2, "BE0")
+        run(2, "L0", None)
+        run(2, "L1", None)
+        assert resolved[1:] == [(2, "BE0"), (2, "L0"), (2, "L1")], resolved
+        try:
+            views[0]["metric"] = 20
+        except TypeError:
+            pass
+        else:
+            raise AssertionError("shared view is writable")
+        # the inventory entry changed: every transaction resolves it again
+        cache.invalidate("T", "interface")
+        run(1, "BE50")
+        run(2, "BE1")
+        assert resolved[4:] == [(1, "BE50"), (2, "BE1")], resolved
+
+
+#################################################################
+#   Fingerprint                                                 #
+#################################################################
+
+@case
+def fingerprint_replay_applies_what_a_fresh_create_does() -> None:
+    from .. import fingerprint
+
+    engine = _engine({"D1": _instance("OMEGA", "10.0.0.1") + _loopback("Loopback0", sr_id=16001) + _interface("BE1")})
+    import xml.etree.ElementTree as ET
+
+    engine.render()
+    fresh, rendered = list(engine.root.applied), engine.root.rendered["D1"]
+    with patch.object(fingerprint, "replay", wraps=fingerprint.replay) as replay:
+        engine.render()
+    assert replay.call_count == 3, replay.call_args_list
+    assert engine.root.applied == fresh, engine.root.applied
+    assert ET.tostring(engine.root.rendered["D1"]) == ET.tostring(rendered)
+
+
+@case
+def fingerprint_replay_still_checks_the_device_interfaces() -> None:
+    from ..logic_handlers.isis_interface import ServiceInputError
+
+    engine = _engine({"D1": _instance("OMEGA", "10.0.0.1") + _interface("Bundle-Ether1")})
+    engine.add_device("D1", "cisco-iosxr-cli", _config(
+        "<interface><Bundle-Ether><id>1</id></Bundle-Ether></interface>"
+    ))
+    engine.render()
+    # same inputs, so the same fingerprint, but the interface left the device
+    engine.add_device("D1", "cisco-iosxr-cli", _config(
+        "<interface><Bundle-Ether><id>2</id></Bundle-Ether></interface>"
+    ))
+    try:
+        engine.render([("interface", "D1", "Bundle-Ether1")])
+    except ServiceInputError as err:
+        assert str(err) == "Interface Bundle-Ether1 not found on device D1", err
+    else:
+        raise AssertionError("replayed without the interface check")
+
+
+#################################################################
+#   Input models                                                #
+#################################################################
+
+def _node(**leaves: Any) -> SimpleNamespace:
+    '''Service container node (loopback-attribs, common-attributes)'''
+
+    return SimpleNamespace(exists=lambda: True, **leaves)
+
+
+@case
+def model_interface_reads_the_merged_data_first() -> None:
+    from ..model import IsisInterfaceInput
+
+    service = SimpleNamespace(
+        name="BE1", interface_type="common", isis_instance_id="SERVICE", passwd="service",
+        loopback_attribs=_node(sr_id=1, loopback_id=1, unicast_tag=1),
+        common_attributes=_node(id="9", type="PHY", subif_id=9),
+    )
+    model = IsisInterfaceInput.build(service, {
+        "interface_type": "loopback", "isis_instance_id": "INVENTORY", "passwd": "inventory",
+        # inventory entries use the yang names
+        "loopback_attribs": {"sr-id": 16001, "unicast-tag": 7},
+        "common_attributes": {"id": "1", "type": "LAG", "subif-id": 100},
+    }, allocated_sr_id=100)
+    assert (model.interface_type, model.instance_id, model.passwd) == ("loopback", "INVENTORY", "inventory"), model
+    assert (model.sr_id, model.loopback_id, model.unicast_tag) == (16001, None, 7), model
+    assert (model.if_id, model.if_type, model.subif_id) == ("1", "LAG", 100), model
+    assert model.template_suffix == "loopback"
+
+
+@case
+def model_interface_falls_back_on_the_service_node() -> None:
+    from ..model import IsisInterfaceInput
+
+    service = SimpleNamespace(
+        name="BE1", interface_type="common", isis_instance_id="OMEGA", passwd="secret",
+        loopback_attribs=_node(sr_id=None, loopback_id=3, unicast_tag=None),
+        common_attributes=_node(id="9", type="PHY", subif_id=9),
+    )
+    model = IsisInterfaceInput.build(service, {"common_attributes": {"type": "LAG"}})
+    assert (model.interface_type, model.instance_id, model.passwd) == ("common", "OMEGA", "secret"), model
+    assert model.data["interface_type"] == "common" and model.data["isis_instance_id"] == "OMEGA"
+    # a partial common-attributes is completed by the node, the type of the data kept
+    assert (model.if_id, model.if_type, model.subif_id) == ("9", "LAG", 9), model
+    assert (model.sr_id, model.loopback_id) == (None, 3), model
+    # an empty loopback-attribs gets the allocated SID
+    service.loopback_attribs = SimpleNamespace(exists=lambda: False)
+    model = IsisInterfaceInput.build(service, {}, allocated_sr_id=100)
+    assert (model.sr_id, model.instance_id) == (100, "OMEGA"), model
+
+
+@case
+def model_instance_derives_the_net_id() -> None:
+    from ..model import IsisInstanceInput
+    from ..utils import generate_net_id
+
+    data = {"loopback0": "10.0.0.1", "area_id": "49.0001", "sr": {"lower_bound": 100}, "fast_reroute": {"ti_lfa_level": "2"}}
+    model = IsisInstanceInput.build("OMEGA", data)
+    assert model.net_id == generate_net_id("10.0.0.1", "49.0001") == model.data["net_id"], model
+    assert (model.sr, model.sr_lower_bound, model.sr_upper_bound, model.ti_lfa_level) == (True, 100, "", "2"), model
+    assert "net_id" not in data
+    assert IsisInstanceInput.build("OMEGA", {**data, "net_id": "49.0001.0000.0000.0001.00"}).net_id == "49.0001.0000.0000.0001.00"
+
+
+@case
+def model_with_values_leaves_the_model_alone() -> None:
+    from ..model import IsisInterfaceInput, with_values
+
+    service = SimpleNamespace(name="BE1", loopback_attribs=None, common_attributes=None)
+    model = IsisInterfaceInput.build(service, {"circuit_type": "level-2-only", "interface_type": "common"})
+    copy = with_values(model.data, circuit_type="level-2")
+    copy["metric"] = 10
+    assert copy == {"circuit_type": "level-2", "interface_type": "common", "metric": 10}, copy
+    assert dict(model.data) == {"circuit_type": "level-2-only", "interface_type": "common"}, model.data
+    for mutate in (lambda: model.data.update(metric=10), lambda: setattr(model, "metric", 10)):
+        try:
+            mutate()
+        except (TypeError, AttributeError):
+            continue
+        raise AssertionError("model mutated")
+
+
+@case
+def model_service_leaves_override_the_inventory() -> None:
+    import xml.etree.ElementTree as ET
+
+    engine = _validation_engine()
+    engine.load(ET.fromstring(
+        '<config xmlns="http://tail-f.com/ns/config/1.0"><rfs xmlns="http://bouyguestelecom.fr/rfs"><inventory>'
+        '<isis xmlns="http://bouyguestelecom.fr/isis"><interface><name>CORE</name><circuit-type>level-1</circuit-type>'
+        "</interface></isis></inventory></rfs></config>"
+    ))
+    engine.service("interface", "D1", "BE1").circuit_type = "level-2-only"
+    engine.service("interface", "D1", "BE2").metric = 20
+    engine.render([("interface", "D1", "BE1"), ("interface", "D1", "BE2")])
+    variables = [variables for _, variables in engine.root.applied]
+    # BE1: metric from the inventory, its own circuit-type; BE2 has no inventory
+    assert (variables[0]["METRIC"], variables[0]["CIRCUIT_TYPE"]) == ("10", "level-2-only"), variables[0]
+    assert (variables[1]["METRIC"], variables[1]["CIRCUIT_TYPE"]) == ("20", "None"), variables[1]
+
+
+#################################################################
+#   SID pools                                                   #
+#################################################################
+
+@case
+def bitmap_first_free_skips_used_and_extra_bits() -> None:
+    from ..sid_pool import Bitmap
+
+    bitmap = Bitmap(100, 103)
+    assert bitmap.first_free() == 100
+    bitmap.set(100)
+    bitmap.set(101)
+    assert bitmap.first_free() == 102
+    assert bitmap.first_free(extra=1 << 2) == 103
+    bitmap.clear(100)
+    assert bitmap.first_free() == 100 and not bitmap.used(100) and bitmap.used(101)
+    bitmap.set(99)
+    bitmap.set(104)
+    assert bitmap.bits == 0b0010
+    assert bitmap.first_free(extra=0b1101) is None
+
+
+@case
+def sid_pools_allocate_only_in_the_transaction() -> None:
+    from ..sid_pool import Pending, SidPools
+
+    pools, srgb = SidPools(), ("default", 100, 110)
+    first, second = Pending(), Pending()
+    assert pools.allocate("a", srgb, first) == 100
+    assert pools.allocate("b", srgb, first) == 101
+    assert pools.allocate("a", srgb, first) == 100
+    # nothing committed: an aborted or dry-run transaction leaks nothing
+    assert pools.owner("default", 100) is None and pools.owned("a") is None
+    assert pools.allocate("c", srgb, second) == 100
+    pools.mark("default", 100, "a")
+    assert pools.allocate("d", srgb, Pending()) == 101
+    assert pools.allocate("a", srgb, Pending()) == 100
+
+
+@case
+def sid_pools_skip_taken_sids_in_the_transaction_only() -> None:
+    from ..sid_pool import FOREIGN, Pending, SidPools
+
+    pools, srgb = SidPools(), ("default", 100, 110)
+    pending = Pending()
+    assert pools.allocate("a", srgb, pending, taken=lambda sid: sid == 100) == 101
+    assert pending.owners[("default", 100)] == FOREIGN
+    assert pools.owner("default", 100) is None
+    assert pools.allocate("b", srgb, Pending()) == 100
+
+
+@case
+def sid_pools_keep_the_held_sid_while_in_the_srgb() -> None:
+    from ..sid_pool import Pending, SidPools
+
+    pools = SidPools()
+    pools.rebuild([("default", 105, "a"), ("default", 100, "b")])
+    assert pools.allocate("a", ("default", 100, 110), Pending()) == 105
+    assert pools.allocate("c", ("default", 100, 110), Pending(), previous=("default", 105)) == 101
+    assert pools.allocate("a", ("default", 200, 210), Pending()) == 200
+    assert pools.allocate("e", ("default", 100, 110), Pending(), previous=("default", 107)) == 107
+    pools.release("default", 105)
+    assert pools.owned("a") is None and pools.allocate("d", ("default", 100, 110), Pending()) == 101
+
+
+@case
+def sid_pools_domains_are_independent() -> None:
+    from ..sid_pool import Pending, SidPools
+    from ..uniqueness import sid_claim
+
+    pools, pending = SidPools(), Pending()
+    assert pools.allocate("a", ("north", 100, 110), pending) == 100
+    assert pools.allocate("b", ("south", 100, 110), pending) == 100
+    assert sid_claim("north", 100) != sid_claim("south", 100)
+
+
+@case
+def sid_pools_exhausted_and_bulk_reserve() -> None:
+    from ..sid_pool import Pending, PoolExhausted, SidPools
+
+    pools, srgb = SidPools(), ("default", 100, 102)
+    assert pools.reserve("bulk", srgb, 3) == [100, 101, 102]
+    assert pools.owner("default", 100) is None
+    for sid in (100, 101, 102):
+        pools.mark("default", sid, "bulk")
+    try:
+        pools.allocate("a", srgb, Pending())
+    except PoolExhausted:
+        pass
+    else:
+        raise AssertionError("allocated in a full SRGB")
+
+
+def _instance(instance_id: str, loopback0: str, sr: str = "") -> str:
+    return (
+        f"<instance><instance-id>{instance_id}</instance-id><area-id>49.0001</area-id>"
+        f"<loopback0>{loopback0}</loopback0>{sr}</instance>"
+    )
+
+
+def _loopback(name: str, instance_id: str = "OMEGA", sr_id: Optional[int] = None) -> str:
+    attribs = "" if sr_id is None else f"<loopback-attribs><sr-id>{sr_id}</sr-id></loopback-attribs>"
+    return (
+        f"<interface><name>{name}</name><isis-instance-id>{instance_id}</isis-instance-id>"
+        f"<interface-type>loopback</interface-type>{attribs}</interface>"
+    )
+
+
+def _engine(devices: dict[str, str]) -> Any:
+    '''Offline engine holding {device: services XML}, IOS-XR devices'''
+
+    import xml.etree.ElementTree as ET
+
+    from . import OfflineEngine
+
+    engine = OfflineEngine()
+    for device in devices:
+        engine.add_device(device, "cisco-iosxr-cli")
+    engine.load(ET.fromstring(
+        '<config xmlns="http://tail-f.com/ns/config/1.0"><rfs xmlns="http://bouyguestelecom.fr/rfs">'
+        + "".join(
+            f'<isis xmlns="http://bouyguestelecom.fr/isis"><device>{device}</device>{services}</isis>'
+            for device, services in devices.items()
+        )
+        + "</rfs></config>"
+    ))
+    return engine
+
+
+def _sid_engine() -> Any:
+    sr = "<sr><lower-bound>100</lower-bound><upper-bound>110</upper-bound></sr>"
+    return _engine({"D1": _instance("OMEGA", "10.0.0.1", sr) + _loopback("Loopback0") + _loopback("Loopback1")})
+
+
+@case
+def sid_create_writes_the_pool_entry_without_marking() -> None:
+    from ..sid_pool import pool_entries, sid_pools
+
+    engine = _sid_engine()
+    engine.render()
+    entries = sorted(pool_entries(engine.root))
+    assert [(domain, sid) for domain, sid, _ in entries] == [("default", 100), ("default", 101)], entries
+    assert sid_pools.owner("default", 100) is None
+    # the commit is aborted: the entries go, the next transaction reuses the SIDs
+    del engine.root.rfs.isis_sid_pool.domain["default"]
+    engine.proplists.clear()
+    engine.render([("interface", "D1", "Loopback1")])
+    assert [sid for _, sid, _ in pool_entries(engine.root)] == [100]
+
+
+@case
+def transaction_caches_outlive_concurrent_transactions() -> None:
+    from .. import txcache
+    from ..sid_pool import Pending, SidPools
+
+    clock = [0.0]
+    cache = txcache.TransactionCache(max_idle=60)
+    pools = SidPools()
+    pools.rebuild([])
+    with patch.object(txcache.time, "monotonic", lambda: clock[0]):
+        # 20 commits at once, each allocating two SIDs in turn: none loses its own
+        for round in range(2):
+            for th in range(20):
+                pending = cache.get_or_load(th, "sids", Pending)
+                pools.allocate(f"/t{th}/l{round}", ("default", 100, 200), pending)
+        allocated = [sorted(sid for _, sid in cache.get(th, "sids").owners) for th in range(20)]
+        assert all(sids == [100, 101] for sids in allocated), allocated
+        assert cache.transactions() == 20
+        # the validation point ends a transaction, the idle ones expire
+        txcache.end(3)
+        assert cache.get(3, "sids") is None
+        clock[0] = 59
+        cache.get(5, "sids")
+        clock[0] = 61
+        assert cache.get(5, "sids") is not None and cache.get(7, "sids") is None
+        assert cache.transactions() == 2, cache.transactions()
+
+
+@case
+def validation_point_ends_the_transaction_caches() -> None:
+    import ncs
+
+    from .. import interface_index, sid_pool
+    from ..validation import IsisInputValidation
+
+    engine = _sid_engine()
+    engine.render()
+    th = engine.root.trans.th
+    assert sorted(sid for _, sid in sid_pool.pending(th).owners) == [100, 101]
+    assert interface_index._indexes.get(th, ("D1", "cisco-iosxr-cli")) is not None
+    trans = _diff_trans(engine, [("/rfs:rfs/bytel-isis:isis{D1}/interface{Loopback1}", ncs.MOP_CREATED)])
+    maapi = SimpleNamespace(attach=lambda tctx: trans, detach=lambda tctx: None, close=lambda: None)
+    with patch.object(ncs.maapi, "Maapi", lambda: maapi):
+        IsisInputValidation().cb_validate(SimpleNamespace(th=th), None, None)
+    # a later transaction reusing the handle does not see these SIDs
+    assert sid_pool.pending(th).owners == {}
+    assert interface_index._indexes.get(th, ("D1", "cisco-iosxr-cli")) is None
+
+
+#################################################################
+#   Uniqueness                                                  #
+#################################################################
+
+@case
+def uniqueness_index_conflicts_and_stale_claims() -> None:
+    from ..actions.selection import ServiceRef
+    from ..uniqueness import UniquenessIndex
+
+    index = UniquenessIndex()
+    a, b, c = (ServiceRef("instance", device, "OMEGA") for device in ("D1", "D2", "D1"))
+    claim = ("loopback0", "10.0.0.1")
+    index.rebuild([(a, {claim: "D1"})])
+    assert index.conflicts(c, {claim: "D1"}, lambda other: None) == []
+    assert index.conflicts(b, {claim: "D2"}, lambda other: None) == [(claim, a, "D1")]
+    # the other service changed its loopback0 since it was indexed
+    assert index.conflicts(b, {claim: "D2"}, lambda other: {}) == []
+    assert a not in index.holders(claim)
+
+
+@case
+def uniqueness_validation_rejects_duplicates() -> None:
+    engine = _engine({
+        "D1": _instance("OMEGA", "10.0.0.1") + _instance("ALPHA", "10.0.0.1") + _loopback("Loopback0", sr_id=7),
+        "D2": _instance("OMEGA", "10.0.0.1") + _loopback("Loopback0", sr_id=7),
+    })
+    problems = engine.validate()
+    assert any("isis{D2}/instance{OMEGA}: loopback0 10.0.0.1 already used by D1" in p for p in problems), problems
+    assert any("net-id" in p for p in problems), problems
+    assert any("isis{D2}/interface{Loopback0}: sr-id 7 in default already used by D1/Loopback0" in p for p in problems)
+    # two instances of D1 share its loopback0
+    assert not any("isis{D1}/instance{ALPHA}: loopback0" in p and "by D1 " in p for p in problems), problems
+
+
+@case
+def uniqueness_sr_ids_are_per_domain() -> None:
+    def sr(domain: str) -> str:
+        return f"<sr><domain>{domain}</domain></sr>"
+
+    engine = _engine({
+        "D1": _instance("OMEGA", "10.0.0.1", sr("north")) + _loopback("Loopback0", sr_id=7),
+        "D2": _instance("OMEGA", "10.0.0.2", sr("south")) + _loopback("Loopback0", sr_id=7),
+    })
+    assert not [p for p in engine.validate() if "sr-id" in p]
+
+
+@case
+def uniqueness_reads_only_the_checked_services() -> None:
+    from .. import registry
+
+    engine = _engine({
+        f"D{index}": _instance("OMEGA", f"10.0.0.{index}") + _loopback("Loopback0", sr_id=index)
+        for index in range(1, 21)
+    })
+    built = []
+    handler = registry.handlers.handler
+    # the index is rebuilt from the 40 services, only the checked one is built
+    with patch.object(registry.handlers, "handler", lambda *args: built.append(args) or handler(*args)):
+        assert engine.validate([("instance", "D1", "OMEGA")]) == []
+    assert len(built) == 1, built
+
+
+#################################################################
+#   Validation point                                            #
+#################################################################
+
+def _diff_trans(engine: Any, paths: list[tuple[str, int]]) -> Any:
+    '''Transaction of the engine whose diff holds the given (keypath, op)'''
+
+    from . import maagic
+
+    class Trans(maagic.Transaction):
+        def diff_iterate(self, iterate: Callable[..., int], flags: int) -> None:
+            for path, op in paths:
+                iterate(path, op, None, None)
+
+    return Trans(engine.root)
+
+
+def _validation_engine() -> Any:
+    import xml.etree.ElementTree as ET
+
+    core = "<inventory-template>CORE</inventory-template>"
+    engine = _engine({
+        "D1": _instance("OMEGA", "10.0.0.1") + _interface("BE1").replace("</name>", f"</name>{core}") + _interface("BE2"),
+        "D2": "<aggregate/>" + _instance("OMEGA", "10.0.0.2") + _interface("BE1").replace("</name>", f"</name>{core}"),
+    })
+    engine.load(ET.fromstring(
+        '<config xmlns="http://tail-f.com/ns/config/1.0"><rfs xmlns="http://bouyguestelecom.fr/rfs"><inventory>'
+        '<isis xmlns="http://bouyguestelecom.fr/isis"><interface><name>CORE</name><metric>10</metric></interface></isis>'
+        "</inventory></rfs></config>"
+    ))
+    return engine
+
+
+@case
+def validation_finds_the_inventory_dependents_in_the_index() -> None:
+    import ncs
+
+    from ..actions.selection import ServiceRef
+    from ..dependencies import dependency_index
+    from ..validation import changed_services
+
+    engine = _validation_engine()
+    engine.render()
+    inventory = "/rfs:rfs/rfs:inventory/bytel-isis:isis/interface{CORE}/metric"
+    trans = _diff_trans(engine, [
+        (inventory, ncs.MOP_VALUE_SET),
+        ("/rfs:rfs/bytel-isis:isis{D1}/instance{OMEGA}/area-id", ncs.MOP_VALUE_SET),
+    ])
+    # read from /rfs/isis once after a restart, the entries of D2 through its aggregate
+    with patch.object(dependency_index, "rebuild", wraps=dependency_index.rebuild) as rebuild:
+        assert changed_services(trans) == {
+            ServiceRef("instance", "D1", "OMEGA"), ServiceRef("interface", "D1", "BE1"), ServiceRef("interface", "D2", "BE1"),
+        }, changed_services(trans)
+    assert rebuild.call_count == 1, rebuild.call_args_list
+    # then kept up to date by the creates, /rfs/isis is not scanned
+    engine.service("interface", "D1", "BE2").inventory_template = "CORE"
+    engine.render([("interface", "D1", "BE2")])
+    with patch.object(dependency_index, "rebuild", side_effect=AssertionError("rebuilt")):
+        assert changed_services(_diff_trans(engine, [(inventory, ncs.MOP_VALUE_SET)])) == {
+            ServiceRef("interface", "D1", "BE1"), ServiceRef("interface", "D1", "BE2"), ServiceRef("interface", "D2", "BE1"),
+        }
+
+
+@case
+def validation_point_rejects_the_changed_services_only() -> None:
+    import xml.etree.ElementTree as ET
+
+    import ncs
+
+    from ..validation import IsisInputValidation, ServiceInputRejected
+
+    engine = _validation_engine()
+    engine.load(ET.fromstring(
+        '<config xmlns="http://tail-f.com/ns/config/1.0"><rfs xmlns="http://bouyguestelecom.fr/rfs">'
+        '<isis xmlns="http://bouyguestelecom.fr/isis"><device>D1</device>'
+        "<interface><name>BE3</name><isis-instance-id>OMEGA</isis-instance-id></interface></isis></rfs></config>"
+    ))
+
+    def validate(paths: list[tuple[str, int]]) -> None:
+        trans = _diff_trans(engine, paths)
+        maapi = SimpleNamespace(attach=lambda tctx: trans, detach=lambda tctx: None, close=lambda: None)
+        with patch.object(ncs.maapi, "Maapi", lambda: maapi):
+            IsisInputValidation().cb_validate(SimpleNamespace(th=trans.th), None, None)
+
+    validate([("/rfs:rfs/bytel-isis:isis{D1}/interface{BE1}/metric", ncs.MOP_VALUE_SET)])
+    try:
+        validate([("/rfs:rfs/bytel-isis:isis{D1}/interface{BE3}", ncs.MOP_CREATED)])
+    except ServiceInputRejected as err:
+        assert str(err) == (
+            "/rfs:rfs/bytel-isis:isis{D1}/interface{BE3}: Missing mandatory leaves for ISIS interface"
+            " (must be set in service or inventory): interface-type"
+        ), err
+    else:
+        raise AssertionError("BE3 accepted without interface-type")
+
+
+@case
+def validation_reports_input_errors_and_raises_the_others() -> None:
+    from ..actions.selection import ServiceRef
+    from ..validation import InputCheck
+
+    engine = _validation_engine()
+    ref = ServiceRef("interface", "D1", "BE1")
+    services = [(ref, engine.service("interface", "D1", "BE1"))]
+    with patch.object(InputCheck, "interface", side_effect=KeyError("unknown device D1")):
+        assert InputCheck().problems(None, engine.root, services) == [f"{ref.keypath}: 'unknown device D1'"]
+    with patch.object(InputCheck, "interface", side_effect=RuntimeError("bug")):
+        try:
+            InputCheck().problems(None, engine.root, services)
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("a bug reported as an input problem")
+
+
+#################################################################
+#   Aggregate mode                                              #
+#################################################################
+
+@case
+def aggregate_removal_needs_the_entries_re_deployed() -> None:
+    from ..actions.selection import ServiceRef
+    from ..validation import aggregate_problems
+
+    engine = _engine({"D1": _instance("OMEGA", "10.0.0.1") + _loopback("Loopback0")})
+    entries = {ServiceRef("instance", "D1", "OMEGA"), ServiceRef("interface", "D1", "Loopback0")}
+    problems = aggregate_problems(engine.root, {"D1"}, {ServiceRef("instance", "D1", "OMEGA")})
+    assert problems == [
+        "/rfs:rfs/bytel-isis:isis{D1}/aggregate: removed while 1 entries would not be re-deployed with it,"
+        " use: request rfs isis D1 aggregate disable"
+    ], problems
+    assert aggregate_problems(engine.root, {"D1"}, entries) == []
+    # the whole device is deleted: nothing left to render
+    assert aggregate_problems(engine.root, {"D2"}, set()) == []
+
+
+@case
+def aggregate_kickers_use_xpaths() -> None:
+    engine = _engine({"D1": "<aggregate/>" + _instance("OMEGA", "10.0.0.1") + _loopback("Loopback0")})
+    engine.render([("device", "D1", "aggregate")])
+    kickers = engine.root.kickers.data_kicker.entries
+    assert sorted(kickers) == ["isis-aggregate-D1-instance", "isis-aggregate-D1-interface"], sorted(kickers)
+    for kicker in kickers.values():
+        assert kicker.kick_node == "/rfs:rfs/bytel-isis:isis[bytel-isis:device='D1']/bytel-isis:aggregate"
+        assert "{" not in kicker.monitor, kicker.monitor
+
+
+@case
+def bench_counts_the_same_services_in_both_modes() -> None:
+    from .bench import DEFAULT_MIX, Fleet, Scenario
+
+    split = Fleet(Scenario(2, 3), DEFAULT_MIX).engine()[1]
+    aggregated = Fleet(Scenario(2, 3), DEFAULT_MIX, aggregate=True).engine()[1]
+    assert len(split) == Fleet(Scenario(2, 3), DEFAULT_MIX).entries == 8, split
+    assert [kind for kind, _, _ in aggregated] == ["device", "device"], aggregated
+
+
+#################################################################
+#   Brownfield import                                           #
+#################################################################
+
+@case
+def net_id_round_trip() -> None:
+    from ..utils import generate_net_id, parse_net_id
+
+    for ip, area in (("1.23.45.167", "49.0010"), ("10.0.0.1", "49.0001"), ("255.255.255.0", "49")):
+        assert parse_net_id(generate_net_id(ip, area)) == (ip, area), ip
+    for net_id in ("49.0001.00", "49.0001.0100.0000.01.00"):
+        try:
+            parse_net_id(net_id)
+        except ValueError:
+            continue
+        raise AssertionError(f"parsed {net_id}")
+
+
+def _config(xml: str) -> Any:
+    import xml.etree.ElementTree as ET
+
+    return ET.fromstring(f"<config>{xml}</config>")
+
+
+@case
+def brownfield_iosxr_decodes_the_hello_password() -> None:
+    from .. import brownfield
+    from ..utils import CiscoType7, generate_net_id
+
+    with patch.object(brownfield.logging, "warning") as warning:
+        found = brownfield.discover("cisco-iosxr-cli", _config(
+            "<router><isis><tag><name>OMEGA</name>"
+            f"<net><id>{generate_net_id('10.0.0.1', '49.0001')}</id></net>"
+            "<address-family><ipv4><unicast><segment-routing><mpls/></segment-routing></unicast></ipv4></address-family>"
+            "<interface><name>Loopback0</name><interface-type>passive</interface-type>"
+            "<address-family><ipv4><unicast><prefix-sid><absolute>16001</absolute></prefix-sid></unicast></ipv4>"
+            "</address-family></interface>"
+            "<interface><name>Bundle-Ether1</name><circuit-type>level-2-only</circuit-type>"
+            f"<hello-password><encrypted>{CiscoType7.encode('secret')}</encrypted></hello-password>"
+            "<address-family><ipv4><unicast><metric>10</metric></unicast></ipv4></address-family></interface>"
+            "<interface><name>Bundle-Ether2</name><hello-password><encrypted>zz</encrypted></hello-password>"
+            "</interface></tag></isis></router>"
+        ))
+    assert [(f.kind, f.key) for f in found] == [
+        ("instance", "OMEGA"), ("interface", "Loopback0"), ("interface", "Bundle-Ether1"), ("interface", "Bundle-Ether2"),
+    ], found
+    assert found[0].leaves == {"loopback0": "10.0.0.1", "area-id": "49.0001", "mpls": True}, found[0]
+    assert found[1].leaves["loopback-attribs"] == {"sr-id": "16001"}, found[1]
+    assert found[2].leaves == {
+        "isis-instance-id": "OMEGA", "interface-type": "common", "circuit-type": "level-2-only",
+        "metric": "10", "passwd": "secret",
+    }, found[2]
+    # an undecodable password is dropped, not imported as is
+    assert "passwd" not in found[3].leaves, found[3]
+    assert warning.call_count == 1, warning.call_args_list
+
+
+@case
+def brownfield_alusr_decodes_the_hello_key() -> None:
+    from .. import brownfield
+
+    def interface(name: str, key: str) -> str:
+        return (
+            f"<interface><name>{name}</name><level-capability>level-2</level-capability>"
+            f"<level><id>2</id><hello-authentication-key><key>{key}</key></hello-authentication-key>"
+            "<metric>20</metric></level></interface>"
+        )
+
+    with patch.object(brownfield.logging, "warning") as warning:
+        found = brownfield.discover("alu-sr-cli", _config(
+            "<router><name>Base</name><interface><name>system</name><address>10.0.0.1/32</address></interface>"
+            "<isis-list><id>0</id><area-id><id>49.0001</id></area-id>"
+            + interface("TO_PE1", "4289744437") + interface("TO_PE2", '"4289744437"')
+            + interface("TO_PE3", '"Kx1eT2oE8zc" hash2')
+            + "<interface><name>system</name><passive/></interface></isis-list></router>"
+        ))
+    assert warning.call_count == 1, warning.call_args_list
+    instance, *interfaces = found
+    assert instance.leaves == {"area-id": "49.0001", "loopback0": "10.0.0.1"}, instance
+    assert [f.leaves.get("passwd") for f in interfaces] == ["4289744437", "4289744437", None, None], interfaces
+    assert interfaces[0].leaves["circuit-type"] == "level-2-only", interfaces[0]
+    assert interfaces[3].leaves == {"isis-instance-id": "0", "interface-type": "loopback", "loopback-attribs": True}
+
+
+@case
+def brownfield_huawei_maps_trunks_and_loopbacks() -> None:
+    from ..brownfield import discover
+    from ..utils import generate_net_id
+
+    found = discover("huawei-vrp-cli", _config(
+        f"<isis><id>1</id><network-entity>{generate_net_id('10.0.0.2', '49.0002')}</network-entity>"
+        "<frr><ti-lfa>level-2</ti-lfa></frr></isis>"
+        "<interface><Eth-Trunk><name>3.100</name><isis><enable>1</enable><circuit-level>level-2</circuit-level>"
+        "<cost><cost-value>30</cost-value></cost></isis></Eth-Trunk>"
+        "<Eth-Trunk><name>4</name></Eth-Trunk>"
+        "<LoopBack><name>0</name><isis><enable>1</enable></isis></LoopBack></interface>"
+    ))
+    assert [(f.kind, f.key) for f in found] == [
+        ("instance", "1"), ("interface", "Eth-Trunk3.100"), ("interface", "Loopback0"),
+    ], found
+    assert found[0].leaves == {
+        "loopback0": "10.0.0.2", "area-id": "49.0002", "fast-reroute": {"ti-lfa-level": "level-2"},
+    }, found[0]
+    assert found[1].leaves["common-attributes"] == {"id": "3", "type": "LAG", "subif-id": "100"}, found[1]
+    assert found[1].leaves["circuit-type"] == "level-2-only", found[1]
+
+
+@case
+def import_failure_leaves_nothing_of_the_device() -> None:
+    from ..actions import importer
+    from ..actions.importer import ImportStatus, IsisFleetImport
+    from ..brownfield import Discovered
+
+    engine = _engine({"D1": _instance("OMEGA", "10.0.0.1")})
+    discovered = [
+        Discovered("instance", "OMEGA", {}),
+        Discovered("instance", "ALPHA", {"loopback0": "10.0.0.9"}),
+        Discovered("interface", "Loopback0", {"isis-instance-id": "ALPHA", "bad": "leaf"}),
+    ]
+
+    def set_leaves(node: Any, leaves: dict[str, Any]) -> None:
+        if "bad" in leaves:
+            raise ValueError("bad leaf")
+
+    action = IsisFleetImport.__new__(IsisFleetImport)
+    with patch.object(importer, "read_device_config"), patch.object(importer, "set_leaves", set_leaves), \
+            patch.object(importer.brownfield, "discover", lambda ned, config: discovered):
+        for device in ("D1", "D2"):
+            status = ImportStatus("admin")
+            try:
+                action._import_device(engine.root.trans, device, "cisco-iosxr-cli", status)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(f"{device} imported")
+            assert status.existing == 0, status.existing
+    isis = engine.root.rfs.isis
+    assert list(isis) and "D2" not in isis, list(isis)
+    assert [str(i.instance_id) for i in isis["D1"].instance] == ["OMEGA"]
+    assert not list(isis["D1"].interface)
+
+
+#################################################################
+#   Startup                                                     #
+#################################################################
+
+@case
+def import_timer_only_wraps_the_package() -> None:
+    from .. import __path__ as package_path
+    from ..startup import ImportTimer, _TimedLoader
+
+    timer = ImportTimer()
+    assert timer.find_spec("xml.dom.minidom", None) is None
+    spec = timer.find_spec("isis.flatten", package_path)
+    assert isinstance(spec.loader, _TimedLoader), spec
+    # a lookup in progress in this thread does not hide the module from another one
+    timer._local.finding = {"isis.flatten"}
+    assert timer.find_spec("isis.flatten", package_path) is None
+    found = []
+    thread = threading.Thread(target=lambda: found.append(timer.find_spec("isis.flatten", package_path)))
+    thread.start()
+    thread.join()
+    assert found[0] is not None
+
+
+@case
+def template_preload_reports_unset_variables() -> None:
+    from .. import template_check
+
+    assert template_check.preload() == []
+    # a handler not setting the variables of its template
+    broken = SimpleNamespace(
+        common_variables=(), template_variables={"cisco-iosxr-cli/cisco-iosxr-cli-isis-instance-template": ()},
+    )
+    real = template_check.handlers.handler
+
+    def handler(service_type: str, logic: Optional[str] = None) -> Any:
+        return broken if service_type == "instance" else real(service_type, logic)
+
+    with patch.object(template_check.handlers, "handler", handler), patch("logging.warning"):
+        problems = template_check.preload()
+    assert len(problems) == 1 and "variables never set: DEVICE" in problems[0], problems
+
+
+#################################################################
+#   Audit                                                       #
+#################################################################
+
+@case
+def audit_compare_reports_missing_and_different_leaves() -> None:
+    import xml.etree.ElementTree as ET
+
+    from ..audit import Drift, ServiceAudit, compare
+
+    intent = ET.fromstring(
+        "<config><router><isis><tag><name>OMEGA</name><is-type>level-2-only</is-type>"
+        "<interface><name>BE1</name><metric>10</metric><circuit-type>level-2-only</circuit-type></interface>"
+        "<interface><name>BE2</name><metric>20</metric></interface>"
+        "<interface><name>BE3</name><metric>30</metric></interface>"
+        "</tag></isis></router></config>"
+    )
+    # namespaced as read from the device, entries in another order, extra leaves ignored
+    actual = ET.fromstring(
+        '<config xmlns="http://tail-f.com/ns/config/1.0"><router xmlns="http://tail-f.com/ned/cisco-ios-xr">'
+        "<isis><tag><name>OMEGA</name><is-type>level-2-only</is-type><nsr/>"
+        "<interface><name>BE2</name><metric>25</metric><bfd/></interface>"
+        "<interface><name>BE1</name><metric>10</metric></interface>"
+        "</tag></isis></router></config>"
+    )
+    tag = "/router/isis/tag{OMEGA}"
+    assert list(compare(intent, actual)) == [
+        Drift(f"{tag}/interface{{BE1}}/circuit-type", "level-2-only", None),
+        Drift(f"{tag}/interface{{BE2}}/metric", "20", "25"),
+        Drift(f"{tag}/interface{{BE3}}/name", "BE3", None),
+        Drift(f"{tag}/interface{{BE3}}/metric", "30", None),
+    ]
+    assert list(compare(intent, intent)) == []
+    # nothing on the device: every intent leaf is missing
+    assert len(list(compare(intent, None))) == 9
+
+    audit = ServiceAudit("/rfs:rfs/bytel-isis:isis{D1}/instance{OMEGA}", "D1", [Drift("/x", "1", None)])
+    assert audit.status == "drift" and ServiceAudit("k", "D1", []).status == "compliant"
+    assert ServiceAudit("k", "D1", [], "timeout").status == "error"
+    assert audit.to_json() == (
+        '{"device": "D1", "drift": [{"actual": null, "expected": "1", "path": "/x"}],'
+        ' "service": "/rfs:rfs/bytel-isis:isis{D1}/instance{OMEGA}", "status": "drift"}'
+    )
+
+
+#################################################################
+#   Scheduler                                                   #
+#################################################################
+
+@case
+def scheduler_runs_devices_in_parallel_services_in_order() -> None:
+    import contextlib
+
+    from ..actions.scheduler import Outcome, Scheduler
+    from ..actions.selection import ServiceRef
+
+    services = [ServiceRef("interface", f"D{index % 4}", f"BE{index}") for index in range(12)]
+    lock = threading.Lock()
+    running: dict[str, int] = {}
+    peak = [0]
+    batches: list[list[str]] = []
+    done: dict[str, list[str]] = {}
+
+    @contextlib.contextmanager
+    def open_batch() -> Any:
+        batch: list[str] = []
+        with lock:
+            batches.append(batch)
+        yield batch
+
+    def work(batch: list[str], service: ServiceRef) -> str:
+        with lock:
+            running[service.device] = running.get(service.device, 0) + 1
+            assert running[service.device] == 1, f"two services of {service.device} at once"
+            peak[0] = max(peak[0], sum(bool(count) for count in running.values()))
+        time.sleep(0.002)
+        with lock:
+            running[service.device] -= 1
+            done.setdefault(service.device, []).append(service.key)
+        batch.append(service.key)
+        if service.key == "BE5":
+            raise ValueError("rejected")
+        return f"{service.key} done"
+
+    messages: list[str] = []
+    outcomes = Scheduler(2, 2, messages.append).run(services, open_batch, work)
+    assert len(outcomes) == 12 and peak[0] <= 2, (len(outcomes), peak)
+    # per device, the services one after the other in the selection order
+    assert done["D1"] == ["BE1", "BE5", "BE9"], done
+    assert sorted(len(batch) for batch in batches) == [1, 1, 1, 1, 2, 2, 2, 2], batches
+    assert [o for o in outcomes if not o.ok] == [Outcome(ServiceRef("interface", "D1", "BE5"), "rejected")]
+    assert outcomes[0].detail == "BE0 done"
+    assert messages[0] == "12 services selected on 4 devices" and messages[-1].startswith("12/12 services processed, 1 failed")
+
+
+@case
+def scheduler_fails_the_services_of_a_failed_batch() -> None:
+    import contextlib
+
+    from ..actions.scheduler import Scheduler
+    from ..actions.selection import ServiceRef
+
+    opened = [0]
+
+    @contextlib.contextmanager
+    def open_batch() -> Any:
+        opened[0] += 1
+        if opened[0] == 2:
+            raise RuntimeError("no session")
+        yield None
+
+    services = [ServiceRef("instance", "D1", f"I{index}") for index in range(5)]
+    outcomes = Scheduler(1, 2, lambda message: None).run(services, open_batch, lambda context, service: "")
+    assert [o.error for o in outcomes] == [None, None, "batch failed: no session", "batch failed: no session", None]
+
+
+@case
+def redeploy_commits_each_batch_once() -> None:
+    import contextlib
+
+    import ncs
+
+    from ..actions.redeploy import redeploy_batch, touch
+    from ..actions.scheduler import Scheduler
+    from ..actions.selection import ServiceRef
+
+    commits: list[tuple[str, list[str]]] = []
+
+    class Trans:
+        def __init__(self) -> None:
+            self.touched: list[str] = []
+            self.params = SimpleNamespace(label=lambda label: setattr(self, "label", label))
+
+        def touch(self, keypath: str) -> None:
+            self.touched.append(keypath)
+
+        def get_params(self) -> Any:
+            return self.params
+
+        def apply_params(self, keep_open: bool, params: Any) -> None:
+            if any("D2" in keypath for keypath in self.touched):
+                raise RuntimeError("aborted")
+            commits.append((self.label, [keypath.rsplit("{", 1)[-1].rstrip("}") for keypath in self.touched]))
+
+    @contextlib.contextmanager
+    def single_write_trans(username: str, context: str) -> Any:
+        yield Trans()
+
+    services = [ServiceRef("interface", device, f"BE{index}") for device in ("D1", "D2") for index in range(5)]
+    with patch.object(ncs.maapi, "single_write_trans", single_write_trans, create=True):
+        outcomes = Scheduler(2, 2, lambda message: None).run(services, lambda: redeploy_batch("admin", "L"), touch)
+    assert sorted(commits) == [("L", ["BE0", "BE1"]), ("L", ["BE2", "BE3"]), ("L", ["BE4"])], commits
+    assert [o.ok for o in outcomes] == [True] * 5 + [False] * 5, outcomes
+    assert {o.error for o in outcomes if not o.ok} == {"batch failed: aborted"}
+
+
+#################################################################
+#   Dependencies                                                #
+#################################################################
+
+@case
+def changed_key_parses_the_diff_paths() -> None:
+    import ncs
+
+    from ..dependencies import changed_key
+
+    inventory = "/rfs:rfs/rfs:inventory/bytel-isis:isis"
+    instance = '/rfs:rfs/bytel-isis:isis{D1}/instance{"OMEGA 2"}'
+    cases = [
+        # inventory entries: any input leaf, created or deleted entry
+        (f"{inventory}/interface{{CORE}}/metric", ncs.MOP_VALUE_SET, (("inventory", "interface", "CORE"), ncs.ITER_CONTINUE)),
+        (f"{inventory}/instance{{P1}}", ncs.MOP_CREATED, (("inventory", "instance", "P1"), ncs.ITER_CONTINUE)),
+        (f"{inventory}/instance{{P1}}", ncs.MOP_DELETED, (("inventory", "instance", "P1"), ncs.ITER_CONTINUE)),
+        (f"{inventory}/instance{{P1}}", ncs.MOP_MODIFIED, (None, ncs.ITER_RECURSE)),
+        (f"{inventory}/interface{{CORE}}/private/property-list", ncs.MOP_MODIFIED, (None, ncs.ITER_CONTINUE)),
+        # isis instances: only the leaves the interfaces depend on, keys unquoted
+        (f"{instance}/area-id", ncs.MOP_VALUE_SET, (("instance", "D1", "OMEGA 2"), ncs.ITER_CONTINUE)),
+        (f"{instance}/sr/lower-bound", ncs.MOP_VALUE_SET, (("instance", "D1", "OMEGA 2"), ncs.ITER_CONTINUE)),
+        (f"{instance}/loopback0", ncs.MOP_VALUE_SET, (None, ncs.ITER_CONTINUE)),
+        (f"{instance}/modified", ncs.MOP_MODIFIED, (None, ncs.ITER_CONTINUE)),
+        (instance, ncs.MOP_DELETED, (("instance", "D1", "OMEGA 2"), ncs.ITER_CONTINUE)),
+        (instance, ncs.MOP_MODIFIED, (None, ncs.ITER_RECURSE)),
+        # anything else: look deeper
+        ("/rfs:rfs/bytel-isis:isis{D1}", ncs.MOP_MODIFIED, (None, ncs.ITER_RECURSE)),
+        ("/rfs:rfs/bytel-isis:isis{D1}/interface{BE1}/metric", ncs.MOP_VALUE_SET, (None, ncs.ITER_RECURSE)),
+    ]
+    for path, op, expected in cases:
+        assert changed_key(path, op) == expected, (path, changed_key(path, op))
+
+
+#################################################################
+#   Effective views                                             #
+#################################################################
+
+@case
+def effective_subscriber_ignores_service_meta_data() -> None:
+    import ncs
+
+    from ..actions.selection import ServiceRef
+    from ..effective import Changes, EffectiveSubscriber
+
+    subscriber = EffectiveSubscriber.__new__(EffectiveSubscriber)
+    paths: list[str] = []
+    subscriber.register = lambda path, priority: paths.append(path)
+    subscriber.init()
+    assert "/rfs:rfs/bytel-isis:isis" not in paths and len(paths) == 3, paths
+
+    state = Changes()
+    isis = "/rfs:rfs/bytel-isis:isis{D1}"
+    for path, op in (
+        (f"{isis}/interface{{Loopback0}}/private/property-list/property{{fingerprint}}", ncs.MOP_CREATED),
+        (f"{isis}/interface{{Loopback0}}/modified", ncs.MOP_MODIFIED),
+        (f"{isis}/instance{{OMEGA}}/private", ncs.MOP_MODIFIED),
+        ("/rfs:rfs/rfs:inventory/bytel-isis:isis/interface{CORE}/private", ncs.MOP_MODIFIED),
+    ):
+        assert subscriber.iterate(path, op, None, None, state) == ncs.ITER_CONTINUE, path
+    assert not subscriber.should_post_iterate(state), vars(state)
+
+    subscriber.iterate(f"{isis}/interface{{Bundle-Ether1}}/metric", ncs.MOP_VALUE_SET, None, "20", state)
+    subscriber.iterate(f"{isis}/instance{{OMEGA}}/area-id", ncs.MOP_VALUE_SET, None, "49.0002", state)
+    subscriber.iterate(f"{isis}/interface{{Loopback1}}", ncs.MOP_DELETED, None, None, state)
+    subscriber.iterate("/rfs:rfs/bytel-isis:isis{D2}", ncs.MOP_DELETED, None, None, state)
+    assert state.services == {ServiceRef("interface", "D1", "Bundle-Ether1"), ServiceRef("instance", "D1", "OMEGA")}
+    assert state.keys == {("instance", "D1", "OMEGA")}, state.keys
+    assert state.gone == {ServiceRef("interface", "D1", "Loopback1")} and state.devices == {"D2"}
+
+
+#################################################################
+#   Device interfaces                                           #
+#################################################################
+
+@case
+def interface_index_names_the_interfaces_per_ned() -> None:
+    from ..interface_index import device_interfaces
+    from . import OfflineEngine
+
+    engine = OfflineEngine()
+    engine.add_device("XR", "cisco-iosxr-cli", _config(
+        "<interface><Loopback><id>0</id></Loopback><Bundle-Ether><id>30</id></Bundle-Ether>"
+        "<Bundle-Ether-subinterface><Bundle-Ether><id>30.1450</id></Bundle-Ether></Bundle-Ether-subinterface>"
+        "<HundredGigE><id>0/0/0/1</id></HundredGigE></interface>"
+    ))
+    engine.add_device("SR", "alu-sr-cli", _config(
+        "<router><router-name>Base</router-name><interface><interface-name>TO_OAR01</interface-name></interface>"
+        "<interface><interface-name>system</interface-name></interface></router>"
+    ))
+    engine.add_device("VRP", "huawei-vrp-cli", _config(
+        "<interface><Eth-Trunk><name>10</name></Eth-Trunk><Eth-Trunk><name>10.100</name></Eth-Trunk>"
+        "<LoopBack><name>0</name></LoopBack></interface>"
+    ))
+    root = engine.root
+    assert device_interfaces(root, "XR", "cisco-iosxr-cli") == {
+        "Loopback0", "Bundle-Ether30", "Bundle-Ether30.1450", "HundredGigE0/0/0/1",
+    }
+    assert device_interfaces(root, "SR", "alu-sr-cli") == {"TO_OAR01", "system"}
+    assert device_interfaces(root, "VRP", "huawei-vrp-cli") == {"Eth-Trunk10", "Eth-Trunk10.100", "LoopBack0"}
+
+
+@case
+def interface_index_checks_only_the_devices_with_interfaces() -> None:
+    from ..interface_index import missing_interface
+    from ..model import IsisInterfaceInput
+    from . import OfflineEngine
+
+    def model(**leaves: Any) -> Any:
+        service = SimpleNamespace(name="BE1", loopback_attribs=None, common_attributes=None)
+        return IsisInterfaceInput.build(service, leaves)
+
+    engine = OfflineEngine()
+    engine.add_device("NEW", "cisco-iosxr-cli")
+    engine.add_device("VRP", "huawei-vrp-cli", _config("<interface><Eth-Trunk><name>10</name></Eth-Trunk></interface>"))
+    root = engine.root
+    # never synced: nothing to compare with
+    assert missing_interface(root, "NEW", "cisco-iosxr-cli", model()) is None
+    lag = {"interface_type": "common", "common_attributes": {"id": "10", "type": "LAG"}}
+    assert missing_interface(root, "VRP", "huawei-vrp-cli", model(**lag)) is None
+    sub = {**lag, "common_attributes": {"id": "10", "type": "LAG", "subif_id": 100}}
+    assert missing_interface(root, "VRP", "huawei-vrp-cli", model(**sub)) == "Eth-Trunk10.100"
+    # no name to check (loopback without loopback-id), an unknown NED
+    assert missing_interface(root, "VRP", "huawei-vrp-cli", model(interface_type="loopback")) is None
+    assert missing_interface(root, "VRP", "juniper-junos-nc", model()) is None
+
+
+@case
+def interface_handler_reports_the_missing_interface() -> None:
+    engine = _engine({"D1": _instance("OMEGA", "10.0.0.1") + _interface("Bundle-Ether1") + _interface("Bundle-Ether2")})
+    engine.add_device("D1", "cisco-iosxr-cli", _config("<interface><Bundle-Ether><id>1</id></Bundle-Ether></interface>"))
+    assert engine.validate() == [
+        "/rfs:rfs/bytel-isis:isis{D1}/interface{Bundle-Ether2}: Interface Bundle-Ether2 not found on device D1",
+    ], engine.validate()
+
+
+#################################################################
+#   Statistics                                                  #
+#################################################################
+
+@case
+def stats_percentiles_over_the_reservoir() -> None:
+    from .. import stats
+
+    histogram = stats.Histogram()
+    assert histogram.percentiles(0.50, 0.99) == [0, 0]
+    for usec in range(100, 0, -1):
+        histogram.record(usec)
+    assert histogram.percentiles(0.50, 0.95, 0.99, 1.0) == [51, 96, 100, 100]
+    assert (histogram.count, histogram.max) == (100, 100)
+    # only the last RESERVOIR_SIZE samples count, the count and max cover all of them
+    for _ in range(stats.RESERVOIR_SIZE):
+        histogram.record(7)
+    assert histogram.percentiles(0.0, 0.50, 0.99) == [7, 7, 7]
+    assert (histogram.count, histogram.max) == (100 + stats.RESERVOIR_SIZE, 100)
+
+
+@case
+def stats_registry_reports_phases_in_order_and_resets() -> None:
+    from .. import stats
+
+    registry = stats.Registry()
+
+    @registry.measure("interface")
+    def create(fail: bool) -> None:
+        registry.set_ned("cisco-iosxr-cli")
+        for phase in ("apply", "prepare", "fingerprint"):
+            with registry.phase(phase):
+                pass
+        if fail:
+            raise ValueError("bad input")
+
+    create(False)
+    try:
+        create(True)
+    except ValueError:
+        pass
+    # outside a create, phases are not recorded
+    with registry.phase("apply"):
+        pass
+    report = registry.snapshot()["interface"]["cisco-iosxr-cli"]
+    assert report["errors"] == 1, report
+    assert list(report["phases"]) == ["fingerprint", "prepare", "apply", "total"], report
+    assert {values["count"] for values in report["phases"].values()} == {2}, report
+
+    generation = registry.generation
+    registry.reset()
+    assert registry.snapshot() == {} and registry.generation == generation + 1
+
+
+#################################################################
+#   Tracing                                                     #
+#################################################################
+
+@case
+def tracing_samples_on_a_crc_of_the_service_or_device() -> None:
+    import zlib
+
+    from ..tracing import Tracer, log
+
+    tracer = Tracer()
+    keypaths = [(f"/rfs:rfs/bytel-isis:isis{{D{index % 10}}}/interface{{BE{index}}}", f"D{index % 10}") for index in range(200)]
+    with patch.object(log, "isEnabledFor", lambda level: True):
+        # off until configured
+        assert not any(tracer.sampled(keypath, device) for keypath, device in keypaths)
+        tracer.configure("hash", 30)
+        sampled = {keypath for keypath, device in keypaths if tracer.sampled(keypath, device)}
+        assert sampled == {keypath for keypath, _ in keypaths if zlib.crc32(keypath.encode()) % 100 < 30}
+        assert 0 < len(sampled) < len(keypaths)
+        # by device: all the services of a device, or none
+        tracer.configure("hash", 30, "device")
+        devices = {device: tracer.sampled(keypath, device) for keypath, device in keypaths}
+        assert all(tracer.sampled(keypath, device) == devices[device] for keypath, device in keypaths)
+        tracer.configure("full", 100, device="D1*")
+        assert [device for keypath, device in keypaths if tracer.sampled(keypath, device)] == ["D1"] * 20
+    # nothing either when the logger would drop the records
+    with patch.object(log, "isEnabledFor", lambda level: False):
+        assert not tracer.sampled(*keypaths[1])
+
+
+@case
+def trace_action_configures_the_tracer() -> None:
+    from ..actions.trace import IsisTraceSettings
+    from ..tracing import tracer
+
+    saved = (tracer.level, tracer.percent, tracer.sample_by, tracer.device)
+    try:
+        output = SimpleNamespace()
+        action_input = SimpleNamespace(level="hash", sample_percent=5, sample_by="device", device="OAR*")
+        IsisTraceSettings().cb_action(None, "trace", None, action_input, output, None)
+        assert (tracer.level, tracer.percent, tracer.sample_by, tracer.device) == ("hash", 5, "device", "OAR*")
+        assert output.result == "isis trace level hash, 5% of the devices matching OAR*", output.result
+        try:
+            tracer.configure("verbose")
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("unknown level accepted")
+        assert tracer.level == "hash"
+    finally:
+        tracer.configure(*saved)
+
+
+#################################################################
+#   Profiling                                                   #
+#################################################################
+
+@case
+def profile_captures_one_create_at_a_time() -> None:
+    import tempfile
+
+    from ..profiling import ProfileCapture, cProfile
+
+    capture = ProfileCapture()
+    nested: list[Any] = []
+
+    @capture.profile
+    def create(self_: Any, tctx: Any, root: Any, service: Any, proplist: Any) -> str:
+        if service.device == "D1":
+            # another create, in another thread, while D1 is profiled
+            other = SimpleNamespace(device="D2", _path="/isis{D2}")
+            thread = threading.Thread(target=lambda: nested.append(create(None, tctx, None, other, [])))
+            thread.start()
+            thread.join()
+        return service.device
+
+    with tempfile.TemporaryDirectory() as directory:
+        capture.arm(2, directory=directory)
+        tctx = SimpleNamespace(th=7)
+        assert create(None, tctx, None, SimpleNamespace(device="D1", _path="/isis{D1}"), []) == "D1"
+        assert nested == ["D2"] and capture.remaining == 1, (nested, capture.remaining)
+        assert [path.name for path in capture.captured] == ["isis_D1-th7.pstats"], capture.captured
+
+        # python 3.12+ refuses a second profiler: the create runs and keeps its capture
+        with patch.object(cProfile.Profile, "enable", side_effect=ValueError("Another profiling tool is already active")), \
+                patch("logging.warning"):
+            assert create(None, tctx, None, SimpleNamespace(device="D3", _path="/isis{D3}"), []) == "D3"
+        assert capture.remaining == 1 and len(capture.captured) == 1
+        create(None, tctx, None, SimpleNamespace(device="D4", _path="/isis{D4}"), [])
+        assert capture.remaining == 0 and len(capture.captured) == 2
+
+
+#################################################################
+#   Provisioning                                                #
+#################################################################
+
+@case
+def provision_reads_each_line_with_its_number() -> None:
+    import io
+
+    from ..actions.provision import Result, Spec, by_device, chunked, read_specs
+
+    stream = io.StringIO(
+        '{"device": "D1", "kind": "interface", "key": "BE1", "leaves": {"metric": 10}}\n'
+        "\n"
+        '{"device": "D1", "kind": "instance", "key": 7}\n'
+        "{bad json\n"
+        '{"device": "D2", "kind": "vrf", "key": "A"}\n'
+        '["D2"]\n'
+        '{"device": "", "kind": "instance", "key": "A"}\n'
+        '{"device": "D2", "kind": "instance", "key": "A", "leaves": []}\n'
+    )
+    items = list(read_specs(stream, after=0))
+    assert [item.line for item in items] == [1, 3, 4, 5, 6, 7, 8], items
+    assert items[0] == Spec(1, "D1", "interface", "BE1", {"metric": 10}), items[0]
+    assert items[1].key == "7" and items[1].leaves == {}, items[1]
+    errors = {item.line: item.error for item in items if isinstance(item, Result)}
+    assert errors[4] == "Expecting property name enclosed in double quotes at column 2", errors
+    assert errors[5].startswith("kind must be one of") and errors[6] == "a spec is a JSON object", errors
+    assert errors[7] == "device and key are mandatory" and errors[8] == "leaves must be a JSON object", errors
+
+    stream.seek(0)
+    assert [item.line for item in read_specs(stream, after=4)] == [5, 6, 7, 8]
+    assert [len(chunk) for chunk in chunked(range(5), 2)] == [2, 2, 1]
+    # instances first on each device, then the stream order
+    specs = [items[0], items[1], Spec(9, "D0", "interface", "L0", {}), Spec(10, "D1", "interface", "BE0", {})]
+    assert [spec.line for spec in by_device(specs)] == [9, 3, 1, 10]
+
+
+@case
+def provision_maps_problems_to_their_lines() -> None:
+    from ..actions.provision import Spec, check_specs
+    from ..audit import AuditContext
+
+    engine = _engine({"D1": _instance("OMEGA", "10.0.0.1"), "D2": ""})
+    specs = [
+        Spec(3, "D2", "instance", "A", {"area-id": "49.0001", "loopback0": "10.0.0.2"}),
+        Spec(5, "D2", "instance", "B", {"area-id": "49.0001"}),
+        Spec(6, "D3", "instance", "A", {}),
+        Spec(7, "D2", "instance", "B", {"export": "POLICY"}),
+        Spec(9, "D2", "interface", "Loopback0", {"isis-instance-id": "A", "interface-type": "loopback"}),
+    ]
+    problems = check_specs(AuditContext(engine.root.trans.th), engine.root, specs)
+    assert problems == {
+        5: "loopback0 must be configured for ISIS instance B",
+        6: "unknown device D3",
+        7: "loopback0 must be configured for ISIS instance B",
+    }, problems
+
+
+#################################################################
+#   Password rotation                                           #
+#################################################################
+
+def _interface(name: str, instance_id: str = "OMEGA", passwd: str = "old") -> str:
+    return (
+        f"<interface><name>{name}</name><isis-instance-id>{instance_id}</isis-instance-id>"
+        f"<interface-type>common</interface-type><passwd>{passwd}</passwd></interface>"
+    )
+
+
+def _rotate(engine: Any, chunk_size: int, failing_chunk: Optional[int] = None) -> tuple[Any, list[str]]:
+    '''Runs the rotation action on the engine, commits failing from `failing_chunk`'''
+
+    import contextlib
+
+    import ncs
+
+    from . import maagic
+    from ..actions.passwd import IsisPasswdRotation
+
+    commits: list[str] = []
+
+    class Trans(maagic.Transaction):
+        def get_params(self) -> Any:
+            return SimpleNamespace(label=lambda label: setattr(self, "label", label), comment=lambda comment: None)
+
+        def apply_params(self, keep_open: bool, params: Any) -> None:
+            if failing_chunk is not None and len(commits) + 1 >= failing_chunk:
+                raise RuntimeError("aborted")
+            commits.append(self.label)
+
+    @contextlib.contextmanager
+    def single_write_trans(username: str, context: str) -> Any:
+        yield Trans(engine.root)
+
+    chunks: dict[int, Any] = {}
+    output = SimpleNamespace(chunk=SimpleNamespace(
+        create=lambda number: chunks.setdefault(number, SimpleNamespace(error=None, changed=None)),
+    ))
+    output.chunks = chunks
+    action_input = SimpleNamespace(passwd="new", chunk_size=chunk_size)
+    with patch.object(ncs.maapi, "single_write_trans", single_write_trans, create=True):
+        IsisPasswdRotation().cb_action(SimpleNamespace(username="admin"), "rotate", None, action_input, output, engine.root.trans)
+    return output, commits
+
+
+@case
+def passwd_rotation_commits_chunk_by_chunk() -> None:
+    from ..utils import CiscoType7, isis_password_snapshot
+
+    engine = _engine({
+        "D1": _instance("OMEGA", "10.0.0.1") + _interface("BE1") + _interface("BE2") + _interface("BE3", passwd="new"),
+        "D2": _instance("OMEGA", "10.0.0.2") + _interface("BE1"),
+    })
+    output, commits = _rotate(engine, 2)
+    assert (output.selected, output.succeeded, output.failed) == (4, 4, 0), output
+    assert [label.rsplit("-", 1)[-1] for label in commits] == ["1", "2"], commits
+    assert [(entry.first.rsplit("/", 1)[-1], entry.changed) for entry in output.chunks.values()] == [
+        ("interface{BE1}", 2), ("interface{BE3}", 1),
+    ], output.chunks
+    assert {str(service.passwd) for isis in engine.root.rfs.isis for service in isis.interface} == {"new"}
+    # the IOS-XR hashes are encoded once, in the snapshots of the transaction
+    hashes = isis_password_snapshot(engine.root, "D1", "OMEGA")
+    assert set(hashes) == {"BE1", "BE2"} and all(CiscoType7.verify("new", value) for value in hashes.values()), hashes
+
+
+@case
+def passwd_rotation_stops_on_the_first_failing_chunk() -> None:
+    engine = _engine({"D1": _instance("OMEGA", "10.0.0.1") + "".join(_interface(f"BE{index}") for index in range(5))})
+    output, commits = _rotate(engine, 2, failing_chunk=2)
+    assert len(commits) == 1, commits
+    assert (output.selected, output.succeeded, output.failed) == (5, 2, 3), output
+    # the chunk after the failing one is not even created
+    assert sorted(output.chunks) == [1, 2] and output.chunks[2].error == "aborted", output.chunks
+    assert str(engine.root.rfs.isis["D1"].interface["BE4"].passwd) == "old"
+
+
+@case
+def passwd_snapshot_reads_each_device_tag_once() -> None:
+    import ncs
+
+    from .. import utils
+    from ..utils import CiscoType7
+
+    import binascii
+
+    # a hash of the device, salted unlike the ones the package encodes
+    salted = "05" + binascii.hexlify(CiscoType7._cipher(b"secret", 5)).decode("ascii").upper()
+    engine = _engine({"D1": _instance("OMEGA", "10.0.0.1")})
+    engine.add_device("D1", "cisco-iosxr-cli", _config(
+        "<router><isis><tag><name>OMEGA</name>"
+        + "".join(
+            f"<interface><name>BE{index}</name>"
+            f"<hello-password><encrypted>{salted}</encrypted></hello-password></interface>"
+            for index in range(3)
+        )
+        + "</tag></isis></router>"
+    ))
+    root = engine.root
+    with patch.object(ncs.application, "get_device", wraps=ncs.application.get_device) as get_device:
+        hashes = [utils.generate_isis_passwd(root, "secret", "D1", f"BE{index}", "OMEGA") for index in range(4)]
+        assert get_device.call_count == 1, get_device.call_args_list
+        # an unknown tag is one more read, and an empty snapshot
+        assert utils.isis_password_snapshot(root, "D1", "ALPHA") == {}
+        assert get_device.call_count == 2
+    # the hashes on the device are kept, the missing one is encoded
+    assert hashes == [salted] * 3 + [CiscoType7.encode("secret")], hashes
+    assert all(CiscoType7.verify("secret", value) for value in hashes)
@@ -0,0 +1,158 @@
+"Offline render engine: run the isis services without an NSO instance"
+
+import logging
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Any, Iterator, Optional, Union
+
+from . import maagic, stubs
+from . import schema as sch
+from .template import NCS_NS, TEMPLATES_DIR, merge
+
+CONFIG_NS = "{http://tail-f.com/ns/config/1.0}"
+RFS_NS = "{http://bouyguestelecom.fr/rfs}"
+
+log = logging.getLogger("isis.offline")
+
+stubs.install()
+
+
+class TransactionContext:
+    '''Stand-in for the tctx handed to cb_create'''
+
+    def __init__(self, trans: maagic.Transaction) -> None:
+        self.th = trans.th
+        self.uinfo = None
+
+
+class OfflineEngine:
+    '''Offline CDB holding devices and service payloads
+
+    Payloads are the XML files loaded with `ncs_load -lm`, devices are
+    declared with their NED type (and optionally their current config).
+    '''
+
+    def __init__(self, templates_dir: Path = TEMPLATES_DIR) -> None:
+        self.root = maagic.Root(templates_dir)
+        self._rfs = ET.Element(f"{RFS_NS}rfs")
+        self._sync_rfs()
+        # proplists returned by the previous create of each service
+        self.proplists: dict[tuple[str, str, str], list[Any]] = {}
+        # the in-memory indexes of the package describe this new offline CDB
+        from ..dependencies import dependency_index
+        from ..sid_pool import sid_pools
+        from ..uniqueness import uniqueness_index
+
+        uniqueness_index.reset()
+        sid_pools.reset()
+        dependency_index.reset()
+
+    def _sync_rfs(self) -> None:
+        self.root.rfs = maagic.Container(self.root, self.root, self._rfs, sch.RFS, "/rfs:rfs")
+        # service lists are indexed once after a load, not once per create
+        self._isis_list: Optional[maagic.NodeList] = None
+        self._service_lists: dict[tuple[str, str], maagic.NodeList] = {}
+
+    @property
+    def _isis(self) -> maagic.NodeList:
+        if self._isis_list is None:
+            self._isis_list = self.root.rfs.isis
+        return self._isis_list
+
+    def add_device(
+        self,
+        name: str,
+        ned_type: str,
+        config: Optional[Union[str, Path, ET.Element]] = None,
+    ) -> None:
+        if config is not None and not isinstance(config, ET.Element):
+            config = ET.parse(config).getroot()
+        self.root.devices.device[name] = maagic.Device(name, ned_type, config)
+
+    def load(self, payload: Union[str, Path, ET.Element]) -> list[tuple[str, str, str]]:
+        '''Merge a payload into the offline CDB, return the services it touches'''
+
+        if not isinstance(payload, ET.Element):
+            payload = ET.parse(payload).getroot()
+        rfs = payload if maagic.local_name(payload.tag) == "rfs" else payload.find(f"{RFS_NS}rfs")
+        if rfs is None:
+            return []
+        merge(self._rfs, rfs)
+        self._sync_rfs()
+
+        touched = []
+        view = maagic.Container(self.root, self.root, rfs, sch.RFS)
+        for isis in view.isis:
+            if isis.aggregate.exists():
+                touched.append(("device", isis.device, "aggregate"))
+            touched += [("instance", isis.device, inst.instance_id) for inst in isis.instance]
+            touched += [("interface", isis.device, intf.name) for intf in isis.interface]
+        return touched
+
+    def services(self) -> Iterator[tuple[str, str, str]]:
+        for isis in self._isis:
+            if isis.aggregate.exists():
+                yield ("device", isis.device, "aggregate")
+            for inst in isis.instance:
+                yield ("instance", isis.device, inst.instance_id)
+            for intf in isis.interface:
+                yield ("interface", isis.device, intf.name)
+
+    def service(self, kind: str, device: str, key: str) -> maagic.Container:
+        if kind == "device":
+            return self._isis[device].aggregate
+        services = self._service_lists.get((device, kind))
+        if services is None:
+            services = self._service_lists[(device, kind)] = getattr(self._isis[device], kind)
+        return services[key]
+
+    def create(self, kind: str, device: str, key: str) -> list[Any]:
+        '''Run cb_create of the servicepoint for one service'''
+
+        from .. import main
+
+        callbacks = {"instance": main.IsisInstance, "interface": main.IsisInterface, "device": main.IsisDevice}
+        service = self.service(kind, device, key)
+        tctx = TransactionContext(self.root.trans)
+        proplist = list(self.proplists.get((kind, device, key), []))
+        result = callbacks[kind]().cb_create(tctx, self.root, service, proplist)
+        self.proplists[(kind, device, key)] = proplist if result is None else result
+        return self.proplists[(kind, device, key)]
+
+    def validate(self, services: Optional[list[tuple[str, str, str]]] = None) -> list[str]:
+        '''Problems the validation point would report for the given services'''
+
+        from ..actions.selection import ServiceRef
+        from ..validation import InputCheck
+
+        selected = services if services is not None else list(self.services())
+        refs = [
+            (ServiceRef(kind, device, key), self.service(kind, device, key))
+            for kind, device, key in selected
+            if kind != "device"
+        ]
+        return InputCheck().problems(TransactionContext(self.root.trans), self.root, refs)
+
+    def render(
+        self,
+        services: Optional[list[tuple[str, str, str]]] = None,
+    ) -> dict[str, ET.Element]:
+        '''Create the given services (all by default), return {device: <device>}'''
+
+        self.root.trans = maagic.Transaction(self.root)
+        self.root.rendered.clear()
+        self.root.applied.clear()
+        for kind, device, key in services if services is not None else list(self.services()):
+            log.debug("offline create %s %s %s", kind, device, key)
+            self.create(kind, device, key)
+        return dict(self.root.rendered)
+
+
+def to_xml(rendered: dict[str, ET.Element]) -> str:
+    '''Serialize rendered device configs as a <devices> document'''
+
+    devices = ET.Element(f"{NCS_NS}devices")
+    for name in sorted(rendered):
+        devices.append(rendered[name])
+    ET.indent(devices)
+    return ET.tostring(devices, encoding="unicode", default_namespace=NCS_NS[1:-1])
@@ -0,0 +1,112 @@
+"Golden suite: payloads -> expected pairs of test/lab_sdn/maquette-trt"
+
+import time
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Iterator, NamedTuple, Optional
+
+from .engine import OfflineEngine
+from .maagic import local_name
+from .template import NCS_NS
+
+MAQUETTE_DIR = Path(__file__).resolve().parents[3] / "test" / "lab_sdn" / "maquette-trt"
+
+NEDS = ("cisco-iosxr-cli", "alu-sr-cli", "huawei-vrp-cli")
+
+
+class GoldenResult(NamedTuple):
+    name: str
+    missing: list[str]
+    extra: list[str]
+    error: Optional[str]
+    elapsed: float
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and not self.missing and not self.extra
+
+
+def leaf_paths(element: ET.Element, prefix: str = "") -> Iterator[str]:
+    '''Flatten a config tree into "a/b{key}/c = value" lines (order independent)'''
+
+    for child in element:
+        name = local_name(child.tag)
+        if len(child) == 0:
+            yield f"{prefix}/{name} = {(child.text or '').strip()}"
+            continue
+        key = child[0]
+        if len(key) == 0 and len(child) > 1:
+            name = f"{name}{{{(key.text or '').strip()}}}"
+        yield from leaf_paths(child, f"{prefix}/{name}")
+
+
+def compare(rendered: ET.Element, expected: ET.Element) -> tuple[list[str], list[str]]:
+    '''Return (missing, extra) leaf paths of rendered vs expected
+
+    Expected files only capture the subtrees they show: extra leaves are
+    reported only under a container that the expected file also holds.
+    '''
+
+    got = set(leaf_paths(rendered))
+    want = set(leaf_paths(expected))
+    containers = {
+        path.split(" = ", 1)[0].rsplit("/", depth)[0]
+        for path in want
+        for depth in range(1, path.count("/"))
+    }
+    containers.discard("/config")
+    extra = [
+        path for path in got - want
+        if path.split(" = ", 1)[0].rsplit("/", 1)[0] in containers
+    ]
+    return sorted(want - got), sorted(extra)
+
+
+def _expected_devices(path: Path) -> dict[str, ET.Element]:
+    # expected files hold a <devices> and an <rfs> document back to back
+    document = ET.fromstring(f"<expected>{path.read_text()}</expected>")
+    devices = {}
+    for device in document.iter(f"{NCS_NS}device"):
+        name = device.find(f"{NCS_NS}name")
+        if name is not None and name.text:
+            devices[name.text] = device
+    return devices
+
+
+def ned_of(name: str) -> str:
+    for ned in NEDS:
+        if name.startswith(f"{ned}-"):
+            return ned
+    raise ValueError(f"Cannot guess the NED of {name}")
+
+
+def run_case(payload: Path, expected: Path) -> GoldenResult:
+    start = time.perf_counter()
+    try:
+        want = _expected_devices(expected)
+        engine = OfflineEngine()
+        for device in want:
+            engine.add_device(device, ned_of(payload.name))
+        rendered = engine.render(engine.load(payload))
+        missing: list[str] = []
+        extra: list[str] = []
+        for device in sorted(want.keys() | rendered.keys()):
+            empty = ET.Element(f"{NCS_NS}device")
+            device_missing, device_extra = compare(
+                rendered.get(device, empty), want.get(device, empty)
+            )
+            missing += device_missing
+            extra += device_extra
+        error = None
+    except Exception as err:
+        missing, extra, error = [], [], f"{type(err).__name__}: {err}"
+    return GoldenResult(payload.stem, missing, extra, error, time.perf_counter() - start)
+
+
+def run(maquette_dir: Path = MAQUETTE_DIR) -> list[GoldenResult]:
+    results = []
+    for expected in sorted((maquette_dir / "expected").glob("*.xml")):
+        payload = maquette_dir / "payloads" / expected.name
+        if payload.exists():
+            results.append(run_case(payload, expected))
+    return results
@@ -0,0 +1,331 @@
+"Local stand-in for the parts of ncs.maagic used by the isis handlers"
+
+import contextlib
+import itertools
+import types
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+from . import schema as sch
+from .template import TEMPLATES_DIR
+
+
+def local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _yang_name(name: str) -> str:
+    return name.replace("_", "-")
+
+
+def _children(element: Optional[ET.Element], name: str) -> list[ET.Element]:
+    if element is None:
+        return []
+    return [child for child in element if local_name(child.tag) == name]
+
+
+#################################################################
+#   Service nodes (schema driven)                               #
+#################################################################
+
+class Node:
+    def __init__(self, root: "Root", parent: Optional["Node"]) -> None:
+        self._root = root
+        self._parent = parent
+
+
+class Container(Node):
+    def __init__(
+        self,
+        root: "Root",
+        parent: Optional[Node],
+        element: Optional[ET.Element],
+        schema: dict[str, Any],
+        path: str = "",
+    ) -> None:
+        super().__init__(root, parent)
+        self._element = element
+        self._schema = schema
+        self._path = path
+        # children by yang name; views are rebuilt after every payload load
+        self._found: dict[str, list[ET.Element]] = {}
+        # non-presence container absent from the payloads, added on first write
+        self._detached = False
+
+    def exists(self) -> bool:
+        return self._element is not None
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        yang = _yang_name(name)
+        if yang not in self._schema:
+            raise AttributeError(name)
+        spec = self._schema[yang]
+        found = self._found.get(yang)
+        if found is None:
+            found = self._found[yang] = _children(self._element, yang)
+        child = found[0] if found else None
+
+        if isinstance(spec, sch.List):
+            return NodeList(self._root, self, found, spec, f"{self._path}/{yang}")
+        if isinstance(spec, dict):
+            detached = child is None and not spec.get(sch.PRESENCE) and self._element is not None
+            if detached:
+                # non-presence containers always exist when their parent does
+                child = ET.Element(yang)
+            container = Container(self._root, self, child, spec, f"{self._path}/{yang}")
+            container._detached = detached
+            return container
+        if spec == sch.EMPTY:
+            return child is not None
+        if child is not None:
+            return (child.text or "").strip()
+        if isinstance(spec, sch.Default) and self._element is not None:
+            return spec.value
+        return None
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if name.startswith("_"):
+            object.__setattr__(self, name, value)
+            return
+        yang = _yang_name(name)
+        if yang not in self._schema or isinstance(self._schema[yang], (dict, sch.List)):
+            raise AttributeError(name)
+        element = self._materialize()
+        found = _children(element, yang)
+        child = found[0] if found else ET.SubElement(element, yang)
+        child.text = str(value)
+        self._found.pop(yang, None)
+
+    def _materialize(self) -> ET.Element:
+        '''Element of the container, attached to its parent for a write'''
+
+        if self._detached:
+            self._parent._materialize().append(self._element)
+            self._parent._found.pop(local_name(self._element.tag), None)
+            self._detached = False
+        return self._element
+
+    def to_dict(self, skip: tuple[str, ...] = ()) -> dict[str, Any]:
+        '''Service leaves as GenericService exposes them (yang names with "_")'''
+        data: dict[str, Any] = {}
+        for yang, spec in self._schema.items():
+            if yang == sch.PRESENCE or yang in skip or isinstance(spec, sch.List):
+                continue
+            value = getattr(self, yang.replace("-", "_"))
+            if isinstance(value, Container):
+                value = value.to_dict() if value.exists() else None
+            data[yang.replace("-", "_")] = value
+        return data
+
+
+class ListEntry(Container):
+    pass
+
+
+class NodeList(Node):
+    def __init__(
+        self,
+        root: "Root",
+        parent: Optional[Node],
+        elements: list[ET.Element],
+        spec: sch.List,
+        path: str = "",
+    ) -> None:
+        super().__init__(root, parent)
+        self._spec = spec
+        self._path = path
+        self._entries = {
+            (_children(element, spec.key)[0].text or "").strip(): element
+            for element in elements
+        }
+
+    def __getitem__(self, key: Any) -> ListEntry:
+        element = self._entries[str(key)]
+        return ListEntry(self._root, self, element, self._spec.schema, f"{self._path}{{{key}}}")
+
+    def create(self, key: Any) -> ListEntry:
+        if str(key) not in self._entries:
+            name = self._path.rsplit("/", 1)[-1]
+            element = ET.SubElement(self._parent._materialize(), name)
+            ET.SubElement(element, self._spec.key).text = str(key)
+            self._entries[str(key)] = element
+            self._parent._found.pop(name, None)
+        return self[key]
+
+    def __delitem__(self, key: Any) -> None:
+        name = self._path.rsplit("/", 1)[-1]
+        self._parent._materialize().remove(self._entries.pop(str(key)))
+        self._parent._found.pop(name, None)
+
+    def __contains__(self, key: Any) -> bool:
+        return str(key) in self._entries
+
+    def __iter__(self) -> Iterator[ListEntry]:
+        for key in self._entries:
+            yield self[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+#################################################################
+#   Device config nodes (schema-less)                           #
+#################################################################
+
+class _Missing:
+    '''Node that does not exist in the device config'''
+
+    def __getattr__(self, name: str) -> "_Missing":
+        return self
+
+    def __getitem__(self, key: Any) -> Any:
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(())
+
+    def __eq__(self, other: Any) -> bool:
+        return other is None or isinstance(other, _Missing)
+
+    def __hash__(self) -> int:
+        return 0
+
+    def __bool__(self) -> bool:
+        return False
+
+    def exists(self) -> bool:
+        return False
+
+
+MISSING = _Missing()
+
+
+class ConfigNode:
+    '''Read-only view of a device config XML tree
+
+    Lists are indexed on the text of the first child of each entry,
+    which matches the key leaf ordering used by the NEDs.
+    '''
+
+    def __init__(self, elements: list[ET.Element]) -> None:
+        self._elements = elements
+
+    def exists(self) -> bool:
+        return bool(self._elements)
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        found = _children(self._elements[0], _yang_name(name)) if self._elements else []
+        if not found:
+            return MISSING
+        if len(found) == 1 and len(found[0]) == 0:
+            return (found[0].text or "").strip()
+        return ConfigNode(found)
+
+    def _entry(self, element: ET.Element) -> str:
+        return (element[0].text or "").strip() if len(element) else ""
+
+    def __getitem__(self, key: Any) -> "ConfigNode":
+        for element in self._elements:
+            if self._entry(element) == str(key):
+                return ConfigNode([element])
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator["ConfigNode"]:
+        for element in self._elements:
+            yield ConfigNode([element])
+
+
+#################################################################
+#   Root, devices and transactions                              #
+#################################################################
+
+class Device:
+    def __init__(self, name: str, ned_type: str, config: Optional[ET.Element] = None) -> None:
+        self.name = name
+        self.ned_type = ned_type
+        self.device_type = types.SimpleNamespace(cli=types.SimpleNamespace(ned_id=f"{ned_type}-1.0:{ned_type}-1.0"))
+        self.config = ConfigNode([config] if config is not None else [])
+
+
+class Devices:
+    def __init__(self) -> None:
+        self.device: dict[str, Device] = {}
+
+
+class DataKickers:
+    '''Kickers written by the creates, by id (not run offline)'''
+
+    def __init__(self) -> None:
+        self.entries: dict[str, types.SimpleNamespace] = {}
+
+    def create(self, name: str) -> types.SimpleNamespace:
+        if name not in self.entries:
+            self.entries[name] = types.SimpleNamespace(id=name, monitor=None, kick_node=None, action_name=None)
+        return self.entries[name]
+
+
+class Kickers:
+    def __init__(self) -> None:
+        self.data_kicker = DataKickers()
+
+
+_th_counter = itertools.count(1)
+
+
+class Maapi:
+    def __init__(self, root: "Root") -> None:
+        self._root = root
+
+    @contextlib.contextmanager
+    def start_read_trans(self) -> Iterator["Transaction"]:
+        self._root.read_transactions += 1
+        yield Transaction(self._root)
+
+
+class Transaction:
+    def __init__(self, root: "Root") -> None:
+        self.th = next(_th_counter)
+        self.root = root
+        self.maapi = Maapi(root)
+
+
+class Root(Node):
+    '''Offline CDB: devices, rendered output and the current transaction'''
+
+    def __init__(self, templates_dir: Path = TEMPLATES_DIR) -> None:
+        super().__init__(self, None)
+        self.templates_dir = templates_dir
+        self.devices = Devices()
+        self.kickers = Kickers()
+        self.trans = Transaction(self)
+        self.read_transactions = 0
+        self.applied: list[tuple[str, dict[str, str]]] = []
+        self.rendered: dict[str, ET.Element] = {}
+
+
+#################################################################
+#   Module level helpers (ncs.maagic API)                       #
+#################################################################
+
+ListElement = ListEntry
+
+
+def get_root(node: Any) -> Root:
+    if isinstance(node, Transaction):
+        return node.root
+    return node._root
+
+
+def get_trans(node: Any) -> Transaction:
+    if isinstance(node, Transaction):
+        return node
+    return node._root.trans
+
+
+def get_node(trans: Transaction, path: str) -> Any:
+    raise NotImplementedError("keypath lookups are not supported offline")
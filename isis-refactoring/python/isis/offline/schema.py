@@ -0,0 +1,121 @@
+"Service schemas used by the offline stand-ins (mirror of src/yang/isis.yang)"
+
+from typing import Any
+
+# A schema maps yang node names to:
+#   - LEAF / EMPTY                 for leaves (EMPTY for `type empty`)
+#   - Default(value)               for leaves with a yang default
+#   - a nested dict                for containers (PRESENCE key if presence)
+#   - List(key, schema)            for lists
+
+LEAF = "leaf"
+EMPTY = "empty"
+PRESENCE = "__presence__"
+
+
+class Default:
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any) -> None:
+        self.value = value
+
+
+class List:
+    __slots__ = ("key", "schema")
+
+    def __init__(self, key: str, schema: dict[str, Any]) -> None:
+        self.key = key
+        self.schema = schema
+
+
+INVENTORY_LOGIC = {
+    "name": LEAF,
+    "parameters": List("name", {"name": LEAF, "value": LEAF}),
+}
+
+ISIS_INSTANCE_GROUPING = {
+    "area-id": LEAF,
+    "loopback0": LEAF,
+    "export": LEAF,
+    "export-tunnel-table": LEAF,
+    "sr": {
+        PRESENCE: True,
+        "lower-bound": Default(18432),
+        "upper-bound": Default(118432),
+        "domain": Default("default"),
+    },
+    "fast-reroute": {
+        PRESENCE: True,
+        "ti-lfa-level": LEAF,
+    },
+    "ldp": {
+        PRESENCE: True,
+    },
+    "mpls": EMPTY,
+    "mpls-sr-prefer": EMPTY,
+    "disable-sync-ldp": EMPTY,
+    "dist-link-state": EMPTY,
+}
+
+ISIS_INTERFACE_GROUPING = {
+    "interface-type": LEAF,
+    "circuit-type": LEAF,
+    "metric": LEAF,
+    "passwd": LEAF,
+    "enable-sync-ldp": EMPTY,
+    "common-attributes": {
+        PRESENCE: True,
+        "id": LEAF,
+        "type": LEAF,
+        "subif-id": LEAF,
+    },
+    "loopback-attribs": {
+        PRESENCE: True,
+        "unicast-tag": LEAF,
+        "sr-id": LEAF,
+        "loopback-id": LEAF,
+    },
+}
+
+INSTANCE = {
+    "instance-id": LEAF,
+    **ISIS_INSTANCE_GROUPING,
+    "inventory-logic": INVENTORY_LOGIC,
+    "inventory-template": LEAF,
+}
+
+INTERFACE = {
+    "name": LEAF,
+    "isis-instance-id": LEAF,
+    **ISIS_INTERFACE_GROUPING,
+    "inventory-logic": INVENTORY_LOGIC,
+    "inventory-template": LEAF,
+}
+
+INVENTORY_INSTANCE = {"name": LEAF, **ISIS_INSTANCE_GROUPING}
+
+INVENTORY_INTERFACE = {"name": LEAF, **ISIS_INTERFACE_GROUPING}
+
+# Nodes that GenericService does not expose in the service data.
+NOT_IN_DATA = ("inventory-logic", "inventory-template")
+
+RFS = {
+    "isis": List("device", {
+        "device": LEAF,
+        "aggregate": {PRESENCE: True},
+        "instance": List("instance-id", INSTANCE),
+        "interface": List("name", INTERFACE),
+    }),
+    "inventory": {
+        "isis": {
+            "instance": List("name", INVENTORY_INSTANCE),
+            "interface": List("name", INVENTORY_INTERFACE),
+        },
+    },
+    "isis-sid-pool": {
+        "domain": List("name", {
+            "name": LEAF,
+            "sid": List("value", {"value": LEAF, "owner": LEAF}),
+        }),
+    },
+}
@@ -0,0 +1,257 @@
+"Stand-ins for ncs, rfs.generic, sdn_nso_lib and inventory_manager"
+
+import functools
+import logging
+import sys
+import types
+from typing import Any, Callable
+
+from . import maagic
+from . import schema as sch
+from .template import OfflineTemplate
+
+_installed = False
+
+
+#################################################################
+#   ncs.application                                             #
+#################################################################
+
+class Service:
+    def __init__(self, daemon: Any = None, servicepoint: Any = None, log: Any = None) -> None:
+        self.log = log or logging.getLogger("isis.offline")
+
+    @staticmethod
+    def create(fn: Callable[..., Any]) -> Callable[..., Any]:
+        return fn
+
+    @staticmethod
+    def pre_modification(fn: Callable[..., Any]) -> Callable[..., Any]:
+        return fn
+
+    @staticmethod
+    def post_modification(fn: Callable[..., Any]) -> Callable[..., Any]:
+        return fn
+
+
+class Application:
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        self.log = logging.getLogger("isis.offline")
+
+    def register_service(self, *args: Any) -> None:
+        pass
+
+    def register_action(self, *args: Any) -> None:
+        pass
+
+    def register_validation(self, *args: Any) -> None:
+        pass
+
+
+def get_device(trans: maagic.Transaction, name: str) -> maagic.Device:
+    return trans.root.devices.device[name]
+
+
+#################################################################
+#   ncs.dp                                                      #
+#################################################################
+
+class Action:
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        self.log = logging.getLogger("isis.offline")
+
+    @staticmethod
+    def action(fn: Callable[..., Any]) -> Callable[..., Any]:
+        return fn
+
+
+class ValidationCallback:
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        self.log = logging.getLogger("isis.offline")
+
+    @staticmethod
+    def validate(fn: Callable[..., Any]) -> Callable[..., Any]:
+        return fn
+
+
+#################################################################
+#   ncs.cdb                                                     #
+#################################################################
+
+class Subscriber:
+    def __init__(self, app: Any = None, log: Any = None, *args: Any, **kwargs: Any) -> None:
+        self.log = log or logging.getLogger("isis.offline")
+
+    def register(self, *args: Any, **kwargs: Any) -> None:
+        pass
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+
+#################################################################
+#   ncs.maapi                                                   #
+#################################################################
+
+RUNNING = 2
+OPERATIONAL = 4
+
+# diff_iterate operations and return codes
+MOP_CREATED, MOP_DELETED, MOP_MODIFIED, MOP_VALUE_SET = 1, 2, 3, 4
+ITER_STOP, ITER_RECURSE, ITER_CONTINUE, ITER_UP = 1, 2, 3, 4
+
+
+class Maapi:
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        raise NotImplementedError("no maapi session offline")
+
+
+#################################################################
+#   rfs.generic                                                 #
+#################################################################
+
+class GenericService:
+    '''Stand-in for rfs.generic.GenericService
+
+    Exposes the service leaves as a dict (yang names with "_"), merged
+    over the inventory entry referenced by `template_ref`.
+    '''
+
+    def __init__(
+        self,
+        service: maagic.ListEntry,
+        inventory_data: dict[str, Any],
+        device_name_path: str,
+        template_ref: str,
+    ) -> None:
+        self.ncs_service = service
+        self.inventory_data = inventory_data
+        self.template_ref = template_ref
+
+        node: Any = service
+        *parents, leaf = device_name_path.split("/")
+        for _ in parents:
+            node = node._parent
+            if isinstance(node, maagic.NodeList):
+                node = node._parent
+        self.device = service._root.devices.device[getattr(node, leaf)]
+
+        data = dict(inventory_data.get(template_ref) or {})
+        for var, val in service.to_dict(skip=sch.NOT_IN_DATA).items():
+            if val not in (None, False) or var not in data:
+                data[var] = val
+        self.data = data
+        self.j2_data: dict[str, Any] = {}
+        self.j2_filters: dict[str, Any] = {}
+
+
+#################################################################
+#   inventory_manager.api                                       #
+#################################################################
+
+def resolve_inventory(service: maagic.ListEntry, policy: dict[str, list[str]]) -> dict[str, Any]:
+    '''Resolve the inventory leafrefs of a service from the offline CDB'''
+
+    inventory: dict[str, Any] = {}
+    kind = "instance" if "instance-id" in service._schema else "interface"
+    entries = service._root.rfs.inventory.isis
+    for ref in policy.get("leafref", []):
+        name = getattr(service, ref.replace("-", "_"))
+        if name is None:
+            continue
+        entry = getattr(entries, kind)[name]
+        inventory[ref] = {
+            var: val
+            for var, val in entry.to_dict(skip=("name",)).items()
+            if val not in (None, False)
+        }
+    return inventory
+
+
+class InventoryManager:
+    @staticmethod
+    def subscribe(policy: dict[str, list[str]]) -> Callable[..., Any]:
+        def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+            @functools.wraps(fn)
+            def wrapper(self: Any, tctx: Any, root: Any, service: Any, proplist: Any) -> Any:
+                inventory = resolve_inventory(service, policy)
+                return fn(self, tctx, root, service, proplist, inventory)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def publish(fn: Callable[..., Any]) -> Callable[..., Any]:
+        return fn
+
+
+#################################################################
+#   Installation                                                #
+#################################################################
+
+def _module(name: str, **attrs: Any) -> types.ModuleType:
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+    return module
+
+
+def install() -> None:
+    '''Register the stand-ins in sys.modules (process wide)
+
+    Must run before any isis module that imports ncs is imported.
+    '''
+
+    global _installed
+    if _installed:
+        return
+
+    application = _module(
+        "ncs.application",
+        Service=Service,
+        Application=Application,
+        get_device=get_device,
+    )
+    ncs_maagic = _module(
+        "ncs.maagic",
+        ListElement=maagic.ListElement,
+        Container=maagic.Container,
+        Root=maagic.Root,
+        Node=maagic.Node,
+        get_root=maagic.get_root,
+        get_trans=maagic.get_trans,
+        get_node=maagic.get_node,
+    )
+    _module("_ncs", PORT=4569, stream_connect=None, maapi=types.SimpleNamespace(CONFIG_XML=0))
+    dp = _module("ncs.dp", Action=Action, ValidationCallback=ValidationCallback)
+    cdb = _module("ncs.cdb", Subscriber=Subscriber)
+    maapi = _module("ncs.maapi", Transaction=maagic.Transaction, Maapi=Maapi)
+    _module(
+        "ncs",
+        maagic=ncs_maagic,
+        application=application,
+        dp=dp,
+        cdb=cdb,
+        maapi=maapi,
+        RUNNING=RUNNING,
+        OPERATIONAL=OPERATIONAL,
+        MOP_CREATED=MOP_CREATED,
+        MOP_DELETED=MOP_DELETED,
+        MOP_MODIFIED=MOP_MODIFIED,
+        MOP_VALUE_SET=MOP_VALUE_SET,
+        ITER_STOP=ITER_STOP,
+        ITER_RECURSE=ITER_RECURSE,
+        ITER_CONTINUE=ITER_CONTINUE,
+        ITER_UP=ITER_UP,
+    )
+
+    _module("rfs", generic=_module("rfs.generic", GenericService=GenericService))
+
+    template = _module("sdn_nso_lib.ncs_utils.template", J2NSOTemplate=OfflineTemplate)
+    _module("sdn_nso_lib", ncs_utils=_module("sdn_nso_lib.ncs_utils", template=template))
+
+    _module("inventory_manager", api=_module("inventory_manager.api", InventoryManager=InventoryManager))
+
+    _installed = True
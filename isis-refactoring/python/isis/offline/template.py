@@ -0,0 +1,51 @@
+"Offline rendering of the NSO XML config templates under templates/"
+
+import xml.etree.ElementTree as ET
+from typing import Any, Optional
+
+from ..rendering import (  # noqa: F401  (re-exported for the offline modules)
+    NCS_NS,
+    TEMPLATES_DIR,
+    device_configs,
+    load_template,
+    merge,
+)
+
+
+#################################################################
+#   J2NSOTemplate stand-in                                      #
+#################################################################
+
+class OfflineTemplate:
+    '''Stand-in for sdn_nso_lib J2NSOTemplate
+
+    Collects the template variables and renders the XML template into the
+    offline root of the service instead of applying it through FASTMAP.
+    '''
+
+    def __init__(self, service: Any, j2_filters: Any = None) -> None:
+        self.service = service
+        self.j2_filters = j2_filters
+        self.variables: dict[str, str] = {}
+
+    @staticmethod
+    def _value(value: Any) -> str:
+        return str(value)
+
+    def add(self, name: str, value: Any, j2_data: Optional[dict[str, Any]] = None) -> None:
+        self.variables[name] = self._value(value)
+        if j2_data is not None:
+            j2_data[name] = value
+
+    def add_dict(self, variables: dict[str, Any]) -> None:
+        for name, value in variables.items():
+            self.variables[name] = self._value(value)
+
+    def apply(self, name: str) -> None:
+        root = self.service._root
+        rendered = load_template(name, root.templates_dir).render(self.variables)
+        root.applied.append((name, dict(self.variables)))
+        for device_name, device in device_configs(rendered).items():
+            if device_name not in root.rendered:
+                root.rendered[device_name] = ET.Element(f"{NCS_NS}device")
+            merge(root.rendered[device_name], device)
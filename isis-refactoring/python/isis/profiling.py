@@ -0,0 +1,136 @@
+"Opt-in cProfile capture of the next isis creates"
+
+import cProfile
+import fnmatch
+import functools
+import io
+import logging
+import pstats
+import re
+import threading
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from .actions.selection import ned_type
+
+DEFAULT_DIRECTORY = "logs/isis-profiles"
+
+
+def _device_of(service: Any) -> str:
+    node = service
+    while node is not None:
+        device = getattr(node, "device", None)
+        if isinstance(device, str) and device:
+            return device
+        node = getattr(node, "_parent", None)
+    return ""
+
+
+def _file_stem(keypath: str, th: Any) -> str:
+    return f"{re.sub(r'[^A-Za-z0-9_.-]+', '_', keypath).strip('_')}-th{th}"
+
+
+class ProfileCapture:
+    '''Profiles the next `remaining` creates matching a device glob and a NED
+
+    Each capture is written as <keypath>-th<handle>.pstats and a .txt
+    summary of the top functions (cumulative time) in `directory`. One
+    capture runs at a time: a create matching while another one is
+    profiled (or while another profiler is active) runs unprofiled and
+    leaves its capture to the next one.
+    '''
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._running = threading.Lock()
+        self.remaining = 0
+        self.device: Optional[str] = None
+        self.ned: Optional[str] = None
+        self.directory = Path(DEFAULT_DIRECTORY)
+        self.top = 25
+        self.captured: list[Path] = []
+
+    def arm(
+        self,
+        count: int,
+        device: Optional[str] = None,
+        ned: Optional[str] = None,
+        directory: Optional[str] = None,
+        top: int = 25,
+    ) -> None:
+        with self._lock:
+            self.remaining = count
+            self.device = device
+            self.ned = ned
+            self.directory = Path(directory or DEFAULT_DIRECTORY)
+            self.top = top
+            self.captured = []
+
+    def _take(self, root: Any, service: Any) -> bool:
+        '''Claim one capture for this create if it matches the filter'''
+
+        if not self.remaining:
+            return False
+        device = _device_of(service)
+        if self.device and not fnmatch.fnmatchcase(device, self.device):
+            return False
+        if self.ned and ned_type(root.devices.device[device]) != self.ned:
+            return False
+        if not self._running.acquire(blocking=False):
+            return False
+        with self._lock:
+            if self.remaining:
+                self.remaining -= 1
+                return True
+        self._running.release()
+        return False
+
+    def _give_back(self) -> None:
+        with self._lock:
+            self.remaining += 1
+        self._running.release()
+
+    def _write(self, profiler: cProfile.Profile, keypath: str, th: Any) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        stem = _file_stem(keypath, th)
+        path = self.directory / f"{stem}.pstats"
+        profiler.dump_stats(path)
+
+        summary = io.StringIO()
+        summary.write(f"{keypath} (transaction {th})\n")
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(self.top)
+        (self.directory / f"{stem}.txt").write_text(summary.getvalue())
+        with self._lock:
+            self.captured.append(path)
+        return path
+
+    def profile(self, fn: Callable[..., Any]) -> Callable[..., Any]:
+        '''cb_create decorator, free when no capture is armed'''
+
+        @functools.wraps(fn)
+        def wrapper(self_: Any, tctx: Any, root: Any, service: Any, proplist: Any) -> Any:
+            if not self._take(root, service):
+                return fn(self_, tctx, root, service, proplist)
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError as err:
+                # python 3.12+: another profiling tool is active in the VM
+                self._give_back()
+                logging.warning(f"isis profile of {service._path} skipped: {err}")
+                return fn(self_, tctx, root, service, proplist)
+            try:
+                return fn(self_, tctx, root, service, proplist)
+            finally:
+                profiler.disable()
+                self._running.release()
+                try:
+                    path = self._write(profiler, str(service._path), getattr(tctx, "th", "na"))
+                    logging.info(f"isis profile of {service._path} written to {path}")
+                except OSError as err:
+                    logging.error(f"isis profile of {service._path} not written: {err}")
+        return wrapper
+
+
+capture = ProfileCapture()
+
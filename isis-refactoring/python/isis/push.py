@@ -0,0 +1,364 @@
+"Asynchronous push of the isis changes through per-device commit queue items"
+
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from typing import Any, Callable, NamedTuple, Optional
+
+import ncs
+
+from .actions.scheduler import Outcome
+from .actions.selection import ServiceRef
+
+PUSH_PATH = "/rfs:rfs/bytel-isis:isis-push"
+QUEUE_PATH = "/ncs:devices/commit-queue"
+
+# the tracker purges the finished items this often (isis-fleet push retention)
+PURGE_INTERVAL = 3600.0
+TIMESTAMP = "%Y-%m-%dT%H:%M:%S"
+
+# keypath of a ServiceRef, aggregate services included
+_SERVICE_RE = re.compile(r'^/rfs:rfs/bytel-isis:isis\{"?(.+?)"?\}/(?:(instance|interface)\{"?(.+?)"?\}|aggregate)$')
+
+
+class PushOptions(NamedTuple):
+    '''How a bulk change reaches the devices (see the `push` grouping)'''
+
+    commit_queue: str = "sync"
+    error_option: str = "rollback-on-error"
+    retries: int = 2
+
+    @property
+    def asynchronous(self) -> bool:
+        return self.commit_queue == "async"
+
+    @classmethod
+    def from_input(cls, root: Any, input: Any = None) -> "PushOptions":
+        '''Action input leaves, the isis-fleet push defaults for the others'''
+
+        defaults = root.rfs.isis_fleet.push
+        values = {}
+        for leaf in cls._fields:
+            value = getattr(input, leaf, None)
+            if value is None:
+                value = getattr(defaults, leaf)
+            values[leaf] = int(value) if leaf == "retries" else str(value)
+        return cls(**values)
+
+
+def queue_params(params: Any, options: PushOptions, tag: str) -> Any:
+    '''Commit params of an asynchronous, tagged commit queue item'''
+
+    params.commit_queue_async()
+    params.commit_queue_tag(tag)
+    params.commit_queue_error_option(options.error_option)
+    return params
+
+
+def queue_id(result: Any) -> Optional[int]:
+    '''Commit queue item id found in the result of apply_params'''
+
+    if not isinstance(result, dict):
+        return None
+    for name, value in result.items():
+        if isinstance(value, dict):
+            found = queue_id(value)
+            if found is not None:
+                return found
+        elif str(name).rsplit(":", 1)[-1] in ("id", "commit-queue-id") and str(value).isdigit():
+            return int(value)
+    return None
+
+
+class Item(NamedTuple):
+    '''A commit queue item of one device, and the services it pushes'''
+
+    id: int
+    device: str
+    tag: str
+    services: tuple[ServiceRef, ...]
+    options: PushOptions
+    attempt: int = 0
+    # False when the item commits new config: rolled back, it is gone from CDB
+    redeploy: bool = True
+
+
+def push_device(
+    username: str,
+    device: str,
+    services: list[ServiceRef],
+    options: PushOptions,
+    tag: str,
+    attempt: int = 0,
+    write: Optional[Callable[[ncs.maapi.Transaction], None]] = None,
+    label: Optional[str] = None,
+) -> Optional[Item]:
+    '''Commit the services of one device in one commit queue item
+
+    `write` sets their config, by default they are only re-deployed.
+    '''
+
+    with ncs.maapi.single_write_trans(username, "system") as trans:
+        if write is not None:
+            write(trans)
+        else:
+            for service in services:
+                # a touched service is re-deployed by the commit
+                trans.touch(service.keypath)
+        params = queue_params(trans.get_params(), options, tag)
+        if label is not None:
+            params.label(label)
+        result = trans.apply_params(True, params)
+    item_id = queue_id(result)
+    if item_id is None:
+        # nothing to push, or pushed synchronously (device without queue)
+        return None
+    item = Item(item_id, device, tag, tuple(services), options, attempt, write is None)
+    pushes.watch(item)
+    return item
+
+
+def push_services(
+    username: str,
+    services: list[ServiceRef],
+    options: PushOptions,
+    tag: str,
+    concurrency: int,
+    batch_size: int,
+) -> list[Outcome]:
+    '''Queue the re-deploy of services, one item per device and batch
+
+    The devices are queued in parallel, the batches of one device in
+    sequence. Returns once the items are queued: the tracker follows them.
+    '''
+
+    ordered = sorted(services, key=lambda service: service.device)
+    devices = [(device, list(group)) for device, group in groupby(ordered, key=lambda service: service.device)]
+
+    def push(device: str, refs: list[ServiceRef]) -> list[Outcome]:
+        # the batches of a device are queued one after the other, in order
+        outcomes = []
+        for start in range(0, len(refs), batch_size):
+            batch = refs[start:start + batch_size]
+            try:
+                item = push_device(username, device, batch, options, tag)
+            except Exception as err:
+                outcomes += [Outcome(service, str(err) or type(err).__name__) for service in batch]
+                continue
+            detail = "pushed" if item is None else f"queue item {item.id}"
+            outcomes += [Outcome(service, None, detail) for service in batch]
+        return outcomes
+
+    outcomes: list[Outcome] = []
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="isis-push") as pool:
+        for result in pool.map(lambda entry: push(*entry), devices):
+            outcomes += result
+    return outcomes
+
+
+#################################################################
+#   Completion tracking                                         #
+#################################################################
+
+def _queue_state(trans: Any, item_id: int) -> tuple[str, Optional[str]]:
+    '''("pending" | "completed" | "failed" | "unknown", error) of a commit queue item
+
+    Completion is only read from the completed queue history: an item gone
+    from the queue without a history entry (history not kept, or purged)
+    may have failed and been rolled back, its state is unknown.
+    '''
+
+    queue = ncs.maagic.get_node(trans, QUEUE_PATH)
+    if item_id in queue.queue_item:
+        entry = queue.queue_item[item_id]
+        if str(entry.status) == "failed":
+            failed = getattr(entry, "failed", ())
+            return "failed", ", ".join(str(device.name) for device in failed) or None
+        return "pending", None
+    completed = getattr(queue, "completed", None)
+    if completed is None or item_id not in completed.queue_item:
+        return "unknown", f"queue item {item_id} gone without a completed queue history entry"
+    reasons = [f"{device.name}: {device.reason}" for device in completed.queue_item[item_id].failed]
+    if reasons:
+        return "failed", "; ".join(reasons)
+    return "completed", None
+
+
+def rolled_back(item: Item) -> bool:
+    return item.options.error_option == "rollback-on-error"
+
+
+class Pushes:
+    '''Queue items of the isis pushes still in progress
+
+    The state of each item and of each service it pushes is kept under
+    /rfs/isis-push; the items still pending are read back from there
+    after a restart of the python VM.
+    '''
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pending: dict[int, Item] = {}
+        self.log = logging.getLogger("isis.push")
+
+    def watch(self, item: Item) -> None:
+        with self._lock:
+            self._pending[item.id] = item
+        self._publish(item, "queued")
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def _publish(self, item: Item, status: str, error: Optional[str] = None) -> None:
+        with ncs.maapi.single_write_trans("admin", "system", db=ncs.OPERATIONAL) as trans:
+            push = ncs.maagic.get_node(trans, PUSH_PATH)
+            entry = push.item.create(item.id)
+            entry.device = item.device
+            entry.tag = item.tag
+            entry.attempt = item.attempt
+            entry.status = status
+            entry.error = error
+            entry.error_option = item.options.error_option
+            entry.retries = item.options.retries
+            entry.redeploy = item.redeploy
+            entry.service = [service.keypath for service in item.services]
+            updated = entry.updated = time.strftime(TIMESTAMP)
+            for service in item.services:
+                outcome = push.service.create(service.keypath)
+                outcome.queue_item = item.id
+                outcome.status = status
+                outcome.error = error
+                outcome.updated = updated
+            trans.apply()
+
+    def purge(self, days: int) -> int:
+        '''Remove the items finished more than `days` ago, and the services
+        they pushed last; the queued ones stay. Returns the items removed.'''
+
+        cutoff = time.strftime(TIMESTAMP, time.localtime(time.time() - days * 86400))
+        with ncs.maapi.single_write_trans("admin", "system", db=ncs.OPERATIONAL) as trans:
+            push = ncs.maagic.get_node(trans, PUSH_PATH)
+            # items written before the updated leaf existed are purged too
+            expired = {
+                int(entry.id) for entry in push.item
+                if str(entry.status) != "queued" and str(entry.updated or "") < cutoff
+            }
+            for item_id in expired:
+                del push.item[item_id]
+            for keypath in [str(outcome.keypath) for outcome in push.service if int(outcome.queue_item) in expired]:
+                del push.service[keypath]
+            trans.apply()
+        if expired:
+            self.log.info(f"isis push: {len(expired)} item(s) finished before {cutoff} purged")
+        return len(expired)
+
+    def load(self) -> None:
+        with ncs.maapi.single_read_trans("admin", "system", db=ncs.OPERATIONAL) as trans:
+            for entry in ncs.maagic.get_node(trans, PUSH_PATH).item:
+                if str(entry.status) != "queued":
+                    continue
+                matches = (_SERVICE_RE.match(str(keypath)) for keypath in entry.service)
+                services = tuple(
+                    ServiceRef(kind or "device", device, key or "aggregate")
+                    for device, kind, key in (match.groups() for match in matches if match)
+                )
+                options = PushOptions("async", str(entry.error_option), int(entry.retries or 0))
+                item = Item(
+                    int(entry.id), str(entry.device), str(entry.tag), services, options,
+                    int(entry.attempt or 0), bool(entry.redeploy),
+                )
+                with self._lock:
+                    self._pending[item.id] = item
+
+    def _retry(self, item: Item, error: Optional[str]) -> None:
+        '''Re-deploy the services of a failed item in a new one'''
+
+        self.log.warning(f"isis push {item.tag} to {item.device} failed ({error}), retry {item.attempt + 1}")
+        self._publish(item, "retried", error)
+        try:
+            retry = push_device("admin", item.device, list(item.services), item.options, item.tag, item.attempt + 1)
+        except Exception as err:
+            self._publish(item, "failed", f"{error}; retry failed: {err}")
+            return
+        if retry is None:
+            # pushed without queue item: done
+            self._publish(item._replace(attempt=item.attempt + 1), "completed")
+
+    def _done(self, item: Item, state: str, error: Optional[str]) -> None:
+        with self._lock:
+            self._pending.pop(item.id, None)
+        if state == "completed":
+            self._publish(item, "completed")
+        elif state == "unknown":
+            # a re-deploy is safe to run again; new config may be gone (rolled back)
+            if item.redeploy and item.attempt < item.options.retries:
+                self._retry(item, error)
+            else:
+                self.log.error(f"isis push {item.tag} to {item.device}: {error}")
+                self._publish(item, "unknown", error)
+        elif item.attempt < item.options.retries and (item.redeploy or not rolled_back(item)):
+            self._retry(item, error)
+        else:
+            # NSO rolled the item back (rollback-on-error), an item holds one device
+            final = "rolled-back" if rolled_back(item) else "failed"
+            self.log.error(f"isis push {item.tag} to {item.device} {final}: {error}")
+            self._publish(item, final, error)
+
+    def poll(self) -> None:
+        with self._lock:
+            pending = list(self._pending.values())
+        if not pending:
+            return
+        with ncs.maapi.single_read_trans("admin", "system", db=ncs.OPERATIONAL) as trans:
+            states = [(item, *_queue_state(trans, item.id)) for item in pending]
+        for item, state, error in states:
+            if state != "pending":
+                self._done(item, state, error)
+
+
+pushes = Pushes()
+
+
+def retention() -> int:
+    '''Days the finished items are kept, 0: forever (isis-fleet push retention)'''
+
+    with ncs.maapi.single_read_trans("admin", "system") as trans:
+        return int(ncs.maagic.get_root(trans).rfs.isis_fleet.push.retention)
+
+
+class Tracker(threading.Thread):
+    '''Polls the commit queue for the pending isis pushes'''
+
+    def __init__(self, log: logging.Logger, interval: float = 2.0) -> None:
+        super().__init__(name="isis-push-tracker", daemon=True)
+        self.log = log
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        try:
+            pushes.load()
+        except Exception as err:
+            self.log.warning(f"isis push: pending items not loaded: {err}")
+        purged = 0.0
+        while not self._stop_event.wait(self.interval):
+            try:
+                pushes.poll()
+            except Exception as err:
+                self.log.warning(f"isis push tracking failed: {err}")
+            if time.monotonic() - purged < PURGE_INTERVAL:
+                continue
+            purged = time.monotonic()
+            try:
+                days = retention()
+                if days:
+                    pushes.purge(days)
+            except Exception as err:
+                self.log.warning(f"isis push purge failed: {err}")
+
+    def stop(self) -> None:
+        self._stop_event.set()
@@ -0,0 +1,59 @@
+"Registry of the isis service handlers, imported on first use"
+
+import importlib
+import logging
+import threading
+import time
+from typing import Any, Optional
+
+# default handler of each service type, as "module:class" (relative to isis)
+HANDLERS = {
+    "instance": ".logic_handlers.isis_instance:IsisInstanceService",
+    "interface": ".logic_handlers.isis_interface:IsisInterfaceService",
+    "device": ".logic_handlers.isis_device:IsisDeviceService",
+}
+
+# handlers selected by the inventory-logic name of a service, per service type
+SPECIFIC_LOGICS: dict[str, dict[str, str]] = {
+    "instance": {},
+    "interface": {},
+}
+
+# template class of the handlers (pulls jinja in)
+TEMPLATE = "sdn_nso_lib.ncs_utils.template:J2NSOTemplate"
+
+
+class HandlerRegistry:
+    '''Resolves "module:class" references once, the first time they are used'''
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._loaded: dict[str, Any] = {}
+        self.load_times: dict[str, int] = {}
+
+    def load(self, ref: str) -> Any:
+        found = self._loaded.get(ref)
+        if found is not None:
+            return found
+        with self._lock:
+            if ref not in self._loaded:
+                module, _, name = ref.partition(":")
+                start = time.perf_counter()
+                self._loaded[ref] = getattr(importlib.import_module(module, __package__), name)
+                self.load_times[ref] = int((time.perf_counter() - start) * 1_000_000)
+                logging.info(f"isis: {ref} loaded in {self.load_times[ref] / 1000:.1f} ms")
+            return self._loaded[ref]
+
+    def handler(self, service_type: str, logic: Optional[str] = None) -> Any:
+        '''Handler class of a service type, or of its inventory-logic if it has one'''
+
+        ref = SPECIFIC_LOGICS.get(service_type, {}).get(str(logic)) if logic else None
+        return self.load(ref or HANDLERS[service_type])
+
+    def template(self, *args: Any, **kwargs: Any) -> Any:
+        '''A new J2NSOTemplate'''
+
+        return self.load(TEMPLATE)(*args, **kwargs)
+
+
+handlers = HandlerRegistry()
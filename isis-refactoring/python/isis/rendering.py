@@ -0,0 +1,185 @@
+"Rendering of the NSO XML config templates under templates/ without NSO"
+
+import copy
+import re
+import threading
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Callable, Optional
+
+TEMPLATES_DIR = Path(__file__).resolve().parents[2] / "templates"
+
+CONFIG_NS = "{http://tail-f.com/ns/config/1.0}"
+NCS_NS = "{http://tail-f.com/ns/ncs}"
+
+_VAR_RE = re.compile(r"\{\$([A-Za-z0-9_]+)\}")
+_TOKEN_RE = re.compile(r"\s*(\$[A-Za-z0-9_]+|'[^']*'|!=|=|\(|\)|and\b|or\b|not\b)")
+
+
+class TemplateError(Exception):
+    """Template cannot be parsed or rendered."""
+
+
+#################################################################
+#   Expressions                                                 #
+#################################################################
+
+def _compile_expr(expr: str) -> tuple[Callable[[dict[str, str]], bool], set[str]]:
+    '''Compile the small XPath subset used in <?if?> conditions'''
+
+    tokens: list[str] = []
+    variables: set[str] = set()
+    pos = 0
+    expr = expr.strip()
+    if expr.startswith("{") and expr.endswith("}"):
+        expr = expr[1:-1]
+    while pos < len(expr.rstrip()):
+        match = _TOKEN_RE.match(expr, pos)
+        if match is None:
+            raise TemplateError(f"Unsupported template expression: {expr!r}")
+        token = match.group(1)
+        pos = match.end()
+        if token.startswith("$"):
+            variables.add(token[1:])
+            tokens.append(f"_v[{token[1:]!r}]")
+        elif token == "=":
+            tokens.append("==")
+        else:
+            tokens.append(token)
+    code = compile(" ".join(tokens), f"<template-expr {expr}>", "eval")
+
+    def evaluate(values: dict[str, str]) -> bool:
+        return bool(eval(code, {"__builtins__": {}}, {"_v": values}))
+
+    return evaluate, variables
+
+
+#################################################################
+#   Templates                                                   #
+#################################################################
+
+class XmlTemplate:
+    '''A parsed config template, rendered against a variable map'''
+
+    def __init__(self, name: str, path: Path) -> None:
+        self.name = name
+        self.path = path
+        parser = ET.XMLParser(target=ET.TreeBuilder(insert_pis=True))
+        try:
+            self.tree = ET.parse(path, parser=parser).getroot()
+        except (OSError, ET.ParseError) as err:
+            raise TemplateError(f"Cannot load template {name}: {err}") from err
+        self.variables: set[str] = set()
+        self._conditions: dict[str, Callable[[dict[str, str]], bool]] = {}
+        self._collect(self.tree)
+
+    def _collect(self, element: ET.Element) -> None:
+        for node in element.iter():
+            if node.tag is ET.ProcessingInstruction:
+                kind, _, expr = (node.text or "").partition(" ")
+                if kind in ("if", "elif"):
+                    evaluate, variables = _compile_expr(expr)
+                    self._conditions[expr] = evaluate
+                    self.variables |= variables
+                elif kind not in ("else", "end"):
+                    raise TemplateError(f"{self.name}: unsupported instruction <?{node.text}?>")
+            else:
+                for text in (node.text, node.tail):
+                    if text:
+                        self.variables.update(_VAR_RE.findall(text))
+
+    def render(self, values: dict[str, str]) -> ET.Element:
+        missing = self.variables - values.keys()
+        if missing:
+            raise TemplateError(f"{self.name}: undefined variables {', '.join(sorted(missing))}")
+        out = ET.Element(self.tree.tag)
+        self._render_children(self.tree, out, values)
+        return out
+
+    def _render_children(self, src: ET.Element, dst: ET.Element, values: dict[str, str]) -> None:
+        # stack of (branch taken, already matched) for nested <?if?> blocks
+        stack: list[tuple[bool, bool]] = []
+        active = True
+        for child in src:
+            if child.tag is ET.ProcessingInstruction:
+                kind, _, expr = (child.text or "").partition(" ")
+                if kind == "if":
+                    taken = active and self._conditions[expr](values)
+                    stack.append((active, taken))
+                    active = taken
+                elif kind == "elif":
+                    parent, matched = stack[-1]
+                    taken = parent and not matched and self._conditions[expr](values)
+                    stack[-1] = (parent, matched or taken)
+                    active = taken
+                elif kind == "else":
+                    parent, matched = stack[-1]
+                    active = parent and not matched
+                    stack[-1] = (parent, True)
+                elif kind == "end":
+                    active, _ = stack.pop()
+                continue
+            if not active:
+                continue
+            node = ET.SubElement(dst, child.tag)
+            if child.text and child.text.strip():
+                node.text = _VAR_RE.sub(lambda m: values[m.group(1)], child.text.strip())
+            self._render_children(child, node, values)
+        if stack:
+            raise TemplateError(f"{self.name}: unterminated <?if?> under <{src.tag}>")
+
+
+_cache: dict[str, XmlTemplate] = {}
+_cache_lock = threading.Lock()
+
+
+def load_template(name: str, templates_dir: Path = TEMPLATES_DIR) -> XmlTemplate:
+    '''Return the parsed template "<ned>/<template-name>" (cached)'''
+
+    key = str(templates_dir / name)
+    template = _cache.get(key)
+    if template is None:
+        with _cache_lock:
+            template = _cache.get(key)
+            if template is None:
+                template = XmlTemplate(name, templates_dir / f"{name}.xml")
+                _cache[key] = template
+    return template
+
+
+#################################################################
+#   Rendered trees                                              #
+#################################################################
+
+def _entry_key(element: ET.Element) -> Optional[tuple[str, str]]:
+    if len(element) and len(element[0]) == 0:
+        return (element[0].tag, element[0].text or "")
+    return None
+
+
+def merge(dst: ET.Element, src: ET.Element) -> None:
+    '''Merge a rendered tree into an accumulated one, like successive applies'''
+
+    for child in src:
+        key = _entry_key(child)
+        for existing in dst:
+            if existing.tag == child.tag and _entry_key(existing) == key:
+                if len(child) == 0:
+                    existing.text = child.text
+                else:
+                    merge(existing, child)
+                break
+        else:
+            dst.append(copy.deepcopy(child))
+
+
+def device_configs(rendered: ET.Element) -> dict[str, ET.Element]:
+    '''Split a rendered <config-template> into {device name: <device>}'''
+
+    devices: dict[str, ET.Element] = {}
+    for device in rendered.iter(f"{NCS_NS}device"):
+        name = device.find(f"{NCS_NS}name")
+        if name is None or not name.text:
+            raise TemplateError("Rendered template has a device without a name")
+        devices[name.text] = device
+    return devices
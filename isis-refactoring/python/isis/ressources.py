@@ -5,3 +5,9 @@ REFS_POLICY = {
         "inventory-template"
     ]
 }
+
+NEDS = (
+    "cisco-iosxr-cli",
+    "alu-sr-cli",
+    "huawei-vrp-cli",
+)
@@ -0,0 +1,339 @@
+"Automatic SR prefix SIDs for the loopback interfaces configured without an sr-id"
+
+import logging
+import re
+import threading
+from typing import Any, Callable, Iterable, Optional
+
+import ncs
+
+from .txcache import TransactionCache
+
+# default SRGB of the instances (see the sr container of isis.yang)
+DEFAULT_DOMAIN = "default"
+DEFAULT_SRGB = (18432, 118432)
+
+# proplist entry of an interface holding its SID, as "<domain> <sid>"
+PROP_SID = "isis-sr-id"
+
+POOL_PATH = "/rfs:rfs/bytel-isis:isis-sid-pool"
+
+# pending owner of the SIDs used by something else than a pool entry (manual sr-id)
+FOREIGN = ""
+
+_SID_RE = re.compile(r'^/rfs:rfs/bytel-isis:isis-sid-pool/domain\{"?(.+?)"?\}/sid\{(\d+)\}$')
+
+Srgb = tuple[str, int, int]
+
+
+class PoolExhausted(Exception):
+    """No free SID left in the SRGB of an ISIS domain."""
+
+
+class Bitmap:
+    '''Used SIDs of one SRGB, bit i of an int is SID lower + i
+
+    The lowest free SID is found with int arithmetic on the whole
+    bitmap (C loops over 30-bit digits) instead of walking the SIDs.
+    '''
+
+    __slots__ = ("lower", "upper", "bits")
+
+    def __init__(self, lower: int, upper: int) -> None:
+        self.lower = lower
+        self.upper = upper
+        self.bits = 0
+
+    def __contains__(self, sid: int) -> bool:
+        return self.lower <= sid <= self.upper
+
+    def set(self, sid: int) -> None:
+        if sid in self:
+            self.bits |= 1 << (sid - self.lower)
+
+    def clear(self, sid: int) -> None:
+        if sid in self:
+            self.bits &= ~(1 << (sid - self.lower))
+
+    def used(self, sid: int) -> bool:
+        return sid in self and bool(self.bits >> (sid - self.lower) & 1)
+
+    def first_free(self, extra: int = 0) -> Optional[int]:
+        '''Lowest SID free in the bitmap and in `extra` (bits of the same SRGB)'''
+
+        bits = self.bits | extra
+        # ~bits & (bits + 1) isolates the lowest 0 bit of bits
+        index = (~bits & (bits + 1)).bit_length() - 1
+        sid = self.lower + index
+        return sid if sid <= self.upper else None
+
+
+class Pending:
+    '''SIDs given out (or found taken) by the creates of one transaction
+
+    They stay out of the committed pools: SidPoolSubscriber marks a SID
+    used once its pool entry is committed, the ones of an aborted commit,
+    a rejected validation or a dry-run are dropped with the transaction
+    (by the validation point, or once idle, see txcache).
+    '''
+
+    __slots__ = ("owners", "_by_owner", "_bits")
+
+    def __init__(self) -> None:
+        self.owners: dict[tuple[str, int], str] = {}
+        self._by_owner: dict[str, tuple[str, int]] = {}
+        self._bits: dict[Srgb, int] = {}
+
+    def add(self, domain: str, sid: int, owner: str) -> None:
+        self.owners[(domain, sid)] = owner
+        if owner:
+            self._by_owner[owner] = (domain, sid)
+        for (name, lower, upper), bits in self._bits.items():
+            if name == domain and lower <= sid <= upper:
+                self._bits[(name, lower, upper)] = bits | 1 << (sid - lower)
+
+    def owned(self, owner: str) -> Optional[tuple[str, int]]:
+        return self._by_owner.get(owner)
+
+    def bits(self, srgb: Srgb) -> int:
+        '''SIDs of the transaction in an SRGB, as Bitmap.bits'''
+
+        bits = self._bits.get(srgb)
+        if bits is None:
+            domain, lower, upper = srgb
+            bits = 0
+            for name, sid in self.owners:
+                if name == domain and lower <= sid <= upper:
+                    bits |= 1 << (sid - lower)
+            self._bits[srgb] = bits
+        return bits
+
+
+class SidPools:
+    '''{domain: {sid: owner}} of the committed SIDs, with a bitmap per SRGB
+
+    The pool entries in CDB are the reference (written by the creates,
+    so FASTMAP removes them with their service): they are read once after
+    a restart, then kept in sync by SidPoolSubscriber only. The creates
+    allocate on top of them in the Pending of their transaction.
+    '''
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._used: dict[str, dict[int, str]] = {}
+        self._owned: dict[str, tuple[str, int]] = {}
+        self._bitmaps: dict[str, dict[tuple[int, int], Bitmap]] = {}
+        self.complete = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self._used.clear()
+            self._owned.clear()
+            self._bitmaps.clear()
+        self.complete = False
+
+    def _bitmap(self, domain: str, lower: int, upper: int) -> Bitmap:
+        bitmaps = self._bitmaps.setdefault(domain, {})
+        bitmap = bitmaps.get((lower, upper))
+        if bitmap is None:
+            # first use of this SRGB in the domain: the only pass over its SIDs
+            bitmap = bitmaps[(lower, upper)] = Bitmap(lower, upper)
+            for sid in self._used.get(domain, {}):
+                bitmap.set(sid)
+        return bitmap
+
+    def _mark(self, domain: str, sid: int, owner: str) -> None:
+        self._used.setdefault(domain, {})[sid] = owner
+        for bitmap in self._bitmaps.get(domain, {}).values():
+            bitmap.set(sid)
+        if owner:
+            self._owned[owner] = (domain, sid)
+
+    def _unmark(self, domain: str, sid: int) -> None:
+        owner = self._used.get(domain, {}).pop(sid, None)
+        for bitmap in self._bitmaps.get(domain, {}).values():
+            bitmap.clear(sid)
+        if owner and self._owned.get(owner) == (domain, sid):
+            del self._owned[owner]
+
+    def _next_free(self, srgb: Srgb, pending: Pending, owner: str, taken: Callable[[int], bool]) -> int:
+        domain, lower, upper = srgb
+        while True:
+            with self._lock:
+                sid = self._bitmap(domain, lower, upper).first_free(pending.bits(srgb))
+            if sid is None:
+                raise PoolExhausted(f"no free SID in {lower}-{upper} for ISIS domain {domain}")
+            if taken(sid):
+                # configured by hand or committed meanwhile: skipped in this transaction only
+                pending.add(domain, sid, FOREIGN)
+                continue
+            pending.add(domain, sid, owner)
+            return sid
+
+    def owned(self, owner: str) -> Optional[tuple[str, int]]:
+        with self._lock:
+            return self._owned.get(owner)
+
+    def owner(self, domain: str, sid: int) -> Optional[str]:
+        with self._lock:
+            return self._used.get(domain, {}).get(sid)
+
+    def allocate(
+        self,
+        owner: str,
+        srgb: Srgb,
+        pending: Pending,
+        previous: Optional[tuple[str, int]] = None,
+        taken: Callable[[int], bool] = lambda sid: False,
+    ) -> int:
+        '''SID of an owner: the one it holds if still in its SRGB, else the lowest free one
+
+        `taken(sid)` tells a SID used outside of the pools (configured by
+        hand, or committed since the subscriber last ran). The SID is only
+        added to `pending`; a SID left for another SRGB keeps its bit until
+        its pool entry is removed by the commit.
+        '''
+
+        domain, lower, upper = srgb
+        for held in (pending.owned(owner), self.owned(owner), previous):
+            if held is None or held[0] != domain or not lower <= held[1] <= upper:
+                continue
+            if self.owner(*held) in (None, owner) and pending.owners.get(held, owner) == owner and not taken(held[1]):
+                pending.add(domain, held[1], owner)
+                return held[1]
+        return self._next_free(srgb, pending, owner, taken)
+
+    def reserve(self, owner: str, srgb: Srgb, count: int, taken: Callable[[int], bool] = lambda sid: False) -> list[int]:
+        '''`count` free SIDs for one owner (bulk onboarding), marked once committed'''
+
+        pending = Pending()
+        return [self._next_free(srgb, pending, owner, taken) for _ in range(count)]
+
+    def mark(self, domain: str, sid: int, owner: str) -> None:
+        with self._lock:
+            self._mark(domain, sid, owner)
+
+    def release(self, domain: str, sid: int) -> None:
+        with self._lock:
+            self._unmark(domain, sid)
+
+    def rebuild(self, entries: Iterable[tuple[str, int, str]]) -> None:
+        self.reset()
+        with self._lock:
+            for domain, sid, owner in entries:
+                self._mark(domain, sid, owner)
+            count = sum(len(used) for used in self._used.values())
+        self.complete = True
+        logging.info(f"isis SID pools rebuilt: {count} SID(s) in {len(self._used)} domain(s)")
+
+
+sid_pools = SidPools()
+
+_pending = TransactionCache()
+
+
+def pending(th: int) -> Pending:
+    '''SIDs allocated by the transaction so far'''
+
+    return _pending.get_or_load(th, "sids", Pending)
+
+
+#################################################################
+#   CDB side                                                    #
+#################################################################
+
+def pool_entries(root: Any) -> Iterable[tuple[str, int, str]]:
+    for domain in root.rfs.isis_sid_pool.domain:
+        for entry in domain.sid:
+            yield str(domain.name), int(entry.value), str(entry.owner or "")
+
+
+def srgb(root: Any, isis: Any, instance_id: Optional[str]) -> Optional[Srgb]:
+    '''(domain, lower, upper) of an isis instance, None when SR is off
+
+    The sr container of the instance wins over the one of its inventory.
+    '''
+
+    if not instance_id or instance_id not in isis.instance:
+        return None
+    instance = isis.instance[instance_id]
+    sr = instance.sr
+    if not sr.exists() and instance.inventory_template:
+        sr = root.rfs.inventory.isis.instance[instance.inventory_template].sr
+    if not sr.exists():
+        return None
+    return (
+        str(sr.domain or DEFAULT_DOMAIN),
+        int(sr.lower_bound or DEFAULT_SRGB[0]),
+        int(sr.upper_bound or DEFAULT_SRGB[1]),
+    )
+
+
+def domain_of(root: Any, isis: Any, instance_id: Optional[str]) -> str:
+    '''ISIS domain of the sr-ids of an instance, the default one without SR'''
+
+    found = srgb(root, isis, instance_id)
+    return DEFAULT_DOMAIN if found is None else found[0]
+
+
+def entry_owner(root: Any, domain: str, sid: int) -> Optional[str]:
+    '''Owner of a pool entry as the transaction sees it, None when free
+
+    Read in the transaction so that two commits allocating the same SID
+    conflict, and so that a SID committed since the last SidPoolSubscriber
+    run is seen.
+    '''
+
+    domains = root.rfs.isis_sid_pool.domain
+    if domain not in domains or sid not in domains[domain].sid:
+        return None
+    return str(domains[domain].sid[sid].owner or "")
+
+
+def persist(root: Any, domain: str, sid: int, owner: str) -> None:
+    entry = root.rfs.isis_sid_pool.domain.create(domain).sid.create(sid)
+    entry.owner = owner
+
+
+def from_proplist(proplist: list[tuple[str, str]]) -> Optional[tuple[str, int]]:
+    value = dict(proplist or []).get(PROP_SID)
+    if not value:
+        return None
+    domain, _, sid = value.rpartition(" ")
+    return domain, int(sid)
+
+
+def to_proplist(proplist: list[tuple[str, str]], domain: str, sid: int) -> list[tuple[str, str]]:
+    kept = [(name, value) for name, value in proplist if name != PROP_SID]
+    return kept + [(PROP_SID, f"{domain} {sid}")]
+
+
+class SidPoolSubscriber(ncs.cdb.Subscriber):
+    """Marks the SIDs whose pool entry was committed (the only place a
+    SID becomes used) and frees the ones removed (service deleted, SID
+    moved to another SRGB)"""
+
+    def init(self) -> None:
+        self.register(f"{POOL_PATH}/bytel-isis:domain/bytel-isis:sid", priority=100)
+
+    def pre_iterate(self) -> list[tuple[int, str, int]]:
+        return []
+
+    def iterate(self, kp: Any, op: int, oldv: Any, newv: Any, state: list[tuple[int, str, int]]) -> int:
+        match = _SID_RE.match(str(kp))
+        if match is not None and op in (ncs.MOP_CREATED, ncs.MOP_DELETED):
+            state.append((op, match.group(1), int(match.group(2))))
+        return ncs.ITER_CONTINUE
+
+    def should_post_iterate(self, state: list[tuple[int, str, int]]) -> bool:
+        return bool(state) and sid_pools.complete
+
+    def post_iterate(self, state: list[tuple[int, str, int]]) -> None:
+        with ncs.maapi.single_read_trans("admin", "system") as trans:
+            domains = ncs.maagic.get_root(trans).rfs.isis_sid_pool.domain
+            for op, domain, sid in state:
+                if domain in domains and sid in domains[domain].sid:
+                    sid_pools.mark(domain, sid, str(domains[domain].sid[sid].owner or ""))
+                elif op == ncs.MOP_DELETED:
+                    sid_pools.release(domain, sid)
+        self.log.info(f"isis SID pools: {len(state)} change(s) applied")
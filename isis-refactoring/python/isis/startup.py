@@ -0,0 +1,112 @@
+"Import timings of the package, written to the package log by Main.setup"
+
+import contextlib
+import importlib.abc
+import sys
+import threading
+import time
+from typing import Any, Iterator, Optional, Sequence
+
+
+class _TimedLoader(importlib.abc.Loader):
+    '''Loader proxy timing exec_module, the original loader is put back after'''
+
+    def __init__(self, loader: Any, timer: "ImportTimer") -> None:
+        self._loader = loader
+        self._timer = timer
+
+    def create_module(self, spec: Any) -> Any:
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module: Any) -> None:
+        try:
+            with self._timer.timing(module.__name__):
+                self._loader.exec_module(module)
+        finally:
+            module.__loader__ = self._loader
+            if module.__spec__ is not None:
+                module.__spec__.loader = self._loader
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._loader, name)
+
+
+class ImportTimer(importlib.abc.MetaPathFinder):
+    '''Times the modules of the package imported while it is installed
+
+    Keeps {module: [inclusive us, self us]}; "self" excludes the modules
+    the module imported itself. Other imports of the VM are left to the
+    next finders untouched.
+    '''
+
+    def __init__(self, prefix: str = "isis.") -> None:
+        self.prefix = prefix
+        self.timings: dict[str, list[int]] = {}
+        self.roots: list[str] = []
+        self._local = threading.local()
+        self.started = 0.0
+        self.elapsed = 0.0
+
+    def start(self) -> None:
+        self.started = time.perf_counter()
+        sys.meta_path.insert(0, self)
+
+    def stop(self) -> None:
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+            self.elapsed = time.perf_counter() - self.started
+
+    def find_spec(self, fullname: str, path: Optional[Sequence[str]], target: Any = None) -> Any:
+        if not fullname.startswith(self.prefix):
+            return None
+        # per thread: another thread looking the same module up is not a recursion
+        finding = self._local.__dict__.setdefault("finding", set())
+        if fullname in finding:
+            return None
+        finding.add(fullname)
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            finding.discard(fullname)
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _TimedLoader(spec.loader, self)
+        return spec
+
+    @contextlib.contextmanager
+    def timing(self, name: str) -> Iterator[None]:
+        stack = self._local.__dict__.setdefault("stack", [])
+        if not stack:
+            self.roots.append(name)
+        frame = [name, 0]
+        stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            inclusive = int((time.perf_counter() - start) * 1_000_000)
+            stack.pop()
+            if stack:
+                stack[-1][1] += inclusive
+            self.timings[name] = [inclusive, inclusive - frame[1]]
+
+    def report(self, top: int = 15) -> list[str]:
+        '''Log lines: the total, then the slowest modules (inclusive time)'''
+
+        total = sum(self.timings[name][0] for name in self.roots if name in self.timings)
+        lines = [f"isis imports: {len(self.timings)} modules, {total / 1000:.1f} ms"]
+        slowest = sorted(self.timings.items(), key=lambda item: item[1][0], reverse=True)[:top]
+        for name, (inclusive, own) in slowest:
+            lines.append(f"  {inclusive / 1000:8.1f} ms  {own / 1000:8.1f} ms self  {name}")
+        return lines
+
+
+# started when isis.main imports this module first, stopped by Main.setup
+import_timer = ImportTimer()
+import_timer.start()
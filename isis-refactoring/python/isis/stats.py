@@ -0,0 +1,218 @@
+"Per-phase latency statistics of the isis service creates"
+
+import contextlib
+import functools
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Iterator, Optional
+
+import ncs
+
+# Samples kept per histogram to compute the percentiles
+RESERVOIR_SIZE = 4096
+
+PHASES = ("inventory", "fingerprint", "prepare", "vars", "passwd", "apply", "total")
+
+STATS_PATH = "/rfs:rfs/bytel-isis:isis-stats"
+
+
+class Histogram:
+    '''Latency histogram (microseconds) over the last RESERVOIR_SIZE samples'''
+
+    __slots__ = ("count", "max", "_samples")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.max = 0
+        self._samples: deque[int] = deque(maxlen=RESERVOIR_SIZE)
+
+    def record(self, usec: int) -> None:
+        self.count += 1
+        if usec > self.max:
+            self.max = usec
+        self._samples.append(usec)
+
+    def percentiles(self, *ranks: float) -> list[int]:
+        ordered = sorted(self._samples)
+        if not ordered:
+            return [0 for _ in ranks]
+        return [ordered[min(len(ordered) - 1, int(len(ordered) * rank))] for rank in ranks]
+
+
+class _Create:
+    '''Phase samples of one create, flushed once the NED is known'''
+
+    __slots__ = ("service_type", "ned", "start", "phases")
+
+    def __init__(self, service_type: str) -> None:
+        self.service_type = service_type
+        self.ned = "unknown"
+        self.start = time.perf_counter()
+        self.phases: list[tuple[str, int]] = []
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.histograms: dict[tuple[str, str, str], Histogram] = {}
+        self.errors: dict[tuple[str, str], int] = {}
+        self.generation = 0
+
+    #################################################################
+    #   Recording                                                   #
+    #################################################################
+
+    def _current(self) -> Optional[_Create]:
+        return getattr(self._local, "create", None)
+
+    def measure(self, service_type: str) -> Callable[..., Any]:
+        '''Decorator timing a whole cb_create (phase "total") and its errors'''
+
+        def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+            @functools.wraps(fn)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                create = _Create(service_type)
+                self._local.create = create
+                failed = False
+                try:
+                    return fn(*args, **kwargs)
+                except Exception:
+                    failed = True
+                    raise
+                finally:
+                    self._local.create = None
+                    create.phases.append(("total", _usec(create.start)))
+                    self._flush(create, failed)
+            return wrapper
+        return decorator
+
+    def phase_done(self, phase: str) -> None:
+        '''Record the time elapsed since the create started as `phase`'''
+
+        create = self._current()
+        if create is not None:
+            create.phases.append((phase, _usec(create.start)))
+
+    def set_ned(self, ned: str) -> None:
+        create = self._current()
+        if create is not None:
+            create.ned = ned
+
+    @contextlib.contextmanager
+    def phase(self, phase: str) -> Iterator[None]:
+        create = self._current()
+        if create is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            create.phases.append((phase, _usec(start)))
+
+    def _flush(self, create: _Create, failed: bool) -> None:
+        with self._lock:
+            for phase, usec in create.phases:
+                key = (create.service_type, create.ned, phase)
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram()
+                histogram.record(usec)
+            if failed:
+                error_key = (create.service_type, create.ned)
+                self.errors[error_key] = self.errors.get(error_key, 0) + 1
+            self.generation += 1
+
+    #################################################################
+    #   Reporting                                                   #
+    #################################################################
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms.clear()
+            self.errors.clear()
+            self.generation += 1
+
+    def snapshot(self) -> dict[str, dict[str, dict[str, Any]]]:
+        '''{service type: {ned: {"errors": n, "phases": {phase: {...}}}}}'''
+
+        with self._lock:
+            items = [(key, h.count, h.max, h.percentiles(0.50, 0.95, 0.99))
+                     for key, h in self.histograms.items()]
+            errors = dict(self.errors)
+
+        report: dict[str, dict[str, dict[str, Any]]] = {}
+        for (service_type, ned, phase), count, maximum, (p50, p95, p99) in items:
+            entry = report.setdefault(service_type, {}).setdefault(ned, {"errors": 0, "phases": {}})
+            entry["phases"][phase] = {"count": count, "p50": p50, "p95": p95, "p99": p99, "max": maximum}
+        for (service_type, ned), count in errors.items():
+            report.setdefault(service_type, {}).setdefault(ned, {"errors": 0, "phases": {}})["errors"] = count
+        for neds in report.values():
+            for entry in neds.values():
+                entry["phases"] = dict(sorted(entry["phases"].items(), key=lambda i: _phase_order(i[0])))
+        return report
+
+
+def _usec(start: float) -> int:
+    return int((time.perf_counter() - start) * 1_000_000)
+
+
+def _phase_order(phase: str) -> int:
+    return PHASES.index(phase) if phase in PHASES else len(PHASES)
+
+
+registry = Registry()
+
+
+#################################################################
+#   Operational data                                            #
+#################################################################
+
+def publish(snapshot: dict[str, dict[str, dict[str, Any]]]) -> None:
+    '''Write a snapshot under /rfs/isis-stats (CDB operational)'''
+
+    with ncs.maapi.single_write_trans("admin", "system", db=ncs.OPERATIONAL) as trans:
+        if trans.exists(STATS_PATH):
+            trans.delete(STATS_PATH)
+        stats = ncs.maagic.get_node(trans, STATS_PATH)
+        for service_type, neds in snapshot.items():
+            st = stats.service_type.create(service_type)
+            for ned, entry in neds.items():
+                node = st.ned.create(ned)
+                node.errors = entry["errors"]
+                for phase, values in entry["phases"].items():
+                    ph = node.phase.create(phase)
+                    for leaf, value in values.items():
+                        setattr(ph, leaf, value)
+        trans.apply()
+
+
+class Publisher(threading.Thread):
+    '''Publishes the registry to CDB operational when it changed'''
+
+    def __init__(self, log: logging.Logger, interval: float = 5.0) -> None:
+        super().__init__(name="isis-stats-publisher", daemon=True)
+        self.log = log
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._published = -1
+
+    def publish_now(self) -> None:
+        generation = registry.generation
+        publish(registry.snapshot())
+        self._published = generation
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            if registry.generation == self._published:
+                continue
+            try:
+                self.publish_now()
+            except Exception as err:
+                self.log.warning(f"isis stats publication failed: {err}")
+
+    def stop(self) -> None:
+        self._stop_event.set()
@@ -0,0 +1,94 @@
+"Template preloading and variable check, run when the package is set up"
+
+import logging
+from typing import Any
+
+from . import flatten
+from .registry import SPECIFIC_LOGICS, handlers
+from .rendering import TEMPLATES_DIR, TemplateError, load_template
+
+# Every leaf the merged service data can hold (mirror of src/yang/isis.yang,
+# plus the values derived by the input models); lists are never flattened.
+INSTANCE_DATA: dict[str, Any] = {
+    "instance_id": "",
+    "area_id": "",
+    "loopback0": "",
+    "net_id": "",
+    "is_name": "",
+    "export": "",
+    "export_tunnel_table": "",
+    "sr": {"lower_bound": 0, "upper_bound": 0, "domain": ""},
+    "fast_reroute": {"ti_lfa_level": ""},
+    "ldp": {},
+    "mpls": True,
+    "mpls_sr_prefer": True,
+    "disable_sync_ldp": True,
+    "dist_link_state": True,
+    "inventory_template": "",
+    "inventory_logic": {"name": ""},
+}
+
+INTERFACE_DATA: dict[str, Any] = {
+    "name": "",
+    "isis_instance_id": "",
+    "interface_type": "",
+    "circuit_type": "",
+    "metric": 0,
+    "passwd": "",
+    "enable_sync_ldp": True,
+    "common_attributes": {"id": "", "type": "", "subif_id": ""},
+    "loopback_attribs": {"unicast_tag": 0, "sr_id": 0, "loopback_id": 0},
+    "inventory_template": "",
+    "inventory_logic": {"name": ""},
+}
+
+SERVICE_DATA = {
+    "instance": INSTANCE_DATA,
+    "interface": INTERFACE_DATA,
+}
+
+
+def emitted() -> dict[str, set[str]]:
+    '''{template: variables the apply_* method applying it can set}'''
+
+    variables: dict[str, set[str]] = {}
+    for service_type, data in SERVICE_DATA.items():
+        for logic in (None, *SPECIFIC_LOGICS[service_type]):
+            _add_emitted(variables, service_type, handlers.handler(service_type, logic), data)
+    return variables
+
+
+def _add_emitted(variables: dict[str, set[str]], service_type: str, handler: type, data: dict[str, Any]) -> None:
+    generic = set(handler.common_variables) | set(flatten.flatten(data))
+    for template, added in handler.template_variables.items():
+        variables.setdefault(template, set()).update(generic, added)
+
+
+def _problems(expected: dict[str, set[str]]) -> list[str]:
+    problems = []
+    for name in sorted(expected):
+        try:
+            template = load_template(name)
+        except TemplateError as err:
+            problems.append(str(err))
+            continue
+        unknown = template.variables - expected[name]
+        if unknown:
+            problems.append(f"{name}: variables never set: {', '.join(sorted(unknown))}")
+    return problems
+
+
+def preload() -> list[str]:
+    '''Parse every template of templates/ and check its variables
+
+    Returns the problems found: templates applied by a handler but missing
+    or unparsable, variables a template uses that no apply_* sets. Loads
+    every handler: Main.setup runs it and fails the package reload on a
+    problem, the offline gate runs it too.
+    '''
+
+    expected = emitted()
+    found = {f"{path.parent.name}/{path.stem}" for path in TEMPLATES_DIR.glob("*/*.xml")}
+    for name in sorted(found - expected.keys()):
+        logging.warning(f"template {name} is not applied by any isis handler")
+    return _problems(expected)
@@ -0,0 +1,149 @@
+"Sampled trace records of the isis creates, one structured log line per create"
+
+import fnmatch
+import functools
+import json
+import logging
+import threading
+import time
+import zlib
+from typing import Any, Callable, Optional
+
+from . import fingerprint
+
+# off: nothing, hash: templates and a hash of their variables, full: the variables
+LEVELS = ("off", "hash", "full")
+SAMPLE_BY = ("service", "device")
+
+log = logging.getLogger("isis.trace")
+
+
+class _Span:
+    '''What one create did, filled by the handlers through Tracer.annotate'''
+
+    __slots__ = ("kind", "service", "device", "start", "ned", "applied", "replayed")
+
+    def __init__(self, kind: str, service: str, device: str) -> None:
+        self.kind = kind
+        self.service = service
+        self.device = device
+        self.start = time.perf_counter()
+        self.ned: Optional[str] = None
+        self.applied: fingerprint.Applied = []
+        self.replayed = 0
+
+
+class _Record:
+    '''Log argument formatted (JSON) only if a handler emits the record'''
+
+    __slots__ = ("span", "level", "usec", "error")
+
+    def __init__(self, span: _Span, level: str, usec: int, error: Optional[str]) -> None:
+        self.span = span
+        self.level = level
+        self.usec = usec
+        self.error = error
+
+    def __str__(self) -> str:
+        span = self.span
+        record: dict[str, Any] = {
+            "service": span.service,
+            "kind": span.kind,
+            "device": span.device,
+            "ned": span.ned,
+            "us": self.usec,
+            "replayed": span.replayed,
+            "templates": [name for name, _ in span.applied],
+        }
+        if self.level == "full":
+            record["variables"] = [variables for _, variables in span.applied]
+        else:
+            record["variables-sha"] = fingerprint.of_result(span.applied)[:16]
+        if self.error is not None:
+            record["error"] = self.error
+        return json.dumps(record, separators=(",", ":"), default=str)
+
+
+def _device_of(kind: str, service: Any) -> str:
+    isis = service._parent if kind == "device" else service._parent._parent
+    return str(isis.device)
+
+
+class Tracer:
+    '''Level, sampling and device filter of the create traces, changed at runtime
+
+    A create is sampled on a CRC of its keypath (or of its device), so the
+    same services are traced from one commit to the next. Off until the
+    trace action turns it on: a record per create is too much by default.
+    '''
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+        self.level = "off"
+        self.percent = 100
+        self.sample_by = "service"
+        self.device: Optional[str] = None
+
+    def configure(
+        self,
+        level: str,
+        percent: int = 100,
+        sample_by: str = "service",
+        device: Optional[str] = None,
+    ) -> None:
+        if level not in LEVELS or sample_by not in SAMPLE_BY:
+            raise ValueError(f"unknown trace level {level} or sampling {sample_by}")
+        self.level, self.percent, self.sample_by, self.device = level, percent, sample_by, device
+
+    def sampled(self, service: str, device: str) -> bool:
+        if self.level == "off" or not log.isEnabledFor(logging.INFO):
+            return False
+        if self.device and not fnmatch.fnmatchcase(device, self.device):
+            return False
+        if self.percent >= 100:
+            return True
+        key = service if self.sample_by == "service" else device
+        return zlib.crc32(key.encode()) % 100 < self.percent
+
+    def trace(self, kind: str) -> Callable[..., Any]:
+        '''cb_create decorator logging one record per sampled create'''
+
+        def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+            @functools.wraps(fn)
+            def wrapper(self_: Any, tctx: Any, root: Any, service: Any, proplist: Any) -> Any:
+                keypath, device = str(service._path), _device_of(kind, service)
+                if not self.sampled(keypath, device):
+                    return fn(self_, tctx, root, service, proplist)
+                span = self._local.span = _Span(kind, keypath, device)
+                error = None
+                try:
+                    return fn(self_, tctx, root, service, proplist)
+                except Exception as err:
+                    error = str(err) or type(err).__name__
+                    raise
+                finally:
+                    self._local.span = None
+                    usec = int((time.perf_counter() - span.start) * 1_000_000)
+                    log.info("%s", _Record(span, self.level, usec, error))
+            return wrapper
+        return decorator
+
+    def annotate(
+        self,
+        ned: Optional[str] = None,
+        applied: Optional[fingerprint.Applied] = None,
+        replayed: bool = False,
+    ) -> None:
+        '''Add to the record of the current create (nothing when not sampled)'''
+
+        span = getattr(self._local, "span", None)
+        if span is None:
+            return
+        if ned is not None:
+            span.ned = ned
+        if applied:
+            span.applied.extend(applied)
+        span.replayed += replayed
+
+
+tracer = Tracer()
@@ -0,0 +1,95 @@
+"Caches shared by the service creates of one transaction"
+
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+# Seconds a transaction keeps its entries without using them; its creates
+# use them all along the commit, however many transactions run at once
+MAX_IDLE = 60.0
+
+_caches: "weakref.WeakSet[TransactionCache]" = weakref.WeakSet()
+
+
+class TransactionCache:
+    '''Values keyed by transaction handle, then by an arbitrary key
+
+    The entries of a transaction are dropped by end() once its creates
+    are over, or after MAX_IDLE seconds without use (aborted commit,
+    re-deploy without validation): never because other transactions run
+    at the same time. A handle reused once they are dropped starts empty.
+    '''
+
+    def __init__(self, max_idle: float = MAX_IDLE) -> None:
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        # {tid: (last use, entries)}, least recently used first
+        self._transactions: OrderedDict[int, tuple[float, dict[Hashable, Any]]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        _caches.add(self)
+
+    def _entries(self, tid: int) -> dict[Hashable, Any]:
+        now = time.monotonic()
+        while self._transactions:
+            oldest, (used, _) = next(iter(self._transactions.items()))
+            if now - used <= self.max_idle:
+                break
+            del self._transactions[oldest]
+        found = self._transactions.pop(tid, None)
+        entries = {} if found is None else found[1]
+        self._transactions[tid] = (now, entries)
+        return entries
+
+    def get(self, tid: int, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self._entries(tid).get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def put(self, tid: int, key: Hashable, value: Any) -> Any:
+        with self._lock:
+            return self._entries(tid).setdefault(key, value)
+
+    def get_or_load(self, tid: int, key: Hashable, loader: Callable[[], Any]) -> Any:
+        '''Return the cached value, load it (outside the lock) on a miss'''
+
+        value = self.get(tid, key)
+        if value is None:
+            value = self.put(tid, key, loader())
+        return value
+
+    def invalidate(self, match: Callable[[Hashable], bool]) -> int:
+        '''Drop the entries whose key matches, in every transaction'''
+
+        dropped = 0
+        with self._lock:
+            for _, entries in self._transactions.values():
+                for key in [key for key in entries if match(key)]:
+                    del entries[key]
+                    dropped += 1
+        return dropped
+
+    def discard(self, tid: int) -> None:
+        with self._lock:
+            self._transactions.pop(tid, None)
+
+    def transactions(self) -> int:
+        with self._lock:
+            return len(self._transactions)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._transactions.clear()
+
+
+def end(tid: int) -> None:
+    '''Drop the entries of a transaction whose creates are over, in every cache'''
+
+    for cache in list(_caches):
+        cache.discard(tid)
@@ -0,0 +1,142 @@
+"Network-wide index of the NET ids, loopback0 addresses and SR prefix SIDs"
+
+import logging
+import threading
+from typing import Any, Callable, Iterable, Optional
+
+from . import sid_pool, utils
+from .actions.selection import ServiceRef
+
+# ("net-id" | "loopback0" | "sr-id", value)
+Claim = tuple[str, str]
+
+# claims of a service: {claim: owner}, a value may be claimed by several
+# services of the same owner (two instances of a router share its loopback0)
+Claims = dict[Claim, str]
+
+
+def sid_claim(domain: str, sid: Any) -> Claim:
+    '''Claim of an sr-id: SIDs are unique per ISIS domain, as the pools'''
+
+    return ("sr-id", f"{sid} in {domain}")
+
+
+def _merged(service: Any, inventory: Any, *path: str) -> Any:
+    '''Leaf of the service, else of its inventory entry (as GenericService merges them)'''
+
+    for node in (service, inventory):
+        for name in path[:-1]:
+            node = getattr(node, name, None)
+            if node is None or (hasattr(node, "exists") and not node.exists()):
+                break
+        else:
+            value = getattr(node, path[-1], None) if node is not None else None
+            if value not in (None, ""):
+                return value
+    return None
+
+
+def service_claims(root: Any, ref: ServiceRef, service: Any) -> Claims:
+    '''What an instance/interface claims, read from its leaves and the ones
+    of its inventory entry: no handler, no device or inventory manager read'''
+
+    entries = getattr(root.rfs.inventory.isis, ref.kind)
+    template = service.inventory_template
+    inventory = entries[template] if template and template in entries else None
+
+    found: Claims = {}
+    if ref.kind == "instance":
+        loopback0, area_id = _merged(service, inventory, "loopback0"), _merged(service, inventory, "area_id")
+        if loopback0:
+            found[("loopback0", str(loopback0))] = ref.device
+        if loopback0 and area_id:
+            found[("net-id", utils.generate_net_id(str(loopback0), str(area_id)))] = ref.device
+        return found
+
+    sr_id = _merged(service, inventory, "loopback_attribs", "sr_id")
+    if sr_id is None:
+        held = sid_pool.sid_pools.owned(str(service._path))
+        sr_id = None if held is None else held[1]
+    if sr_id is not None:
+        instance_id = _merged(service, inventory, "isis_instance_id")
+        domain = sid_pool.domain_of(root, service._parent._parent, instance_id)
+        found[sid_claim(domain, sr_id)] = f"{ref.device}/{service.name}"
+    return found
+
+
+class UniquenessIndex:
+    '''{claim: {service: owner}} of every isis instance and interface
+
+    Claims are added by the validation of the transactions touching a
+    service, one service at a time, and only dropped when a later
+    validation finds them gone
+    (service deleted, value changed): a claim left by an aborted commit
+    costs one check, a claim dropped too early would let a duplicate in.
+    Rebuilt from CDB the first time it is needed after a restart.
+    '''
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._holders: dict[Claim, dict[ServiceRef, str]] = {}
+        self.complete = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self._holders.clear()
+        self.complete = False
+
+    def record(self, ref: ServiceRef, found: Claims) -> None:
+        with self._lock:
+            for claim, owner in found.items():
+                self._holders.setdefault(claim, {})[ref] = owner
+
+    def holders(self, claim: Claim) -> dict[ServiceRef, str]:
+        with self._lock:
+            return dict(self._holders.get(claim, {}))
+
+    def drop(self, ref: ServiceRef, claim: Claim) -> None:
+        with self._lock:
+            holders = self._holders.get(claim, {})
+            holders.pop(ref, None)
+            if not holders:
+                self._holders.pop(claim, None)
+
+    def rebuild(self, found: Iterable[tuple[ServiceRef, Claims]]) -> None:
+        self.reset()
+        count = 0
+        for ref, service_claims in found:
+            self.record(ref, service_claims)
+            count += 1
+        self.complete = True
+        logging.info(f"isis uniqueness index rebuilt: {count} service(s), {len(self._holders)} value(s)")
+
+    def conflicts(
+        self,
+        ref: ServiceRef,
+        found: Claims,
+        current: Callable[[ServiceRef], Optional[Claims]],
+    ) -> list[tuple[Claim, ServiceRef, str]]:
+        '''(claim, other service, its owner) for each value held by another owner
+
+        `current(other)` returns the claims the other service holds now
+        (None when they cannot be computed: the indexed claim is kept).
+        '''
+
+        conflicts = []
+        for claim, owner in found.items():
+            for other, other_owner in self.holders(claim).items():
+                if other == ref or other_owner == owner:
+                    continue
+                held = current(other)
+                if held is not None:
+                    other_owner = held.get(claim, "")
+                    if not other_owner:
+                        self.drop(other, claim)
+                        continue
+                    if other_owner == owner:
+                        continue
+                conflicts.append((claim, other, other_owner))
+        return conflicts
+
+
+uniqueness_index = UniquenessIndex()
@@ -1,6 +1,8 @@
 import ncs
 import binascii
 
+from .txcache import TransactionCache
+
 
 class CiscoType7:
     '''
@@ -49,17 +51,76 @@ def generate_net_id(ip, area_id):
     # split every 4 digits with '.' and add start and end part
     return f'{area_id}.{convert[:4]}.{convert[4:8]}.{convert[8:]}.00'
 
-def generate_isis_passwd(root, formatted_as_number, device_name, interface_name):
+def parse_net_id(net_id):
+    '''Reverse of generate_net_id: returns (loopback ip, area id).
+
+    Example: 49.0010.0010.2304.5167.00 returns ("1.23.45.167", "49.0010")
+    '''
+    parts = net_id.split('.')
+    if len(parts) < 5 or any(len(part) != 4 for part in parts[-4:-1]):
+        raise ValueError(f'{net_id} is not a NET id generated from an ip address')
+    digits = ''.join(parts[-4:-1])
+    ip = '.'.join(str(int(digits[idx:idx + 3])) for idx in range(0, 12, 3))
+    return ip, '.'.join(parts[:-4])
+
+_password_snapshots = TransactionCache()
+
+
+def _load_isis_passwords(trans, device_name, tag):
+    passwords = {}
+    with trans.maapi.start_read_trans() as read_trans:
+        device = ncs.application.get_device(read_trans, device_name)
+        try:
+            interfaces = device.config.router.isis.tag[tag].interface
+        except KeyError:
+            return passwords
+        for interface in interfaces:
+            encrypted = interface.hello_password.encrypted
+            if encrypted:
+                passwords[str(interface.name)] = str(encrypted)
+    return passwords
+
+
+def isis_password_snapshot(root, device_name, tag):
+    '''{interface: encrypted hello-password} of an IOS-XR ISIS tag, as on the device
+
+    Read once per (device, tag) and transaction, in one read transaction,
+    then shared by all the interface creates of the transaction.
+    '''
+
+    trans = ncs.maagic.get_trans(root)
+    return _password_snapshots.get_or_load(
+        trans.th,
+        (device_name, str(tag)),
+        lambda: _load_isis_passwords(trans, device_name, str(tag)),
+    )
+
+
+def generate_isis_passwd(root, formatted_as_number, device_name, interface_name, tag):
     '''returns an encrypted password for the ISIS configuration'''
 
-    try:
-        trans = ncs.maagic.get_trans(root)
-        with trans.maapi.start_read_trans() as read_trans:
-            device = ncs.application.get_device(read_trans, device_name)
-            encrypted = device.config.router.isis.tag['OMEGA'].interface[interface_name].hello_password.encrypted
-            if encrypted == None or not CiscoType7.verify(formatted_as_number, encrypted):
-                encrypted = CiscoType7.encode(formatted_as_number)
-    except KeyError:
+    encrypted = isis_password_snapshot(root, device_name, tag).get(interface_name)
+    if encrypted is None or not CiscoType7.verify(formatted_as_number, encrypted):
         encrypted = CiscoType7.encode(formatted_as_number)
 
     return encrypted
+
+
+def seed_isis_passwords(root, secret, interfaces):
+    '''Encode one secret for many IOS-XR interfaces [(device, interface, tag)]
+
+    The hashes go into the password snapshots of the transaction, so the
+    interface creates it triggers find them instead of encoding again. A
+    hash already on the device is kept when it verifies the secret.
+    Returns the number of interfaces whose hash changes.
+    '''
+
+    encoded = CiscoType7.encode(secret)
+    changed = 0
+    for device_name, interface_name, tag in interfaces:
+        snapshot = isis_password_snapshot(root, device_name, tag)
+        current = snapshot.get(interface_name)
+        if current is None or not CiscoType7.verify(secret, current):
+            snapshot[interface_name] = encoded
+            changed += 1
+    return changed
@@ -0,0 +1,241 @@
+"Validation point rejecting isis services with missing inputs before any create"
+
+import logging
+import re
+from typing import Any, Iterator, Optional
+
+import ncs
+from ncs.dp import ValidationCallback
+
+from . import sid_pool, txcache
+from .actions.selection import ServiceRef
+from .dependencies import dependency_index
+from .inventory_cache import inventory_cache
+from .registry import handlers
+from .ressources import REFS_POLICY
+from .uniqueness import Claims, service_claims, uniqueness_index
+
+_SERVICE_RE = re.compile(r'^/rfs:rfs/bytel-isis:isis\{"?(.+?)"?\}/(instance|interface)\{"?(.+?)"?\}')
+_AGGREGATE_RE = re.compile(r'^/rfs:rfs/bytel-isis:isis\{"?(.+?)"?\}/aggregate$')
+_INVENTORY_RE = re.compile(r'^/rfs:rfs/rfs:inventory/bytel-isis:isis/(instance|interface)\{"?(.+?)"?\}')
+
+# what a service with bad inputs raises while its handler is built and
+# validated: unknown device or inventory entry, malformed leaf values;
+# anything else is a bug and fails the validation as is
+INPUT_ERRORS = (LookupError, ValueError)
+
+
+class ServiceInputRejected(Exception):
+    """One or more isis services have missing or invalid inputs."""
+
+
+class InputCheck:
+    '''Builds the handler of a service (inventory merged) and validates it
+
+    The NET id, loopback0 and sr-id of the checked services, read from
+    their leaves, are then looked up in the uniqueness index, one dict
+    lookup per value.
+    '''
+
+    @inventory_cache.subscribe(REFS_POLICY, "instance")
+    def instance(self, tctx: Any, root: Any, service: Any, proplist: Any, inventory: Any) -> Any:
+        service_class = handlers.handler("instance", service.inventory_logic.name)
+        return service_class(service=service, inventory_data=inventory)
+
+    @inventory_cache.subscribe(REFS_POLICY, "interface")
+    def interface(self, tctx: Any, root: Any, service: Any, proplist: Any, inventory: Any) -> Any:
+        service_class = handlers.handler("interface", service.inventory_logic.name)
+        return service_class(service=service, inventory_data=inventory)
+
+    def held(self, root: Any, ref: ServiceRef) -> Optional[Claims]:
+        '''Claims a service holds in the transaction, {} once it is gone'''
+
+        service = _service(root, ref)
+        if service is None:
+            return {}
+        try:
+            return service_claims(root, ref, service)
+        except INPUT_ERRORS:
+            return None
+
+    def _all_claims(self, root: Any) -> Iterator[tuple[ServiceRef, Claims]]:
+        for isis in root.rfs.isis:
+            for kind in ("instance", "interface"):
+                for service in getattr(isis, kind):
+                    key = service.instance_id if kind == "instance" else service.name
+                    ref = ServiceRef(kind, str(isis.device), str(key))
+                    yield ref, self.held(root, ref) or {}
+
+    def conflicts(self, root: Any, checked: dict[ServiceRef, Claims]) -> list[tuple[ServiceRef, str]]:
+        '''(service, problem) for the values already used by another router
+
+        Only the checked services and the holders of their values are read,
+        the whole fleet only once after a restart (index rebuild).
+        '''
+
+        if not sid_pool.sid_pools.complete:
+            sid_pool.sid_pools.rebuild(sid_pool.pool_entries(root))
+        if not uniqueness_index.complete:
+            uniqueness_index.rebuild(self._all_claims(root))
+        for ref, found in checked.items():
+            uniqueness_index.record(ref, found)
+
+        def current(other: ServiceRef) -> Optional[Claims]:
+            if other in checked:
+                return checked[other]
+            return self.held(root, other)
+
+        problems = []
+        for ref, found in checked.items():
+            for (leaf, value), other, owner in uniqueness_index.conflicts(ref, found, current):
+                problems.append((ref, f"{leaf} {value} already used by {owner} ({other.keypath})"))
+        return problems
+
+    def report(self, tctx: Any, root: Any, services: list[tuple[ServiceRef, Any]]) -> list[tuple[ServiceRef, str]]:
+        '''(service, problem) for every offending service'''
+
+        found = []
+        checked: dict[ServiceRef, Claims] = {}
+        for ref, service in services:
+            try:
+                handler = getattr(self, ref.kind)(tctx, root, service, [])
+                errors = handler.validate()
+                checked[ref] = service_claims(root, ref, service)
+            except INPUT_ERRORS as err:
+                errors = [str(err) or type(err).__name__]
+            found += [(ref, error) for error in errors]
+        return found + self.conflicts(root, checked)
+
+    def problems(self, tctx: Any, root: Any, services: list[tuple[ServiceRef, Any]]) -> list[str]:
+        '''"keypath: problem" lines for every offending service'''
+
+        return [f"{ref.keypath}: {problem}" for ref, problem in self.report(tctx, root, services)]
+
+
+def changed_services(
+    trans: ncs.maapi.Transaction,
+    disaggregated: Optional[set[str]] = None,
+) -> set[ServiceRef]:
+    '''Services created or modified (or touched) in the transaction,
+    directly or through their inventory
+
+    The devices whose aggregate container is removed are added to
+    `disaggregated`.
+    '''
+
+    services: set[ServiceRef] = set()
+    inventories: set[tuple[str, str]] = set()
+
+    def iterate(kp: Any, op: int, oldv: Any, newv: Any) -> int:
+        path = str(kp)
+        aggregate = _AGGREGATE_RE.match(path)
+        if aggregate is not None:
+            if op == ncs.MOP_DELETED and disaggregated is not None:
+                disaggregated.add(aggregate.group(1))
+            return ncs.ITER_CONTINUE
+        match = _SERVICE_RE.match(path) or _INVENTORY_RE.match(path)
+        if match is None:
+            return ncs.ITER_RECURSE
+        if op == ncs.MOP_DELETED and match.end() == len(path):
+            return ncs.ITER_CONTINUE
+        if match.re is _SERVICE_RE:
+            device, kind, key = match.groups()
+            services.add(ServiceRef(kind, device, key))
+        else:
+            inventories.add(match.groups())
+        return ncs.ITER_CONTINUE
+
+    trans.diff_iterate(iterate, 0)
+
+    if inventories:
+        root = ncs.maagic.get_root(trans)
+        services |= inventory_dependents(root, inventories)
+    return services
+
+
+def _service(root: Any, ref: ServiceRef) -> Optional[Any]:
+    isis = root.rfs.isis
+    if ref.device not in isis or ref.key not in getattr(isis[ref.device], ref.kind):
+        return None
+    return getattr(isis[ref.device], ref.kind)[ref.key]
+
+
+def inventory_dependents(root: Any, inventories: set[tuple[str, str]]) -> set[ServiceRef]:
+    '''Instances/interfaces using the given (kind, name) inventory entries
+
+    Looked up in the dependency index, the whole /rfs/isis tree is only
+    read to rebuild it after a restart. The index records the entries of
+    an aggregated device under its aggregate service: they are read from
+    that device only.
+    '''
+
+    if not dependency_index.complete:
+        dependency_index.rebuild(root)
+    services = set()
+    for ref in dependency_index.dependents(("inventory", kind, name) for kind, name in inventories):
+        if ref.kind != "device":
+            if _service(root, ref) is not None:
+                services.add(ref)
+            continue
+        if ref.device not in root.rfs.isis:
+            continue
+        for kind, name in inventories:
+            for service in getattr(root.rfs.isis[ref.device], kind):
+                if service.inventory_template == name:
+                    key = service.instance_id if kind == "instance" else service.name
+                    services.add(ServiceRef(kind, ref.device, str(key)))
+    return services
+
+
+def aggregate_problems(root: Any, disaggregated: set[str], changed: set[ServiceRef]) -> list[str]:
+    '''Devices leaving aggregate mode while entries are not re-deployed with it
+
+    The entries render nothing while aggregated: unless they run again in
+    the same commit, FASTMAP removes the config of the aggregate service
+    and the device loses its ISIS config.
+    '''
+
+    problems = []
+    for device in sorted(disaggregated):
+        if device not in root.rfs.isis:
+            continue
+        isis = root.rfs.isis[device]
+        entries = [
+            ServiceRef(kind, device, str(entry.instance_id if kind == "instance" else entry.name))
+            for kind in ("instance", "interface") for entry in getattr(isis, kind)
+        ]
+        stale = [ref for ref in entries if ref not in changed]
+        if stale:
+            problems.append(
+                f"{ServiceRef('device', device, 'aggregate').keypath}: removed while {len(stale)} entries"
+                f" would not be re-deployed with it, use: request rfs isis {device} aggregate disable"
+            )
+    return problems
+
+
+class IsisInputValidation(ValidationCallback):
+    """Rejects the transaction listing every isis service with bad inputs"""
+
+    @ValidationCallback.validate  # type: ignore
+    def cb_validate(self, tctx: Any, kp: Any, newval: Any) -> None:
+        maapi = ncs.maapi.Maapi()
+        try:
+            trans = maapi.attach(tctx)
+            try:
+                root = ncs.maagic.get_root(trans)
+                disaggregated: set[str] = set()
+                changed = changed_services(trans, disaggregated)
+                services = [(ref, _service(root, ref)) for ref in sorted(changed)]
+                problems = aggregate_problems(root, disaggregated, changed)
+                problems += InputCheck().problems(tctx, root, services)
+            finally:
+                maapi.detach(tctx)
+        finally:
+            maapi.close()
+            # called once per commit, after its creates: the SIDs, snapshots
+            # and indexes they shared go, a reused handle starts empty
+            txcache.end(tctx.th)
+
+        if problems:
+            logging.info(f"isis validation: {len(problems)} problem(s) in {len(services)} service(s)")
+            raise ServiceInputRejected("\n".join(problems))